@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for netcdf_segy.
+
+The benchmarks use pytest-benchmark and synthetic SEG-Y files (see
+benchmarks.synthetic). Run them from the repository root with::
+
+    pytest benchmarks
+
+The size of the synthetic files can be changed with the --bench-ninlines,
+--bench-ncrosslines, and --bench-ns options. Throughput (MB/s of SEG-Y
+trace data) and peak memory are stored in each benchmark's extra_info, and
+so are included in the output of --benchmark-json.
+"""
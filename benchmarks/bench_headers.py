@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Benchmark reading all trace headers in one pass against one pass per field.
+
+Usage: python benchmarks/bench_headers.py [NTRACES] [NS]
+"""
+import os
+import sys
+import tempfile
+import timeit
+import numpy as np
+import segyio
+from netcdf_segy import segy2netcdf
+
+
+def make_segy(path, ntraces, ns):
+    """Write a SEG-Y file with random trace data and varying headers."""
+    spec = segyio.spec()
+    spec.format = 5
+    spec.samples = range(ns)
+    spec.tracecount = ntraces
+    data = np.random.rand(ns).astype(np.float32)
+    with segyio.create(path, spec) as segy:
+        for i in range(ntraces):
+            segy.header[i] = {segyio.TraceField.TRACE_SEQUENCE_FILE: i + 1,
+                              segyio.TraceField.CDP: i // 10,
+                              segyio.TraceField.offset: 25 * (i % 10)}
+            segy.trace[i] = data
+
+
+def main(ntraces=20000, ns=250):
+    fd, path = tempfile.mkstemp(suffix=".segy")
+    os.close(fd)
+    try:
+        make_segy(path, ntraces, ns)
+        names = list(segyio.tracefield.keys)
+        with segyio.open(path, ignore_geometry=True) as segy:
+            records = segy2netcdf._trace_records(path, segy)
+            assert records is not None
+
+            def per_field():
+                segy2netcdf._read_trace_headers(segy, None, 0, ntraces, names)
+
+            def single_pass():
+                segy2netcdf._read_trace_headers(segy, records, 0, ntraces,
+                                                names)
+
+            t_per_field = min(timeit.repeat(per_field, number=1, repeat=3))
+            t_single_pass = min(timeit.repeat(single_pass, number=1,
+                                              repeat=3))
+    finally:
+        os.remove(path)
+    print("{} traces, {} samples, {} header fields".format(ntraces, ns,
+                                                           len(names)))
+    print("per field:   {:.4f} s".format(t_per_field))
+    print("single pass: {:.4f} s".format(t_single_pass))
+    print("speedup:     {:.1f}x".format(t_per_field / t_single_pass))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
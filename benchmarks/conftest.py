@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import pytest
+from benchmarks import synthetic
+
+
+def pytest_addoption(parser):
+    parser.addoption("--bench-ninlines", type=int, default=100,
+                     help="number of inlines in synthetic SEG-Y files")
+    parser.addoption("--bench-ncrosslines", type=int, default=200,
+                     help="number of crosslines in synthetic SEG-Y files")
+    parser.addoption("--bench-ns", type=int, default=500,
+                     help="number of samples per trace in synthetic SEG-Y "
+                     "files")
+    parser.addoption("--startup-budget-ms", type=float, default=500,
+                     help="maximum time, in milliseconds, to import the "
+                     "segy2netcdf command (including its dependencies)")
+
+
+@pytest.fixture(scope="session")
+def make_synthetic(request, tmp_path_factory):
+    """Make (and cache) synthetic SEG-Y files.
+
+    Returns:
+        A function that takes the format and sort order of the file and
+        returns its path and the number of bytes of trace data in it
+    """
+    cache = {}
+    config = request.config
+
+    def make(fmt=5, sort="inline"):
+        if (fmt, sort) not in cache:
+            path = str(tmp_path_factory.mktemp("segy")
+                       .joinpath("synthetic_{}_{}.segy".format(fmt, sort)))
+            nbytes = synthetic.make_segy(
+                path, config.getoption("--bench-ninlines"),
+                config.getoption("--bench-ncrosslines"),
+                config.getoption("--bench-ns"), fmt, sort
+            )
+            cache[(fmt, sort)] = (path, nbytes)
+        return cache[(fmt, sort)]
+
+    return make
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Synthetic: make SEG-Y files for benchmarks.
+"""
+import numpy as np
+import segyio
+from netcdf_segy import segy2netcdf as s2n
+from netcdf_segy.ibm import ieee2ibm
+
+# Orders in which the traces of a synthetic file can be written
+SORT_ORDERS = ("inline", "crossline", "random")
+
+
+def make_segy(path, ninlines=100, ncrosslines=100, ns=500, fmt=5,
+              sort="inline", seed=0, block_ntraces=10000):
+    """Write a synthetic 3D SEG-Y file.
+
+       The traces form a grid of ninlines x ncrosslines, with the
+       INLINE_3D, CROSSLINE_3D, CDP, CDP_X, CDP_Y, TRACE_SEQUENCE_FILE,
+       TRACE_SAMPLE_COUNT, and TRACE_SAMPLE_INTERVAL headers set. The trace
+       data is random.
+
+    Args:
+        path: A string specifying the path to the output SEG-Y file
+        ninlines: An int specifying the number of inlines
+        ncrosslines: An int specifying the number of crosslines
+        ns: An int specifying the number of samples per trace
+        fmt: An int specifying the SEG-Y data sample format, one of the keys
+            of SAMPLE_FORMAT_DTYPES (e.g. 1 for IBM floats, 5 for IEEE
+            floats, 3 for two byte integers)
+        sort: A string, one of SORT_ORDERS, specifying whether the traces
+            are in inline-major, crossline-major, or random order
+        seed: An int used to seed the random number generator
+        block_ntraces: An int specifying the number of traces to make and
+            write at once
+
+    Returns:
+        The number of bytes of trace data (excluding trace headers) in the
+        file
+    """
+    if sort not in SORT_ORDERS:
+        raise ValueError("sort must be one of {}".format(
+            ", ".join(SORT_ORDERS)))
+    rng = np.random.RandomState(seed)
+    ntraces = ninlines * ncrosslines
+    inlines, crosslines = np.meshgrid(np.arange(ninlines),
+                                      np.arange(ncrosslines), indexing="ij")
+    if sort == "crossline":
+        inlines = inlines.T
+        crosslines = crosslines.T
+    inlines = inlines.reshape(-1)
+    crosslines = crosslines.reshape(-1)
+    if sort == "random":
+        order = rng.permutation(ntraces)
+        inlines = inlines[order]
+        crosslines = crosslines[order]
+
+    spec = segyio.spec()
+    spec.format = fmt
+    spec.samples = range(ns)
+    spec.tracecount = ntraces
+    with segyio.create(path, spec) as segy:
+        segy.bin.update({segyio.BinField.Interval: 4000})
+
+    sample_dtype = np.dtype(s2n.SAMPLE_FORMAT_DTYPES[fmt])
+    record_dtype = np.dtype([("header", s2n._header_dtype()),
+                             ("samples", sample_dtype, (ns,))])
+    with open(path, "ab") as segy_file:
+        for start in range(0, ntraces, block_ntraces):
+            stop = min(start + block_ntraces, ntraces)
+            records = np.zeros(stop - start, record_dtype)
+            headers = records["header"]
+            il = inlines[start:stop]
+            xl = crosslines[start:stop]
+            headers["INLINE_3D"] = 1000 + il
+            headers["CROSSLINE_3D"] = 2000 + xl
+            headers["CDP"] = il * ncrosslines + xl
+            headers["CDP_X"] = 500000 + 25 * xl
+            headers["CDP_Y"] = 6000000 + 25 * il
+            headers["TRACE_SEQUENCE_FILE"] = np.arange(start, stop) + 1
+            headers["TRACE_SAMPLE_COUNT"] = ns
+            headers["TRACE_SAMPLE_INTERVAL"] = 4000
+            data = rng.randn(stop - start, ns).astype(np.float32)
+            if fmt == 1:
+                records["samples"] = ieee2ibm(data)
+            elif sample_dtype.kind == "f":
+                records["samples"] = data
+            else:
+                info = np.iinfo(sample_dtype)
+                scale = min(info.max, 2 ** 20) / 8.0
+                records["samples"] = np.clip(data * scale, info.min,
+                                             info.max)
+            segy_file.write(records.tobytes())
+    return ntraces * ns * sample_dtype.itemsize
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for segy2netcdf.
+"""
+import os
+import tracemalloc
+import pytest
+import segyio
+from netCDF4 import Dataset
+from netcdf_segy import segy2netcdf
+
+pytest.importorskip("pytest_benchmark")
+
+ROUNDS = 3
+
+
+def peak_memory(func, *args, **kwargs):
+    """Find the peak memory, in bytes, allocated while calling func."""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def record_stats(benchmark, nbytes, peak):
+    """Store throughput and peak memory in the benchmark's extra_info.
+
+       There are no stats when benchmarking is disabled (such as with
+       --benchmark-disable, to run the benchmarks as quick tests).
+    """
+    if benchmark.stats is None:
+        return
+    benchmark.extra_info["MB/s"] = round(
+        nbytes / 1e6 / benchmark.stats.stats.mean, 1)
+    benchmark.extra_info["peak_memory_MB"] = round(peak / 1e6, 1)
+
+
+@pytest.fixture
+def netcdf_path(tmpdir):
+    return str(tmpdir.join("out.nc"))
+
+
+@pytest.fixture
+def segy_ieee(make_synthetic):
+    path, nbytes = make_synthetic(5)
+    segy = segyio.open(path, ignore_geometry=True)
+    yield segy, path, nbytes
+    segy.close()
+
+
+@pytest.mark.parametrize("fmt", [1, 5, 3])
+@pytest.mark.parametrize("compress", [False, True])
+def test_end_to_end(benchmark, make_synthetic, netcdf_path, fmt, compress):
+    path, nbytes = make_synthetic(fmt)
+    d = (("INLINE_3D", benchmark_ninlines(path)),)
+    kwargs = dict(d=d, compress=compress)
+    peak = peak_memory(segy2netcdf.segy2netcdf, path, netcdf_path, **kwargs)
+    benchmark.pedantic(segy2netcdf.segy2netcdf, (path, netcdf_path), kwargs,
+                       rounds=ROUNDS)
+    record_stats(benchmark, nbytes, peak)
+
+
+@pytest.mark.parametrize("fmt", [1, 5])
+@pytest.mark.parametrize("engine", ["segyio", "mmap"])
+def test_engine(benchmark, make_synthetic, netcdf_path, fmt, engine):
+    path, nbytes = make_synthetic(fmt)
+    kwargs = dict(engine=engine)
+    peak = peak_memory(segy2netcdf.segy2netcdf, path, netcdf_path, **kwargs)
+    benchmark.pedantic(segy2netcdf.segy2netcdf, (path, netcdf_path), kwargs,
+                       rounds=ROUNDS)
+    record_stats(benchmark, nbytes, peak)
+
+
+@pytest.mark.parametrize("sort", ["inline", "crossline", "random"])
+def test_infer_dims(benchmark, make_synthetic, netcdf_path, sort):
+    path, nbytes = make_synthetic(5, sort)
+    kwargs = dict(infer_dims=["INLINE_3D", "CROSSLINE_3D"])
+    peak = peak_memory(segy2netcdf.segy2netcdf, path, netcdf_path, **kwargs)
+    benchmark.pedantic(segy2netcdf.segy2netcdf, (path, netcdf_path), kwargs,
+                       rounds=ROUNDS)
+    record_stats(benchmark, nbytes, peak)
+
+
+@pytest.mark.parametrize("contiguous", [False, True])
+def test_layout(benchmark, make_synthetic, netcdf_path, contiguous):
+    path, nbytes = make_synthetic(5)
+    d = (("INLINE_3D", benchmark_ninlines(path)),)
+    kwargs = dict(d=d, engine="mmap", contiguous=contiguous)
+    peak = peak_memory(segy2netcdf.segy2netcdf, path, netcdf_path, **kwargs)
+    benchmark.pedantic(segy2netcdf.segy2netcdf, (path, netcdf_path), kwargs,
+                       rounds=ROUNDS)
+    record_stats(benchmark, nbytes, peak)
+
+
+@pytest.mark.parametrize("queue_depth", [0, 2])
+@pytest.mark.parametrize("compress", [False, True])
+def test_pipeline(benchmark, make_synthetic, netcdf_path, queue_depth,
+                  compress):
+    path, nbytes = make_synthetic(1)
+    d = (("INLINE_3D", benchmark_ninlines(path)),)
+    kwargs = dict(d=d, compress=compress, engine="mmap",
+                  queue_depth=queue_depth)
+    peak = peak_memory(segy2netcdf.segy2netcdf, path, netcdf_path, **kwargs)
+    benchmark.pedantic(segy2netcdf.segy2netcdf, (path, netcdf_path), kwargs,
+                       rounds=ROUNDS)
+    record_stats(benchmark, nbytes, peak)
+
+
+def benchmark_ninlines(path):
+    """Get the number of inlines of a synthetic file."""
+    with segyio.open(path, ignore_geometry=True) as segy:
+        return len(set(segy.attributes(segyio.TraceField.INLINE_3D)[:]))
+
+
+def make_dataset(netcdf_path, segy, compress=False):
+    """Create a NetCDF file with the dimensions and variables for segy."""
+    dim_names, dim_lens = segy2netcdf._make_dim_name_len(
+        "Time", len(segy.samples), ())
+    segy2netcdf._fill_missing_dims(1, segy.tracecount, dim_names, dim_lens)
+    if os.path.exists(netcdf_path):
+        os.remove(netcdf_path)
+    rootgrp = Dataset(netcdf_path, "w", format="NETCDF4")
+    segy2netcdf._create_dimensions(dim_names, dim_lens, rootgrp)
+    return rootgrp, dim_names, dim_lens
+
+
+class Test_stages:
+    def test_create_variables(self, benchmark, segy_ieee, netcdf_path):
+        segy, _, _ = segy_ieee
+        datasets = []
+
+        def setup():
+            rootgrp, dim_names, _ = make_dataset(netcdf_path, segy)
+            datasets.append(rootgrp)
+            return (rootgrp, dim_names, False), {}
+
+        benchmark.pedantic(segy2netcdf._create_variables, setup=setup,
+                           rounds=ROUNDS)
+        for rootgrp in datasets:
+            rootgrp.close()
+
+    def test_set_attributes(self, benchmark, segy_ieee, netcdf_path):
+        segy, _, _ = segy_ieee
+        rootgrp, _, _ = make_dataset(netcdf_path, segy)
+        benchmark(segy2netcdf._set_attributes, segy, rootgrp)
+        rootgrp.close()
+
+    @pytest.mark.parametrize("compress", [False, True])
+    @pytest.mark.parametrize("stage", ["headers", "traces"])
+    def test_copy(self, benchmark, segy_ieee, netcdf_path, compress, stage):
+        segy, path, nbytes = segy_ieee
+        records = segy2netcdf._trace_records(path, segy)
+        if stage == "headers":
+            nbytes = segy.tracecount * segy2netcdf.TRACE_HEADER_NBYTES
+        datasets = []
+
+        def setup():
+            rootgrp, dim_names, dim_lens = make_dataset(netcdf_path, segy)
+            datasets.append(rootgrp)
+            variables = segy2netcdf._create_variables(rootgrp, dim_names,
+                                                      compress)
+            if stage == "headers":
+                # Without Samples, only the trace headers are read
+                variables = [v for v in variables if v.name != "Samples"]
+            else:
+                variables = [v for v in variables if v.name == "Samples"]
+            return (segy, variables, dim_names, dim_lens, False), \
+                {"records": records}
+
+        args, kwargs = setup()
+        peak = peak_memory(segy2netcdf._copy_data, *args, **kwargs)
+        benchmark.pedantic(segy2netcdf._copy_data, setup=setup,
+                           rounds=ROUNDS)
+        for rootgrp in datasets:
+            rootgrp.close()
+        record_stats(benchmark, nbytes, peak)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks and budgets for the start up of the segy2netcdf command.
+
+Each test starts a new Python process, as every run of the command does.
+The import time budget can be changed with --startup-budget-ms.
+"""
+import subprocess
+import sys
+import pytest
+
+# Modules that must not be imported just to import the package
+HEAVY_MODULES = ("numpy", "segyio", "netCDF4", "click")
+
+# Modules of netcdf_segy and optional dependencies that the segy2netcdf
+# command only imports when it needs them
+DEFERRED_MODULES = ("netcdf_segy.batch", "netcdf_segy.daemon",
+                    "netcdf_segy.lazy",
+                    "netcdf_segy.netcdf2segy", "netcdf_segy.variable_length",
+                    "netcdf_segy.verify", "zarr", "xarray", "dask")
+
+
+def import_times(module):
+    """Import a module in a new process with python -X importtime.
+
+    Returns:
+        A dictionary from the name of every module imported to its
+        cumulative import time in microseconds
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.fixture
+def startup_budget_ms(request):
+    return request.config.getoption("--startup-budget-ms")
+
+
+def test_import_package():
+    times = import_times("netcdf_segy")
+    assert not [name for name in HEAVY_MODULES if name in times]
+
+
+def test_import_segy2netcdf(startup_budget_ms):
+    times = import_times("netcdf_segy.segy2netcdf")
+    assert not [name for name in DEFERRED_MODULES if name in times]
+    assert times["netcdf_segy.segy2netcdf"] / 1000 < startup_budget_ms
+
+
+@pytest.mark.parametrize("command", ["segy2netcdf", "netcdf2segy",
+                                     "batch"])
+def test_help(request, command):
+    pytest.importorskip("pytest_benchmark")
+    benchmark = request.getfixturevalue("benchmark")
+    args = [sys.executable, "-c",
+            "from netcdf_segy.{} import cli; cli()".format(command), "--help"]
+    benchmark.pedantic(subprocess.run, (args,),
+                       {"stdout": subprocess.DEVNULL, "check": True},
+                       rounds=5)
@@ -1,9 +1,43 @@
 # -*- coding: utf-8 -*-
-"""Convert SEG-Y files to NetCDF.
+"""Convert between SEG-Y and NetCDF files.
+
+The submodules, and the functions re-exported from them, are only imported
+when they are first used, so that running one command (such as
+segy2netcdf) does not also import the modules of the others.
 """
+import importlib
 
 __author__ = """Alan Richardson"""
 __email__ = "arichar@tcd.ie"
 __version__ = "1.0.1"
 
-import netcdf_segy.segy2netcdf
+# Submodules imported when they are first accessed as attributes
+_SUBMODULES = ("segy2netcdf", "netcdf2segy", "batch", "lazy", "index",
+               "variable_length", "verify", "daemon")
+
+# Functions re-exported from submodules, with the submodule of each
+_EXPORTS = {
+    "open_segy": "lazy",
+    "find_traces": "index",
+    "read_gather": "index",
+    "verify_netcdf": "verify",
+}
+
+__all__ = list(_SUBMODULES) + sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    """Import a submodule, or a function from one, when first accessed."""
+    if name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    if name in _EXPORTS:
+        module = importlib.import_module("." + _EXPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__,
+                                                                    name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
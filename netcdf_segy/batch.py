@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""Batch: convert many SEG-Y files to NetCDF files with a pool of processes.
+"""
+import glob
+import hashlib
+import multiprocessing
+import os
+import shutil
+import time
+import click
+from netcdf_segy import segy2netcdf as s2n
+
+# Ways of deciding whether an existing output is up to date
+CHECKS = ("mtime", "checksum")
+
+# Name of the NetCDF attribute that stores the checksum of the SEG-Y file
+CHECKSUM_ATTRIBUTE = "segy_sha256"
+
+# Number of bytes of the SEG-Y file hashed at once
+CHECKSUM_BLOCK_NBYTES = 1024 ** 2
+
+
+@click.command()
+@click.argument("inputs", nargs=-1)
+@click.option(
+    "--manifest",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="File listing the SEG-Y files to convert, one per line, each "
+    "optionally followed by whitespace and the path of its NetCDF file.",
+)
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Directory to write the NetCDF files to (default: the directory "
+    "of each SEG-Y file). Each is named after its SEG-Y file, with the "
+    "extension .nc.",
+)
+@click.option(
+    "--processes",
+    type=int,
+    default=None,
+    help="Number of files to convert at once (default: number of CPUs).",
+)
+@click.option(
+    "--check",
+    type=click.Choice(CHECKS),
+    default="mtime",
+    help="How to decide whether an existing NetCDF file is up to date: it "
+    "is newer than the SEG-Y file (mtime), or it records the same SHA-256 "
+    "checksum as the SEG-Y file has (checksum). Up to date files are "
+    "skipped (default mtime).",
+)
+@click.option(
+    "--force/--no-force",
+    default=False,
+    help="convert every file, even if it is up to date (default off).",
+)
+@click.option(
+    "--samples_dim_name",
+    "-sdn",
+    type=str,
+    help="Name of trace samples dimension (usually Time or Depth)",
+)
+@click.option(
+    "-d",
+    type=(str, int),
+    multiple=True,
+    help="Name and length of other dimensions, as for segy2netcdf.",
+)
+@click.option(
+    "--infer-dims",
+    default=None,
+    help="Comma-separated list of trace header names to use as the "
+    "dimensions, as for segy2netcdf.",
+)
+@click.option(
+    "--compress/--no-compress",
+    default=False,
+    help="turn on or off NetCDF compression (default off).",
+)
+@click.option(
+    "--compress-profile",
+    type=click.Choice(sorted(s2n.COMPRESS_PROFILES)),
+    default=None,
+    help="Compression profile, as for segy2netcdf.",
+)
+@click.option(
+    "--max-memory",
+    type=int,
+    default=None,
+    help="Approximate maximum number of bytes of trace data that each "
+    "process holds in memory at once "
+    "(default {}).".format(s2n.DEFAULT_MAX_MEMORY),
+)
+@click.option(
+    "--engine",
+    type=click.Choice(s2n.ENGINES),
+    default="segyio",
+    help="How to read the trace data, as for segy2netcdf (default segyio).",
+)
+@click.option(
+    "--sample-dtype",
+    type=click.Choice(s2n.SAMPLE_DTYPES),
+    default=None,
+    help="Type to store the trace data as, as for segy2netcdf (default "
+    "native).",
+)
+@click.option(
+    "--verbose/--quiet",
+    default=False,
+    help="turn on or off printing each file as it finishes (default off).",
+)
+@click.pass_context
+def cli(ctx, inputs, manifest, output_dir, processes, check, force,
+        samples_dim_name, d, infer_dims, compress, compress_profile,
+        max_memory, engine, sample_dtype, verbose):
+    """Click CLI for segy2netcdf_batch.
+
+       INPUTS are SEG-Y files or glob patterns (such as 'shots/*.sgy').
+    """
+    try:
+        jobs = _find_jobs(inputs, manifest, output_dir)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    if not jobs:
+        raise click.UsageError("no SEG-Y files to convert")
+    if infer_dims is not None:
+        infer_dims = infer_dims.split(",")
+    options = dict(samples_dim_name=samples_dim_name, d=d,
+                   infer_dims=infer_dims, compress=compress,
+                   compress_profile=compress_profile, max_memory=max_memory,
+                   engine=engine, sample_dtype=sample_dtype)
+    summary = segy2netcdf_batch(jobs, processes, check, force, verbose,
+                                **options)
+    for line in _format_summary(summary):
+        click.echo(line)
+    if summary["failed"]:
+        ctx.exit(1)
+
+
+def segy2netcdf_batch(jobs, processes=None, check="mtime", force=False,
+                      verbose=False, **options):
+    """Convert many SEG-Y files to NetCDF files.
+
+       The files are converted concurrently by a pool of processes, each of
+       which is started once and then converts many files. Each output is
+       written to a temporary file that is renamed when it is complete, so
+       an interrupted conversion does not leave an output that appears to
+       be up to date. A failed conversion does not stop the others.
+
+    Args:
+        jobs: A list of (segy_path, netcdf_path) tuples
+        processes: An optional int specifying the number of files to
+            convert at once. Default: the number of CPUs.
+        check: An optional string, one of CHECKS, specifying how to decide
+            whether an existing output is up to date. 'mtime' considers it
+            up to date if it was modified after the SEG-Y file, while
+            'checksum' stores the SHA-256 checksum of the SEG-Y file in the
+            CHECKSUM_ATTRIBUTE attribute of the output, and considers it up
+            to date if the attribute matches. Default 'mtime'.
+        force: An optional boolean flag indicating whether to convert files
+            even if they are up to date. Default False.
+        verbose: An optional boolean flag indicating whether to print each
+            file as it finishes. Default False.
+        **options: Keyword arguments passed to segy2netcdf for every file
+
+    Returns:
+        A dictionary with the lists of 'converted', 'skipped', and 'failed'
+        results (see _convert_job), the total 'seconds', and the total
+        'bytes' of the SEG-Y files converted
+
+    Raises:
+        ValueError: If two jobs have the same output (see _check_outputs)
+    """
+    if check not in CHECKS:
+        raise ValueError("check must be one of {}, not "
+                         "{}".format(", ".join(CHECKS), check))
+    _check_outputs(jobs)
+    start = time.perf_counter()
+    summary = {"converted": [], "skipped": [], "failed": []}
+    tasks = [(segy_path, netcdf_path, check, force, options)
+             for segy_path, netcdf_path in jobs]
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(_convert_job, tasks):
+            summary[result["status"]].append(result)
+            if verbose:
+                message = "{}: {}".format(result["status"],
+                                          result["segy_path"])
+                if result["error"]:
+                    message += " ({})".format(result["error"])
+                click.echo(message)
+    finally:
+        pool.terminate()
+        pool.join()
+    summary["seconds"] = time.perf_counter() - start
+    summary["bytes"] = sum(result["bytes"]
+                           for result in summary["converted"])
+    return summary
+
+
+def _find_jobs(inputs=(), manifest=None, output_dir=None):
+    """Make the list of (segy_path, netcdf_path) to convert.
+
+       inputs are paths or glob patterns, and each line of the manifest
+       file is a path, optionally followed by the path of the output. The
+       output of an input without one is named after the input, with the
+       extension .nc, in output_dir (or the directory of the input). Each
+       input is only included once.
+
+    Raises:
+        ValueError: If two inputs would be converted to the same output
+            (see _check_outputs)
+    """
+    pairs = []
+    for pattern in inputs:
+        matches = sorted(glob.glob(pattern))
+        if not matches and not glob.has_magic(pattern):
+            matches = [pattern]
+        pairs.extend((path, None) for path in matches)
+    if manifest is not None:
+        with open(manifest) as f:
+            for line in f:
+                fields = line.split(None, 1)
+                if not fields or fields[0].startswith("#"):
+                    continue
+                netcdf_path = fields[1].strip() if len(fields) > 1 else None
+                pairs.append((fields[0], netcdf_path))
+    jobs = []
+    seen = set()
+    for segy_path, netcdf_path in pairs:
+        if os.path.abspath(segy_path) in seen:
+            continue
+        seen.add(os.path.abspath(segy_path))
+        if netcdf_path is None:
+            name = os.path.splitext(os.path.basename(segy_path))[0] + ".nc"
+            directory = output_dir
+            if directory is None:
+                directory = os.path.dirname(segy_path)
+            netcdf_path = os.path.join(directory, name)
+        jobs.append((segy_path, netcdf_path))
+    _check_outputs(jobs)
+    return jobs
+
+
+def _check_outputs(jobs):
+    """Check that no two jobs write the same output.
+
+       Such jobs (such as for a.sgy and a.segy, or for files with the same
+       name in different directories converted into one output_dir) would
+       be converted at the same time, to the same temporary file, and one
+       output would replace the other.
+
+    Raises:
+        ValueError: If two jobs have the same output
+    """
+    outputs = {}
+    for segy_path, netcdf_path in jobs:
+        key = os.path.normcase(os.path.abspath(netcdf_path))
+        if key in outputs:
+            raise ValueError("{} and {} would both be converted to "
+                             "{}".format(outputs[key], segy_path,
+                                         netcdf_path))
+        outputs[key] = segy_path
+
+
+def _convert_job(task):
+    """Convert one file in a process of the pool, unless it is up to date.
+
+    Returns:
+        A dictionary with the 'segy_path', 'netcdf_path', 'status' (one
+        of 'converted', 'skipped', and 'failed'), conversion time in
+        'seconds', size of the SEG-Y file in 'bytes', and 'error' message
+        (or None)
+    """
+    segy_path, netcdf_path, check, force, options = task
+    output_format = options.get("output_format", "netcdf")
+    result = {"segy_path": segy_path, "netcdf_path": netcdf_path,
+              "status": "converted", "seconds": 0.0, "bytes": 0,
+              "error": None}
+    start = time.perf_counter()
+    partial_path = netcdf_path + ".part"
+    try:
+        result["bytes"] = os.path.getsize(segy_path)
+        checksum = None
+        if check == "checksum":
+            checksum = _checksum(segy_path)
+        if not force and _up_to_date(segy_path, netcdf_path, checksum,
+                                     output_format):
+            result["status"] = "skipped"
+            return result
+        directory = os.path.dirname(netcdf_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        s2n.segy2netcdf(segy_path, partial_path, **options)
+        if checksum is not None:
+            rootgrp = s2n._open_output(partial_path, "a", output_format)
+            rootgrp.setncattr(CHECKSUM_ATTRIBUTE, checksum)
+            rootgrp.close()
+        if os.path.isdir(netcdf_path) or os.path.isdir(partial_path):
+            # os.replace cannot replace a directory (a Zarr store), or
+            # replace a file with one
+            _remove_output(netcdf_path)
+        os.replace(partial_path, netcdf_path)
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+        _remove_output(partial_path)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _up_to_date(segy_path, netcdf_path, checksum=None,
+                output_format="netcdf"):
+    """Check whether the NetCDF file (or Zarr store) exists and is up to date.
+
+       If checksum is provided, the file is up to date if it stores the
+       same checksum, otherwise if it was modified after the SEG-Y file.
+    """
+    if not os.path.exists(netcdf_path):
+        return False
+    if checksum is None:
+        return os.path.getmtime(netcdf_path) >= os.path.getmtime(segy_path)
+    try:
+        rootgrp = s2n._open_output(netcdf_path, "r", output_format)
+    except OSError:
+        return False
+    try:
+        return (CHECKSUM_ATTRIBUTE in rootgrp.ncattrs()
+                and rootgrp.getncattr(CHECKSUM_ATTRIBUTE) == checksum)
+    finally:
+        rootgrp.close()
+
+
+def _remove_output(path):
+    """Remove an output file or Zarr store (a directory), if it exists."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _checksum(path):
+    """Return the hexadecimal SHA-256 checksum of a file."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHECKSUM_BLOCK_NBYTES), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _format_summary(summary):
+    """Return a list of lines describing the results of a batch."""
+    lines = ["converted {}, skipped {}, failed {} files in {:.1f} s".format(
+        len(summary["converted"]), len(summary["skipped"]),
+        len(summary["failed"]), summary["seconds"])]
+    if summary["bytes"] and summary["seconds"] > 0:
+        lines.append("converted {:.1f} MB at {:.1f} MB/s".format(
+            summary["bytes"] / 1e6,
+            summary["bytes"] / 1e6 / summary["seconds"]))
+    for result in summary["failed"]:
+        lines.append("failed: {} ({})".format(result["segy_path"],
+                                             result["error"]))
+    return lines
@@ -0,0 +1,602 @@
+# -*- coding: utf-8 -*-
+"""Daemon: a long-running local service that converts SEG-Y files.
+
+A ConversionDaemon keeps a pool of worker processes, started once, that
+convert SEG-Y files submitted as jobs, so that converting many files does
+not pay the cost of starting a new process (and importing NumPy, segyio,
+and netCDF4) for each one. The number of processes also caps the number of
+files being read and written at once across the machine.
+
+Queued jobs are started, as processes become free, in an order chosen by
+the size of their SEG-Y files (see SCHEDULES). While a job runs, its worker
+reports the bytes of traces copied after each block, so the progress and
+throughput of each job can be queried.
+
+Jobs are submitted and queried with a small JSON API over HTTP, on a local
+TCP port or a Unix socket:
+
+    POST /jobs        submit a job: a JSON object with segy_path,
+                      netcdf_path, optionally check and force (as for
+                      segy2netcdf_batch), and any of JOB_OPTIONS, which
+                      are passed to segy2netcdf
+    GET /jobs         list every job
+    GET /jobs/<id>    get one job
+
+A job can read and overwrite any file that the daemon's user can, so the
+daemon only listens on the loopback interface by default, and every request
+must carry the token that the daemon writes, when it starts, to a file that
+only its user can read (see write_token), in an "Authorization: Bearer
+<token>" header. Jobs must be submitted as application/json, and requests
+to a TCP port must name the address the daemon listens on as their Host,
+so that web pages open in a local browser cannot submit jobs.
+"""
+import collections
+import functools
+import hmac
+import http.client
+import http.server
+import json
+import multiprocessing
+import os
+import secrets
+import socket
+import socketserver
+import stat
+import threading
+import time
+import click
+from netcdf_segy import batch
+
+# Orders in which queued jobs are started: smallest or largest SEG-Y file
+# first, or in the order they were submitted
+SCHEDULES = ("smallest", "largest", "fifo")
+
+# Options of segy2netcdf that jobs may set
+JOB_OPTIONS = ("samples_dim_name", "d", "compress", "compress_profile",
+               "compression", "complevel", "shuffle", "significant_digits",
+               "least_significant_digit", "chunking", "chunk_nbytes",
+               "headers", "exclude_headers", "compact_headers", "infer_dims",
+               "index_headers", "engine", "sample_dtype", "output_format",
+               "max_memory", "verify")
+
+# Default TCP port of the HTTP API
+DEFAULT_PORT = 8765
+
+# Default path of the file that stores the token that requests must carry
+DEFAULT_TOKEN_FILE = os.path.join(os.path.expanduser("~"),
+                                  ".segy2netcdf-daemon-token")
+
+
+@click.command()
+@click.option(
+    "--host",
+    default="127.0.0.1",
+    help="Address to listen on (default 127.0.0.1).",
+)
+@click.option(
+    "--port",
+    type=int,
+    default=DEFAULT_PORT,
+    help="TCP port to listen on (default {}).".format(DEFAULT_PORT),
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Path of a Unix socket to listen on instead of a TCP port.",
+)
+@click.option(
+    "--processes",
+    type=int,
+    default=None,
+    help="Number of files to convert at once (default: number of CPUs).",
+)
+@click.option(
+    "--token-file",
+    type=click.Path(dir_okay=False),
+    default=DEFAULT_TOKEN_FILE,
+    help="File to write the token that requests must carry to, readable "
+    "only by the user (default {}).".format(DEFAULT_TOKEN_FILE),
+)
+@click.option(
+    "--schedule",
+    type=click.Choice(SCHEDULES),
+    default="smallest",
+    help="Which queued job to start next: the one with the smallest or "
+    "largest SEG-Y file, or the first submitted (fifo) (default smallest).",
+)
+@click.option(
+    "--verbose/--quiet",
+    default=False,
+    help="turn on or off printing each request and job (default off).",
+)
+def cli(host, port, socket_path, processes, token_file, schedule, verbose):
+    """Click CLI for the segy2netcdf daemon."""
+    if socket_path is not None:
+        # Before the token file of a daemon that is running is replaced
+        try:
+            _remove_stale_socket(socket_path)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+    token = write_token(token_file)
+    daemon = ConversionDaemon(processes, schedule, verbose)
+    address = socket_path if socket_path is not None else (host, port)
+    server = make_server(daemon, address, token, verbose)
+    if verbose:
+        click.echo("listening on {} with {} processes".format(
+            socket_path or "http://{}:{}".format(*server.server_address),
+            daemon.processes))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+        if os.path.exists(token_file):
+            os.remove(token_file)
+
+
+class ConversionDaemon(object):
+    """Convert submitted SEG-Y files with a pool of worker processes.
+
+    Args:
+        processes: An optional int specifying the number of files to
+            convert at once. Default: the number of CPUs.
+        schedule: An optional string, one of SCHEDULES, specifying which
+            queued job to start when a process becomes free. 'smallest'
+            (the default) finishes the most jobs soonest, while 'largest'
+            finishes a fixed set of jobs soonest.
+        verbose: An optional boolean flag indicating whether to print each
+            job as it finishes. Default False.
+    """
+
+    def __init__(self, processes=None, schedule="smallest", verbose=False):
+        if schedule not in SCHEDULES:
+            raise ValueError("schedule must be one of {}, not "
+                             "{}".format(", ".join(SCHEDULES), schedule))
+        self.processes = processes or os.cpu_count() or 1
+        self.schedule = schedule
+        self.verbose = verbose
+        self.jobs = collections.OrderedDict()
+        self._queued = []
+        self._nrunning = 0
+        self._next_id = 1
+        self._lock = threading.Condition()
+        self._progress_queue = multiprocessing.Queue()
+        self._pool = multiprocessing.Pool(self.processes, _init_worker,
+                                          (self._progress_queue,))
+        self._progress_thread = threading.Thread(target=self._read_progress)
+        self._progress_thread.daemon = True
+        self._progress_thread.start()
+
+    def submit(self, segy_path, netcdf_path, check="mtime", force=False,
+               **options):
+        """Queue a SEG-Y file to be converted.
+
+        Args:
+            segy_path: A string specifying the path to the SEG-Y file
+            netcdf_path: A string specifying the path to the output
+            check, force: As for segy2netcdf_batch
+            **options: Keyword arguments, from JOB_OPTIONS, passed to
+                segy2netcdf
+
+        Returns:
+            The job's report (see report)
+        """
+        unknown = sorted(set(options) - set(JOB_OPTIONS))
+        if unknown:
+            raise ValueError("unsupported options: {}".format(
+                ", ".join(unknown)))
+        if check not in batch.CHECKS:
+            raise ValueError("check must be one of {}, not "
+                             "{}".format(", ".join(batch.CHECKS), check))
+        if not os.path.isfile(segy_path):
+            raise ValueError("{} is not a file".format(segy_path))
+        if options.get("d") is not None:
+            options["d"] = tuple((str(name), int(length))
+                                 for name, length in options["d"])
+        with self._lock:
+            job = {"id": self._next_id,
+                   "segy_path": os.path.abspath(segy_path),
+                   "netcdf_path": os.path.abspath(netcdf_path),
+                   "check": check, "force": bool(force), "options": options,
+                   "status": "queued", "bytes": os.path.getsize(segy_path),
+                   "bytes_copied": 0, "bytes_total": None, "error": None,
+                   "submitted": time.time(), "started": None,
+                   "finished": None}
+            self._next_id += 1
+            self.jobs[job["id"]] = job
+            self._queued.append(job)
+            self._start_jobs()
+            return _report(job)
+
+    def report(self, job_id=None):
+        """Report the state of one job, or of every job.
+
+        Returns:
+            A JSON-serializable dictionary describing the job (or None if
+            there is no such job), or, if job_id is None, a list of them.
+            Each has the job's 'id', 'segy_path', 'netcdf_path', 'status'
+            ('queued', 'running', 'converted', 'skipped', or 'failed'),
+            size of the SEG-Y file in 'bytes', 'bytes_copied' so far of
+            'bytes_total' bytes of traces, 'progress' (the fraction of
+            them copied, or None if not yet known), 'seconds' spent
+            running, throughput of copying in 'MB_per_s', and 'error'
+            message (or None)
+        """
+        with self._lock:
+            if job_id is None:
+                return [_report(job) for job in self.jobs.values()]
+            job = self.jobs.get(job_id)
+            return None if job is None else _report(job)
+
+    def wait(self, timeout=None):
+        """Wait until no job is queued or running.
+
+        Returns:
+            True, or False if the timeout (in seconds) expired first
+        """
+        with self._lock:
+            return self._lock.wait_for(
+                lambda: not self._queued and not self._nrunning, timeout)
+
+    def close(self):
+        """Stop the worker processes, abandoning any unfinished jobs."""
+        self._pool.terminate()
+        self._pool.join()
+        self._progress_queue.put(None)
+        self._progress_thread.join()
+
+    def _start_jobs(self):
+        """Start queued jobs while there are free processes.
+
+           Must be called with the lock held.
+        """
+        while self._queued and self._nrunning < self.processes:
+            job = _next_job(self._queued, self.schedule)
+            self._queued.remove(job)
+            self._nrunning += 1
+            job["status"] = "running"
+            job["started"] = time.time()
+            task = (job["segy_path"], job["netcdf_path"], job["check"],
+                    job["force"], job["options"])
+            self._pool.apply_async(
+                _run_job, (job["id"], task), callback=self._finish,
+                error_callback=functools.partial(self._fail, job["id"]))
+
+    def _finish(self, result):
+        """Record the result of a job (see batch._convert_job)."""
+        with self._lock:
+            job = self.jobs[result["id"]]
+            job["status"] = result["status"]
+            job["error"] = result["error"]
+            if job["status"] == "converted" and job["bytes_total"]:
+                job["bytes_copied"] = job["bytes_total"]
+            self._end_job(job)
+
+    def _fail(self, job_id, error):
+        """Record a job that could not be run in a worker."""
+        with self._lock:
+            job = self.jobs[job_id]
+            job["status"] = "failed"
+            job["error"] = "{}: {}".format(type(error).__name__, error)
+            self._end_job(job)
+
+    def _end_job(self, job):
+        """Free the job's process. Must be called with the lock held."""
+        job["finished"] = time.time()
+        self._nrunning -= 1
+        if self.verbose:
+            message = "{}: {}".format(job["status"], job["segy_path"])
+            if job["error"]:
+                message += " ({})".format(job["error"])
+            click.echo(message)
+        self._start_jobs()
+        self._lock.notify_all()
+
+    def _read_progress(self):
+        """Record the progress that workers report, until closed."""
+        while True:
+            item = self._progress_queue.get()
+            if item is None:
+                return
+            job_id, nbytes, length = item
+            with self._lock:
+                job = self.jobs[job_id]
+                if job["status"] == "running":
+                    job["bytes_copied"] = nbytes
+                    job["bytes_total"] = length
+
+
+def _next_job(queued, schedule):
+    """Choose which of the queued jobs to start next."""
+    if schedule == "smallest":
+        return min(queued, key=lambda job: (job["bytes"], job["id"]))
+    if schedule == "largest":
+        return min(queued, key=lambda job: (-job["bytes"], job["id"]))
+    return min(queued, key=lambda job: job["id"])
+
+
+def _report(job):
+    """Describe a job (see ConversionDaemon.report)."""
+    report = collections.OrderedDict(
+        (key, job[key]) for key in ["id", "segy_path", "netcdf_path",
+                                    "status", "bytes", "bytes_copied",
+                                    "bytes_total"])
+    report["progress"] = None
+    if job["bytes_total"]:
+        report["progress"] = job["bytes_copied"] / job["bytes_total"]
+    seconds = 0.0
+    if job["started"] is not None:
+        seconds = (job["finished"] or time.time()) - job["started"]
+    report["seconds"] = seconds
+    report["MB_per_s"] = None
+    if job["bytes_copied"] and seconds > 0:
+        report["MB_per_s"] = job["bytes_copied"] / 1e6 / seconds
+    report["error"] = job["error"]
+    return report
+
+
+# Queue that each process of the pool reports the progress of its job to
+_worker_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    """Store the progress queue in a process of the pool."""
+    global _worker_progress_queue
+    _worker_progress_queue = progress_queue
+
+
+def _run_job(job_id, task):
+    """Convert one file in a process of the pool (see batch._convert_job),
+       reporting its progress to the daemon.
+    """
+    segy_path, netcdf_path, check, force, options = task
+    options = dict(options, progress=functools.partial(_put_progress,
+                                                       job_id))
+    result = batch._convert_job((segy_path, netcdf_path, check, force,
+                                 options))
+    result["id"] = job_id
+    return result
+
+
+def _put_progress(job_id, nbytes, length):
+    """Report the bytes of traces copied so far by a job."""
+    _worker_progress_queue.put((job_id, nbytes, length))
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handle requests to the JSON API of a ConversionDaemon."""
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        parts = self.path.strip("/").split("/")
+        if parts == ["jobs"]:
+            self._send(200, self.server.daemon.report())
+        elif len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+            report = self.server.daemon.report(int(parts[1]))
+            if report is None:
+                self._send(404, {"error": "no job {}".format(parts[1])})
+            else:
+                self._send(200, report)
+        else:
+            self._send(404, {"error": "unknown path {}".format(self.path)})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path.strip("/") != "jobs":
+            self._send(404, {"error": "unknown path {}".format(self.path)})
+            return
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.split(";")[0].strip().lower() != "application/json":
+            self._send(415, {"error": "jobs must be submitted as "
+                             "application/json"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            if not isinstance(request, dict):
+                raise ValueError("the job must be a JSON object")
+            self._send(201, self.server.daemon.submit(**request))
+        except (ValueError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+
+    def _authorized(self):
+        """Check the Host and token of a request, and reject it if either
+           is wrong.
+        """
+        hosts = self.server.allowed_hosts
+        if hosts is not None and self.headers.get("Host") not in hosts:
+            self._send(403, {"error": "Host must be one of {}".format(
+                ", ".join(sorted(hosts)))})
+            return False
+        expected = "Bearer " + self.server.token
+        if not hmac.compare_digest(
+                self.headers.get("Authorization", "").encode("utf-8"),
+                expected.encode("utf-8")):
+            self._send(403, {"error": "missing or wrong token"})
+            return False
+        return True
+
+    def _send(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Clients of a Unix socket have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            http.server.BaseHTTPRequestHandler.log_message(self, format,
+                                                           *args)
+
+
+class _TCPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(daemon, address, token, verbose=False):
+    """Make a server for the JSON API of a daemon.
+
+    Args:
+        daemon: A ConversionDaemon
+        address: A (host, port) tuple to listen on (port 0 chooses a free
+            port), or a string specifying the path of a Unix socket (see
+            _remove_stale_socket)
+        token: A string that every request must carry (see write_token)
+        verbose: An optional boolean flag indicating whether to print each
+            request. Default False.
+
+    Returns:
+        A socketserver server, which handles each request in a thread; call
+        its serve_forever method to start it
+
+    Raises:
+        ValueError: If address is a path that cannot be used for the socket
+    """
+    if isinstance(address, str):
+        _remove_stale_socket(address)
+        server = _UnixServer(address, _RequestHandler)
+        # Browsers cannot connect to Unix sockets
+        server.allowed_hosts = None
+    else:
+        server = _TCPServer(tuple(address), _RequestHandler)
+        host, port = server.server_address[:2]
+        server.allowed_hosts = set(["{}:{}".format(host, port)])
+        if host in ("127.0.0.1", "::1"):
+            server.allowed_hosts.add("localhost:{}".format(port))
+    server.daemon = daemon
+    server.token = token
+    server.verbose = verbose
+    return server
+
+
+def _remove_stale_socket(path):
+    """Remove a Unix socket left behind by a daemon that has stopped.
+
+    Raises:
+        ValueError: If something other than a socket is at path, or a
+            daemon is still listening on the socket
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError("{} exists and is not a socket".format(path))
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise ValueError("a daemon is already listening on {}".format(path))
+
+
+def write_token(path=DEFAULT_TOKEN_FILE):
+    """Write a new random token to a file that only the user can read.
+
+       Any existing file is replaced.
+
+    Returns:
+        The token, a string
+    """
+    token = secrets.token_hex(32)
+    if os.path.lexists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+
+def read_token(path=DEFAULT_TOKEN_FILE):
+    """Read the token written by write_token."""
+    with open(path) as f:
+        return f.read().strip()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection over a Unix socket."""
+
+    def __init__(self, path, timeout=None):
+        http.client.HTTPConnection.__init__(self, "localhost",
+                                            timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def submit_job(address, segy_path, netcdf_path,
+               token_file=DEFAULT_TOKEN_FILE, **options):
+    """Submit a job to a running daemon.
+
+    Args:
+        address: The daemon's (host, port) tuple, or the path of its Unix
+            socket
+        segy_path, netcdf_path, **options: As for ConversionDaemon.submit.
+            Relative paths are made absolute here, as the daemon may have
+            a different working directory.
+        token_file: An optional string specifying the path of the file
+            that the daemon wrote its token to. Default DEFAULT_TOKEN_FILE.
+
+    Returns:
+        The job's report (see ConversionDaemon.report)
+    """
+    request = dict(options, segy_path=os.path.abspath(segy_path),
+                   netcdf_path=os.path.abspath(netcdf_path))
+    return _request(address, read_token(token_file), "POST", "/jobs",
+                    request)
+
+
+def get_job(address, job_id=None, token_file=DEFAULT_TOKEN_FILE):
+    """Get the report of a job, or of every job, from a running daemon."""
+    path = "/jobs" if job_id is None else "/jobs/{}".format(job_id)
+    return _request(address, read_token(token_file), "GET", path)
+
+
+def _request(address, token, method, path, body=None):
+    """Make a request to the daemon's API, and return its JSON response.
+
+       An error response raises a ValueError with its message.
+    """
+    if isinstance(address, str):
+        connection = _UnixHTTPConnection(address)
+    else:
+        connection = http.client.HTTPConnection(*address)
+    try:
+        headers = {"Authorization": "Bearer " + token}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        connection.request(method, path, data, headers)
+        response = connection.getresponse()
+        result = json.loads(response.read().decode("utf-8"))
+    finally:
+        connection.close()
+    if response.status >= 400:
+        raise ValueError(result["error"])
+    return result
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""IBM: vectorized conversion between IBM and IEEE 4 byte floats.
+
+SEG-Y data sample format 1 stores each sample as a big-endian IBM hexadecimal
+float: one sign bit, a 7 bit base-16 exponent biased by 64, and a 24 bit
+fraction.
+"""
+import numpy as np
+
+
+def ibm2ieee(data):
+    """Convert IBM floats to IEEE floats.
+
+    Args:
+        data: An array_like of uint32 (of either byte order) containing the
+            bits of IBM floats
+
+    Returns:
+        A NumPy float32 array of the same shape. Values too small or too
+        large for float32 become zero or infinity.
+    """
+    bits = np.asarray(data, dtype=np.uint32)
+    # The 24 bit fraction is exactly representable as a float32, so only
+    # the exponent needs to be applied, and then the sign bit copied
+    fraction = (bits & np.uint32(0xFFFFFF)).astype(np.float32)
+    exponent = ((bits >> 24) & np.uint32(0x7F)).astype(np.int32)
+    exponent *= 4
+    exponent -= 4 * 64 + 24
+    with np.errstate(over="ignore", under="ignore"):
+        ieee = np.ldexp(fraction, exponent)
+    ieee.view(np.uint32)[...] |= bits & np.uint32(0x80000000)
+    return ieee
+
+
+def ieee2ibm(data):
+    """Convert IEEE floats to IBM floats.
+
+       Every finite float32 value is within the range of IBM floats. Bits
+       that do not fit in the IBM fraction are truncated, so IBM floats
+       converted with ibm2ieee are converted back exactly. Infinities and
+       NaNs become the IBM float with the largest magnitude.
+
+    Args:
+        data: An array_like of IEEE floats
+
+    Returns:
+        A NumPy uint32 array of the same shape containing the bits of the
+        IBM floats (in native byte order)
+    """
+    bits = np.asarray(data, dtype=np.float32).view(np.uint32)
+    sign = bits & np.uint32(0x80000000)
+    exponent = ((bits >> 23) & 0xFF).astype(np.int32)
+    fraction = bits & np.uint32(0x7FFFFF)
+    # Restore the implicit leading bit of normal numbers, and treat
+    # subnormal numbers as having the smallest normal exponent
+    fraction = np.where(exponent > 0, fraction | np.uint32(0x800000),
+                        fraction)
+    exponent = np.maximum(exponent, 1)
+    # value = fraction * 2**(exponent - 150) = ibm_fraction * 16**(e - 64)
+    # * 2**-24, so choose the smallest e with a right shift of 0 to 3 bits
+    ibm_exponent = (exponent + 133) // 4
+    shift = 4 * ibm_exponent - exponent - 130
+    ibm_fraction = fraction >> shift.astype(np.uint32)
+    ibm = sign | (ibm_exponent.astype(np.uint32) << 24) | ibm_fraction
+    ibm = np.where(fraction == 0, sign, ibm)
+    ibm = np.where(exponent == 0xFF, sign | np.uint32(0x7FFFFFFF), ibm)
+    return ibm.astype(np.uint32)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Index: look up traces by the values of their headers.
+
+segy2netcdf can store, in the INDEX_GROUP group of the NetCDF file, an index
+of chosen trace headers (such as CDP, FieldRecord, or offset). For each
+header H, the group contains:
+
+    H: the sorted unique values of the header, with the min, max, and
+        unique_count attributes
+    H_start, H_count: for each value, the first entry in H_positions of the
+        traces with that value, and their number
+    H_positions: the positions of the traces (indices into the flattened,
+        C order, trace dimensions of Samples), grouped by value, and in
+        increasing order for each value
+
+so the traces with a value can be found by reading one entry of H_start and
+H_count, and one slice of H_positions, rather than the whole header
+variable. The min, max, and unique_count statistics are only of the indexed
+headers: the other headers are not read when the indexes are made.
+"""
+import collections
+import numpy as np
+from netCDF4 import Dataset
+
+# Name of the NetCDF group that stores the header indexes
+INDEX_GROUP = "index"
+
+
+def find_traces(netcdf_path, name, value):
+    """Find the traces whose header has a value, using the header's index.
+
+    Args:
+        netcdf_path: A string specifying the path to a NetCDF file made by
+            segy2netcdf with an index of the header
+        name: A string specifying the name of the header
+        value: An int specifying the value of the header
+
+    Returns:
+        A sorted NumPy int64 array of the positions of the traces in the
+        flattened trace dimensions of Samples (np.unravel_index converts
+        them into indices of each dimension). It is empty if no trace has
+        the value.
+    """
+    rootgrp = Dataset(netcdf_path, "r")
+    try:
+        return _find_traces(rootgrp, name, value)
+    finally:
+        rootgrp.close()
+
+
+def read_gather(netcdf_path, name, value, variables=None):
+    """Read the traces whose header has a value, using the header's index.
+
+    Args:
+        netcdf_path: A string specifying the path to a NetCDF file made by
+            segy2netcdf with an index of the header
+        name: A string specifying the name of the header
+        value: An int specifying the value of the header
+        variables: An optional list of strings specifying the names of the
+            variables to read. Each must have the trace dimensions of
+            Samples as its first dimensions. Default Samples and every
+            trace header variable.
+
+    Returns:
+        An OrderedDict from variable name to a NumPy (masked) array with
+        the values of the traces, in the order of their positions (see
+        find_traces), along its first axis
+    """
+    rootgrp = Dataset(netcdf_path, "r")
+    try:
+        positions = _find_traces(rootgrp, name, value)
+        trace_dims = rootgrp["Samples"].dimensions[:-1]
+        trace_dim_lens = [len(rootgrp.dimensions[dim]) for dim in trace_dims]
+        if variables is None:
+            variables = [v.name for v in rootgrp.variables.values()
+                         if v.dimensions[:len(trace_dims)] == trace_dims
+                         and v.dimensions]
+        gather = collections.OrderedDict()
+        for v_name in variables:
+            v = rootgrp[v_name]
+            if v.dimensions[:len(trace_dims)] != trace_dims:
+                raise ValueError("{} does not have the trace dimensions "
+                                 "{}".format(v_name, ", ".join(trace_dims)))
+            gather[v_name] = _read_traces(v, positions, trace_dim_lens)
+        return gather
+    finally:
+        rootgrp.close()
+
+
+def _find_traces(rootgrp, name, value):
+    """Find the traces whose header has a value (see find_traces)."""
+    if INDEX_GROUP not in rootgrp.groups \
+            or name not in rootgrp[INDEX_GROUP].variables:
+        raise ValueError("there is no index of {}".format(name))
+    index = rootgrp[INDEX_GROUP]
+    values = index[name][:]
+    i = int(np.searchsorted(values, value))
+    if i == len(values) or values[i] != value:
+        return np.zeros(0, np.int64)
+    start = int(index[name + "_start"][i])
+    count = int(index[name + "_count"][i])
+    return np.asarray(index[name + "_positions"][start:start + count],
+                      np.int64)
+
+
+def _read_traces(v, positions, trace_dim_lens):
+    """Read the traces at sorted positions of a variable.
+
+       The traces in each row (all dimensions except the fastest trace
+       dimension) are read together.
+    """
+    if len(trace_dim_lens) == 1:
+        return v[positions]
+    idxs = np.unravel_index(positions, trace_dim_lens)
+    rows = np.ravel_multi_index(idxs[:-1], trace_dim_lens[:-1])
+    _, row_starts = np.unique(rows, return_index=True)
+    values = []
+    for start, stop in zip(row_starts, list(row_starts[1:]) + [len(rows)]):
+        row = tuple(int(idx[start]) for idx in idxs[:-1])
+        values.append(v[row + (idxs[-1][start:stop],)])
+    if not values:
+        return np.ma.zeros((0,) + v.shape[len(trace_dim_lens):], v.dtype)
+    return np.ma.concatenate(values)
+
+
+def build_index(values, positions):
+    """Sort the values of a header to make its index.
+
+    Args:
+        values: A NumPy array with the value of the header of each trace
+        positions: A NumPy array with the position of each trace
+
+    Returns:
+        A dictionary with the 'values', 'start', 'count', and 'positions'
+        arrays of the index (see the module docstring)
+    """
+    order = np.lexsort((positions, values))
+    unique, start, count = np.unique(values[order], return_index=True,
+                                     return_counts=True)
+    return {"values": unique, "start": start.astype(np.int64),
+            "count": count.astype(np.int64),
+            "positions": np.asarray(positions, np.int64)[order]}
+
+
+def write_index(rootgrp, name, index):
+    """Store the index of a header in the INDEX_GROUP group."""
+    if INDEX_GROUP in rootgrp.groups:
+        group = rootgrp[INDEX_GROUP]
+    else:
+        group = rootgrp.createGroup(INDEX_GROUP)
+    group.createDimension(name, len(index["values"]))
+    group.createDimension(name + "_traces", len(index["positions"]))
+    v = group.createVariable(name, index["values"].dtype, (name,))
+    v[:] = index["values"]
+    if len(index["values"]):
+        v.setncattr("min", index["values"][0])
+        v.setncattr("max", index["values"][-1])
+    v.setncattr("unique_count", len(index["values"]))
+    for key in ["start", "count"]:
+        group.createVariable(name + "_" + key, "i8", (name,))[:] = index[key]
+    group.createVariable(name + "_positions", "i8",
+                         (name + "_traces",))[:] = index["positions"]
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""Lazy: open a SEG-Y file as a lazily loaded xarray Dataset.
+
+The Dataset has the same layout as the NetCDF file that segy2netcdf would
+make, but nothing is converted: the trace data and headers are dask arrays,
+and only the blocks of traces that a computation touches are read from the
+SEG-Y file. This requires the optional xarray and dask packages.
+"""
+import abc
+import os
+import threading
+import numpy as np
+import segyio
+from netcdf_segy import segy2netcdf as s2n
+
+
+def open_segy(segy_path, samples_dim_name=None, d=(), headers=None,
+              exclude_headers=(), max_memory=None, engine="mmap"):
+    """Open a SEG-Y file as a lazily loaded xarray Dataset.
+
+       The dimensions are made from samples_dim_name and d in the same way
+       as by segy2netcdf (including a Traces dimension for traces that d
+       does not account for), and the variables have the same names:
+       Samples, the trace samples dimension, and one variable per trace
+       header. The file headers are stored as the bin, text, and
+       ext_headers attributes. Samples has the type that segyio reads the
+       trace data as (such as int16 for 2 byte integer samples), which is
+       also the type that segy2netcdf stores it as by default.
+
+       Samples and the per-trace header variables are dask arrays, chunked
+       in blocks of traces along the slowest dimension in the same way as
+       segy2netcdf copies them (see segy2netcdf._trace_blocks). Each thread
+       that reads a chunk opens its own handle to the file; the handles are
+       closed by the Dataset's close method.
+
+    Args:
+        segy_path: A string specifying the path to input SEG-Y file.
+        samples_dim_name: An optional string specifying the name of trace
+            samples dimension. Default SampleNumber.
+        d: An optional tuple of (string, int) tuples specifying the names
+            and lengths of the other dimensions, in slowest to fastest
+            order, as in segy2netcdf.
+        headers: An optional list of strings specifying the names of the
+            trace headers to include. Default all headers.
+        exclude_headers: An optional list of strings specifying the names of
+            trace headers not to include.
+        max_memory: An optional int specifying the approximate maximum
+            number of bytes of trace data in one chunk. Default
+            DEFAULT_MAX_MEMORY.
+        engine: An optional string, one of ENGINES, specifying how to read
+            the trace data (see segy2netcdf). Default 'mmap', which falls
+            back to 'segyio' if the file cannot be memory-mapped.
+
+    Returns:
+        An xarray Dataset
+    """
+    try:
+        import dask.array as da
+        import dask.base
+        import xarray as xr
+    except ImportError:
+        raise ImportError("open_segy requires the xarray and dask packages")
+    if engine not in s2n.ENGINES:
+        raise ValueError("engine must be one of {}, not "
+                         "{}".format(", ".join(s2n.ENGINES), engine))
+    if not samples_dim_name:
+        samples_dim_name = "SampleNumber"
+    if max_memory is None:
+        max_memory = s2n.DEFAULT_MAX_MEMORY
+
+    with segyio.open(segy_path, ignore_geometry=True) as segy:
+        ns = len(segy.samples)
+        ntraces = segy.tracecount
+        records = s2n._trace_records(segy_path, segy)
+        dim_names, dim_lens = s2n._make_dim_name_len(samples_dim_name, ns, d)
+        dims_ntraces = s2n._count_traces_in_user_dims(d)
+        s2n._check_user_dims(dims_ntraces, ntraces)
+        s2n._fill_missing_dims(dims_ntraces, ntraces, dim_names, dim_lens)
+        if engine == "mmap" and (records is None
+                                 or s2n._sample_dtype(segy) is None):
+            engine = "segyio"
+        coords = {dim_names[-1]: (dim_names[-1], np.array(
+            segyio.sample_indexes(segy), np.float32))}
+        for name in dim_names[:-1]:
+            if name in segyio.tracefield.keys:
+                coords[name] = (name, s2n._dim_coordinates(
+                    segy, records, name, dim_names, dim_lens).astype(
+                        np.int32))
+        attrs = s2n._file_header_attributes(segy)
+        samples_dtype = segy.dtype
+        trace_nbytes = ns * samples_dtype.itemsize
+    fields = [field for field in s2n._select_header_fields(headers,
+                                                           exclude_headers)
+              if field not in dim_names]
+
+    source = _SegyFile(segy_path, engine)
+    trace_dim_lens = dim_lens[:-1]
+    chunks = _block_chunks(trace_dim_lens, trace_nbytes, max_memory)
+    token = dask.base.tokenize(os.path.abspath(segy_path),
+                               os.path.getmtime(segy_path), engine, chunks)
+    data_vars = {"Samples": (dim_names, da.from_array(
+        _LazyTraces(source, trace_dim_lens, ns, samples_dtype),
+        chunks=chunks + (ns,),
+        name="Samples-" + token, asarray=False))}
+    for field in fields:
+        data_vars[field] = (dim_names[:-1], da.from_array(
+            _LazyHeader(source, trace_dim_lens, field), chunks=chunks,
+            name="{}-{}".format(field, token), asarray=False))
+    dataset = xr.Dataset(data_vars, coords, attrs)
+    dataset.set_close(source.close)
+    return dataset
+
+
+def _block_chunks(trace_dim_lens, trace_nbytes, max_memory):
+    """Choose the chunk lengths of the trace dimensions.
+
+       The chunks match the blocks made by segy2netcdf._trace_blocks: one
+       entry of each dimension slower than the one that blocks are made
+       along, as many entries of that dimension as fit within max_memory,
+       and all of the faster dimensions.
+
+    Returns:
+        A tuple with the chunk length of each trace dimension
+    """
+    blocks = s2n._trace_blocks(trace_dim_lens, trace_nbytes, max_memory)
+    first = next(blocks, None)
+    if first is None:
+        return tuple(trace_dim_lens)
+    shape = first[3]
+    return (1,) * (len(trace_dim_lens) - len(shape)) + tuple(shape)
+
+
+class _SegyFile(object):
+    """Handles to a SEG-Y file, opened once by each thread that reads it.
+
+       Only the path and engine are pickled, so the file can also be read
+       by other processes (which open their own handles).
+    """
+
+    def __init__(self, segy_path, engine):
+        self.segy_path = segy_path
+        self.engine = engine
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._handles = []
+
+    def handle(self):
+        """Return this thread's segyio file and trace records."""
+        if not hasattr(self._local, "segy"):
+            segy = segyio.open(self.segy_path, ignore_geometry=True)
+            self._local.segy = segy
+            self._local.records = s2n._trace_records(self.segy_path, segy)
+            with self._lock:
+                self._handles.append(segy)
+        return self._local.segy, self._local.records
+
+    def close(self):
+        """Close the handles opened by every thread."""
+        with self._lock:
+            for segy in self._handles:
+                segy.close()
+            self._handles = []
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return {"segy_path": self.segy_path, "engine": self.engine}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class _LazyArray(abc.ABC):
+    """An array over the traces of a SEG-Y file that reads when indexed.
+
+       Indexing with a tuple of slices and ints (as dask does) reads the
+       selected traces: with one call if they are consecutive in the file.
+    """
+
+    def __init__(self, source, trace_dim_lens, shape, dtype):
+        self.source = source
+        self.trace_dim_lens = list(trace_dim_lens)
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (self.ndim - len(key))
+        n_trace_dims = len(self.trace_dim_lens)
+        trace_key = key[:n_trace_dims]
+        ids, shape = _trace_ids(trace_key, self.trace_dim_lens)
+        ids = ids.ravel()
+        segy, records = self.source.handle()
+        if len(ids) and np.all(np.diff(ids) == 1):
+            values = self._read(segy, records, int(ids[0]),
+                                int(ids[-1]) + 1, None)
+        else:
+            values = self._read(segy, records, 0, 0, ids)
+        values = values[(slice(None),) + key[n_trace_dims:]]
+        return values.reshape(shape + values.shape[1:])
+
+    @abc.abstractmethod
+    def _read(self, segy, records, start, stop, trace_ids):
+        """Read traces start to stop, or trace_ids if it is not None.
+
+        Returns:
+            A NumPy array of type dtype with one row per trace
+        """
+
+
+class _LazyTraces(_LazyArray):
+    """The trace data (Samples) of a SEG-Y file, read when indexed."""
+
+    def __init__(self, source, trace_dim_lens, ns, dtype):
+        super(_LazyTraces, self).__init__(
+            source, trace_dim_lens, list(trace_dim_lens) + [ns], dtype)
+
+    def _read(self, segy, records, start, stop, trace_ids):
+        samples, _ = s2n._read_block(segy, records, start, stop, [],
+                                     trace_ids, self.source.engine)
+        return np.asarray(samples, self.dtype)
+
+
+class _LazyHeader(_LazyArray):
+    """One trace header of a SEG-Y file, read when indexed."""
+
+    def __init__(self, source, trace_dim_lens, name):
+        super(_LazyHeader, self).__init__(source, trace_dim_lens,
+                                          trace_dim_lens, np.int32)
+        self.name = name
+
+    def _read(self, segy, records, start, stop, trace_ids):
+        headers = s2n._read_block_headers(segy, records, start, stop,
+                                          [self.name], trace_ids)
+        return np.asarray(headers[self.name], np.int32)
+
+
+def _trace_ids(key, trace_dim_lens):
+    """Find the indices of the traces selected by a key.
+
+    Args:
+        key: A tuple with one slice or int for each trace dimension
+        trace_dim_lens: A list with the lengths of the trace dimensions
+
+    Returns:
+        ids: A NumPy array with the index of each selected trace
+        shape: A tuple with the shape of the selection (without the
+            dimensions selected by ints)
+    """
+    axes = []
+    shape = []
+    for k, n in zip(key, trace_dim_lens):
+        axis = np.arange(n)[k]
+        if isinstance(k, slice):
+            shape.append(len(axis))
+        axes.append(np.atleast_1d(axis))
+    if not axes:
+        return np.zeros(1, np.int64), ()
+    ids = np.ravel_multi_index(np.ix_(*axes), trace_dim_lens)
+    return ids, tuple(shape)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Netcdf2segy: convert NetCDF files made by segy2netcdf back to SEG-Y files.
+"""
+import click
+import segyio
+import numpy as np
+from netCDF4 import Dataset
+from netcdf_segy import segy2netcdf as s2n
+from netcdf_segy.ibm import ieee2ibm
+
+
+@click.command()
+@click.argument("netcdf_path", type=click.Path(exists=True, dir_okay=False))
+@click.argument("segy_path", type=click.Path())
+@click.option(
+    "--verbose/--quiet",
+    default=False,
+    help="turn on or off verbose output (default off).",
+)
+@click.option(
+    "--max-memory",
+    type=int,
+    default=None,
+    help="Approximate maximum number of bytes of trace data to hold in "
+    "memory at once (default {}).".format(s2n.DEFAULT_MAX_MEMORY),
+)
+def cli(netcdf_path, segy_path, verbose, max_memory):
+    """Click CLI for netcdf2segy."""
+    netcdf2segy(netcdf_path, segy_path, verbose, max_memory)
+
+
+def netcdf2segy(netcdf_path, segy_path, verbose=False, max_memory=None):
+    """Convert a NetCDF file made by segy2netcdf to a SEG-Y file.
+
+       The binary and text file headers are restored from the NetCDF file's
+       attributes, and the trace headers from the header variables (and
+       from attributes, for headers stored as constants). Headers that were
+       not copied to the NetCDF file are zero. If the trace data was not
+       quantized, and is stored in a format that a four byte float can hold
+       exactly (such as IBM or IEEE floats, or two byte integers), the
+       trace data and headers of the output are identical to those of the
+       original SEG-Y file.
+
+    Args:
+        netcdf_path: A string specifying the path to input NetCDF file.
+        segy_path: A string specifying the path to output SEG-Y file.
+        verbose: An optional boolean flag indicating whether to print
+            progress. Default False.
+        max_memory: An optional int specifying the approximate maximum
+            number of bytes of trace data to hold in memory at once.
+            Default DEFAULT_MAX_MEMORY.
+    """
+    rootgrp = Dataset(netcdf_path, "r")
+    try:
+        rootgrp.set_auto_mask(False)
+        binary_header = _parse_binary_header(rootgrp)
+        samples = rootgrp["Samples"]
+        dim_names = list(samples.dimensions)
+        dim_lens = list(samples.shape)
+        fmt = binary_header.get(segyio.BinField.Format, 1)
+        if fmt not in s2n.SAMPLE_FORMAT_DTYPES:
+            raise ValueError("SEG-Y data sample format {} is not "
+                             "supported".format(fmt))
+        ntraces = int(np.prod(dim_lens[:-1], dtype=np.int64))
+
+        if verbose:
+            click.echo("writing file headers")
+        data_offset = _write_file_headers(rootgrp, segy_path, binary_header,
+                                          fmt, dim_lens[-1], ntraces)
+        with open(segy_path, "r+b") as segy_file:
+            segy_file.seek(data_offset)
+            _write_traces(rootgrp, segy_file, dim_names, dim_lens, fmt,
+                          verbose, max_memory)
+    finally:
+        rootgrp.close()
+
+
+def _parse_binary_header(rootgrp):
+    """Convert the bin attribute written by segy2netcdf into a dictionary.
+
+    Returns:
+        A dictionary from segyio.BinField to int
+    """
+    if "bin" not in rootgrp.ncattrs():
+        raise ValueError("NetCDF file does not have a bin attribute; was it "
+                         "made by segy2netcdf?")
+    binary_header = {}
+    for item in rootgrp.bin.strip("{}").split(","):
+        if not item.strip():
+            continue
+        name, value = item.split(":")
+        binary_header[getattr(segyio.BinField, name.strip())] = int(value)
+    return binary_header
+
+
+def _write_file_headers(rootgrp, segy_path, binary_header, fmt, ns,
+                        ntraces):
+    """Write the text, binary, and extended text headers of the SEG-Y file.
+
+       The number of samples in the binary header is set to ns, the length
+       of the trace samples dimension.
+
+    Returns:
+        The offset, in bytes, of the first trace in the file
+    """
+    ext_headers = 0
+    if "ext_headers" in rootgrp.ncattrs():
+        ext_headers = max(1, binary_header.get(
+            segyio.BinField.ExtendedHeaders, 1))
+    spec = segyio.spec()
+    spec.format = fmt
+    spec.samples = range(ns)
+    spec.tracecount = ntraces
+    spec.ext_headers = ext_headers
+    with segyio.create(segy_path, spec) as segy:
+        segy.text[0] = _encode_text(rootgrp.text)
+        if ext_headers:
+            segy.text[1] = _encode_text(rootgrp.ext_headers)
+        binary_header = dict(binary_header)
+        binary_header[segyio.BinField.Samples] = ns
+        segy.bin.update(binary_header)
+    return (s2n.TEXT_HEADER_NBYTES + s2n.BINARY_HEADER_NBYTES
+            + ext_headers * s2n.TEXT_HEADER_NBYTES)
+
+
+def _encode_text(text):
+    """Encode a text header, replacing characters that cannot be stored."""
+    return text.encode("latin-1", "replace")[:s2n.TEXT_HEADER_NBYTES]
+
+
+def _write_traces(rootgrp, segy_file, dim_names, dim_lens, fmt, verbose,
+                  max_memory=None):
+    """Write the trace headers and data in blocks of traces.
+
+       Each block is assembled in a NumPy structured array with the layout
+       of the traces in the SEG-Y file, and written with one call. If
+       Samples has a _FillValue attribute (as when segy2netcdf's infer_dims
+       found missing traces), traces that only contain it are not written.
+    """
+    if max_memory is None:
+        max_memory = s2n.DEFAULT_MAX_MEMORY
+    ns = dim_lens[-1]
+    record_dtype = np.dtype([("header", s2n._header_dtype()),
+                             ("samples", s2n.SAMPLE_FORMAT_DTYPES[fmt], (ns,))])
+    trace_dim_lens = dim_lens[:-1]
+    samples = rootgrp["Samples"]
+    fill_value = None
+    if "_FillValue" in samples.ncattrs():
+        fill_value = samples.getncattr("_FillValue")
+    per_trace, per_dim, constants = _header_sources(rootgrp, dim_names)
+    for start, stop, index, shape in s2n._trace_blocks(
+            trace_dim_lens, record_dtype.itemsize, max_memory):
+        if verbose:
+            click.echo("writing traces {} to {}".format(start, stop - 1))
+        records = np.zeros(stop - start, record_dtype)
+        headers = records["header"]
+        for name, value in constants.items():
+            headers[name] = value
+        for name, v in per_trace.items():
+            headers[name] = np.asarray(v[index]).reshape(-1)
+        if per_dim:
+            trace_idx = np.unravel_index(np.arange(start, stop),
+                                         trace_dim_lens)
+            for name, (dim_idx, values) in per_dim.items():
+                headers[name] = values[trace_idx[dim_idx]]
+        data = np.asarray(samples[index]).reshape(-1, ns)
+        if fmt == 1:
+            records["samples"] = ieee2ibm(data)
+        else:
+            records["samples"] = data
+        if fill_value is not None:
+            records = records[~np.all(data == fill_value, axis=1)]
+        segy_file.write(records.tobytes())
+
+
+def _header_sources(rootgrp, dim_names):
+    """Find where the value of each trace header is stored.
+
+    Returns:
+        per_trace: A dictionary from header name to a NetCDF variable with
+            one value per trace
+        per_dim: A dictionary from header name to a tuple of the index of the
+            dimension it is used as, and a NumPy array of its values
+        constants: A dictionary from header name to the value it has in
+            every trace
+    """
+    per_trace = {}
+    per_dim = {}
+    constants = {}
+    attributes = rootgrp.ncattrs()
+    for name in s2n._select_header_fields():
+        if name in dim_names[:-1]:
+            per_dim[name] = (dim_names.index(name), rootgrp[name][:])
+        elif name in rootgrp.variables:
+            per_trace[name] = rootgrp[name]
+        elif name in attributes:
+            constants[name] = rootgrp.getncattr(name)
+    return per_trace, per_dim, constants
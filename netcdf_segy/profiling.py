@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Profiling: time the stages of a conversion and report its throughput.
+
+A Profiler records, for each named stage, the wall time spent in it, the
+number of bytes read and written, and the peak resident set size (RSS) of
+the process when it finished, so that a slow conversion can be attributed to
+reading the SEG-Y file, decoding it, or writing (and compressing) the
+NetCDF file.
+"""
+import collections
+import contextlib
+import json
+import sys
+import time
+import click
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+class Stage(object):
+    """The measurements of one stage of a conversion.
+
+       Entering a stage with the same name more than once (such as once per
+       block of traces) accumulates its measurements.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.nbytes_read = 0
+        self.nbytes_written = 0
+        self.peak_rss = None
+
+    def as_dict(self):
+        """Return the measurements as a JSON-serializable dictionary."""
+        return collections.OrderedDict([
+            ("name", self.name),
+            ("calls", self.calls),
+            ("seconds", self.seconds),
+            ("bytes_read", self.nbytes_read),
+            ("bytes_written", self.nbytes_written),
+            ("MB_per_s", _rate(max(self.nbytes_read, self.nbytes_written),
+                               self.seconds)),
+            ("peak_rss", self.peak_rss),
+        ])
+
+
+class Profiler(object):
+    """Record the time, bytes transferred, and peak RSS of named stages."""
+
+    def __init__(self):
+        self.stages = collections.OrderedDict()
+        self.info = collections.OrderedDict()
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the enclosed code as (part of) the stage called name.
+
+        Yields:
+            The Stage, so that the caller can add the number of bytes
+            read and written to nbytes_read and nbytes_written
+        """
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage(name)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds += time.perf_counter() - start
+            stage.calls += 1
+            stage.peak_rss = peak_rss()
+
+    def report(self):
+        """Return the measurements as a JSON-serializable dictionary.
+
+           The totals of bytes read and written are the sums over all
+           stages.
+        """
+        seconds = time.perf_counter() - self._start
+        nbytes_read = sum(s.nbytes_read for s in self.stages.values())
+        nbytes_written = sum(s.nbytes_written for s in self.stages.values())
+        report = collections.OrderedDict(self.info)
+        report["seconds"] = seconds
+        report["bytes_read"] = nbytes_read
+        report["bytes_written"] = nbytes_written
+        report["MB_per_s"] = _rate(nbytes_read, seconds)
+        report["peak_rss"] = peak_rss()
+        report["stages"] = [s.as_dict() for s in self.stages.values()]
+        return report
+
+    def write(self, path):
+        """Write the report (see report) to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def summary(self):
+        """Return a list of lines describing each stage, for printing."""
+        lines = []
+        for s in self.stages.values():
+            line = "{:<32} {:9.3f} s".format(s.name, s.seconds)
+            rate = s.as_dict()["MB_per_s"]
+            if rate is not None:
+                line += " {:9.1f} MB/s".format(rate)
+            lines.append(line)
+        return lines
+
+
+class Progress(object):
+    """A progress bar, showing the rate in MB/s, that may be turned off.
+
+    Args:
+        length: An int specifying the total number of bytes to transfer
+        label: A string to show before the bar
+        enabled: An optional boolean flag indicating whether to show the
+            bar. If False, updates are ignored. It may instead be a
+            function, which is called with the number of bytes transferred
+            so far and length after each update, rather than showing the
+            bar (such as to report progress to another process). Default
+            True.
+    """
+
+    def __init__(self, length, label, enabled=True):
+        self.length = length
+        self.label = label
+        self.enabled = enabled
+        self.nbytes = 0
+        self._bar = None
+        self._start = None
+        self._callback = enabled if callable(enabled) else None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        if self._callback is not None:
+            self._callback(self.nbytes, self.length)
+        elif self.enabled:
+            self._bar = click.progressbar(length=self.length,
+                                          label=self.label,
+                                          item_show_func=lambda rate: rate,
+                                          file=sys.stderr)
+            self._bar.__enter__()
+        return self
+
+    def update(self, nbytes):
+        """Advance the bar by nbytes, and show the mean rate so far."""
+        self.nbytes += nbytes
+        if self._callback is not None:
+            self._callback(self.nbytes, self.length)
+        if self._bar is not None:
+            rate = _rate(self.nbytes, time.perf_counter() - self._start)
+            self._bar.update(nbytes, "{:.1f} MB/s".format(rate or 0.0))
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._bar is not None:
+            self._bar.__exit__(exc_type, exc_value, traceback)
+            self._bar = None
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in bytes.
+
+    Returns:
+        An int, or None if it cannot be measured on this platform
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, while macOS reports bytes
+    if sys.platform == "darwin":
+        return maxrss
+    return maxrss * 1024
+
+
+def _rate(nbytes, seconds):
+    """Return the rate in MB/s, or None if there is nothing to measure."""
+    if not nbytes or seconds <= 0:
+        return None
+    return nbytes / 1e6 / seconds
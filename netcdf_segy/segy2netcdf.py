@@ -1,10 +1,88 @@
 # -*- coding: utf-8 -*-
 """Segy2netcdf: convert SEG-Y files to NetCDF files.
 """
+import collections
+import functools
+import multiprocessing
+import os
+import queue
+import threading
 import click
 import segyio
 import numpy as np
+import netCDF4
 from netCDF4 import Dataset
+from netcdf_segy.ibm import ibm2ieee
+from netcdf_segy.index import build_index, write_index
+from netcdf_segy.profiling import Profiler, Progress
+from netcdf_segy.zarr_output import ZarrDataset, open_variable
+
+# Default upper limit, in bytes, on the trace data held in memory at once
+DEFAULT_MAX_MEMORY = 256 * 1024 ** 2
+
+# Sizes, in bytes, of the SEG-Y file headers and of each trace header
+TEXT_HEADER_NBYTES = 3200
+BINARY_HEADER_NBYTES = 400
+TRACE_HEADER_NBYTES = 240
+
+# Big-endian NumPy types used to store each SEG-Y data sample format
+SAMPLE_FORMAT_DTYPES = {
+    1: ">u4",
+    2: ">i4",
+    3: ">i2",
+    5: ">f4",
+    6: ">f8",
+    8: "i1",
+    9: ">i8",
+    10: ">u4",
+    11: ">u2",
+    12: ">u8",
+    16: "u1",
+}
+
+# Types that the trace data (Samples) can be stored as: the type of the
+# SEG-Y file's data, 4 or 2 byte floats, or 2 byte integers packed with
+# scale_factor and add_offset attributes (see _packing_attributes)
+SAMPLE_DTYPES = ("native", "f4", "f2", "i2")
+
+# Formats that the output can be written in
+OUTPUT_FORMATS = ("netcdf", "zarr")
+
+# Ways of reading the trace data (see _read_block)
+ENGINES = ("segyio", "mmap")
+
+# Default number of blocks of traces that each stage of the copy pipeline
+# (reading and decoding, then arranging) may run ahead of writing
+DEFAULT_QUEUE_DEPTH = 2
+
+# Approximate number of samples decoded at once by the mmap engine
+DECODE_CHUNK_NSAMPLES = 32768
+
+# Trace headers that describe the samples of the trace, so are changed when
+# only some of the samples are copied (see _window_trace_headers)
+WINDOW_HEADERS = ("TRACE_SAMPLE_COUNT", "TRACE_SAMPLE_INTERVAL")
+
+# Name of the attribute that records the index of the first trace not yet
+# copied, while a checkpointed conversion is in progress
+CHECKPOINT_ATTRIBUTE = "segy2netcdf_next_trace"
+
+# Names of the chunk shape heuristics available for the chunking option
+CHUNKING_PRESETS = ("trace", "timeslice", "balanced")
+
+# Default target size, in bytes, of one chunk when a preset is used
+DEFAULT_CHUNK_NBYTES = 1024 ** 2
+
+# Compression filters that netCDF4 can apply
+COMPRESSION_FILTERS = ("zlib", "szip", "zstd", "bzip2", "blosc_lz",
+                       "blosc_lz4", "blosc_lz4hc", "blosc_zlib", "blosc_zstd")
+
+# Filter and level used by each compression profile, in order of preference
+# if a filter is not supported by the installed netCDF4 library
+COMPRESS_PROFILES = {
+    "fast": [("zstd", 1), ("zlib", 1)],
+    "balanced": [("zstd", 3), ("zlib", 4)],
+    "small": [("zstd", 9), ("zlib", 9)],
+}
 
 
 @click.command()
@@ -43,13 +121,334 @@ from netCDF4 import Dataset
     default=False,
     help="turn on or off verbose output (default off).",
 )
-def cli(segy_path, netcdf_path, samples_dim_name, d, compress, verbose):
+@click.option(
+    "--max-memory",
+    type=int,
+    default=None,
+    help="Approximate maximum number of bytes of trace data to hold in "
+    "memory at once. Traces are copied in blocks along the slowest "
+    "dimension that fits within this budget "
+    "(default {}).".format(DEFAULT_MAX_MEMORY),
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of processes to use to read the SEG-Y file (default 1).",
+)
+@click.option(
+    "--queue-depth",
+    type=int,
+    default=DEFAULT_QUEUE_DEPTH,
+    help="Number of blocks of traces that background threads may read and "
+    "prepare ahead of the block being written, so that reading the SEG-Y "
+    "file overlaps with writing (and compressing) the output. The "
+    "--max-memory budget is shared by the blocks in flight; 0 copies "
+    "each block in turn in one thread (default {}).".format(
+        DEFAULT_QUEUE_DEPTH),
+)
+@click.option(
+    "--chunking",
+    callback=lambda ctx, param, value: _parse_chunking(value),
+    help="NetCDF chunk shape. One of {} (chunks optimised for reading "
+    "whole traces, time/depth slices, or a compromise), or a comma-"
+    "separated list of chunk lengths for each dimension of Samples, "
+    "in slowest to fastest order. Default: NetCDF's choice."
+    .format(", ".join(CHUNKING_PRESETS)),
+)
+@click.option(
+    "--chunk-bytes",
+    type=int,
+    default=None,
+    help="Target size, in bytes, of chunks chosen by a --chunking preset "
+    "(default {}).".format(DEFAULT_CHUNK_NBYTES),
+)
+@click.option(
+    "--contiguous/--no-contiguous",
+    default=False,
+    help="store the trace data and trace headers contiguously instead of "
+    "in chunks, and do not pre-fill them, for the fastest uncompressed "
+    "writes. Cannot be used with compression, --chunking, --append, or "
+    "--format zarr (default off).",
+)
+@click.option(
+    "--chunk-cache",
+    type=int,
+    default=None,
+    help="Size, in bytes, of the HDF5 chunk cache of each chunked variable "
+    "while writing. It should hold the chunks that a block of traces "
+    "(see --max-memory) spans. Default: NetCDF's.",
+)
+@click.option(
+    "--compress-profile",
+    type=click.Choice(sorted(COMPRESS_PROFILES)),
+    default=None,
+    help="Turn on compression, choosing the filter and level to favour "
+    "conversion speed (fast), output size (small), or a compromise "
+    "(balanced).",
+)
+@click.option(
+    "--compression",
+    type=click.Choice(COMPRESSION_FILTERS),
+    default=None,
+    help="Turn on compression with this filter (default zlib, if "
+    "compression is turned on by another option).",
+)
+@click.option(
+    "--compress-level",
+    type=click.IntRange(0, 9),
+    default=None,
+    help="Turn on compression with this level (default 4, or set by "
+    "--compress-profile).",
+)
+@click.option(
+    "--shuffle/--no-shuffle",
+    default=None,
+    help="turn on or off the byte-shuffle filter when compressing "
+    "(default on).",
+)
+@click.option(
+    "--significant-digits",
+    type=int,
+    default=None,
+    help="Quantize Samples to this number of significant digits (lossy).",
+)
+@click.option(
+    "--least-significant-digit",
+    type=int,
+    default=None,
+    help="Quantize Samples so that they are accurate to "
+    "10**-N (lossy).",
+)
+@click.option(
+    "--header",
+    multiple=True,
+    help="Name of a trace header to copy (using segyio.TraceField names). "
+    "May be repeated. Default: all headers.",
+)
+@click.option(
+    "--exclude-header",
+    multiple=True,
+    help="Name of a trace header not to copy. May be repeated.",
+)
+@click.option(
+    "--compact-headers/--no-compact-headers",
+    default=False,
+    help="store each trace header with the smallest integer type that "
+    "holds its values, and headers that are the same for every trace as "
+    "a single attribute (default off).",
+)
+@click.option(
+    "--infer-dims",
+    default=None,
+    help="Comma-separated list of trace header names to use as the "
+    "dimensions, in slowest to fastest order, instead of -d. The "
+    "coordinates of each dimension are the unique values of the header, "
+    "and each trace is placed according to its header values, so the "
+    "traces do not need to be sorted, and missing traces are filled with "
+    "the variables' fill value. E.g. --infer-dims INLINE_3D,CROSSLINE_3D",
+)
+@click.option(
+    "--index-headers",
+    default=None,
+    help="Comma-separated list of trace header names to index, so that "
+    "the traces with a value of one can be found without reading the "
+    "whole header variable (see netcdf_segy.read_gather). E.g. "
+    "--index-headers CDP,FieldRecord,offset",
+)
+@click.option(
+    "--traces",
+    default=None,
+    help="Range of trace indices to copy, as START:STOP[:STEP] with the "
+    "meaning of a Python slice (any part may be empty). E.g. --traces ::2 "
+    "copies every other trace. The dimensions (-d or --infer-dims) "
+    "describe the selected traces.",
+)
+@click.option(
+    "--select",
+    type=(str, str),
+    multiple=True,
+    help="Name of a trace header and range of its values to copy, as "
+    "MIN:MAX[:STEP] (inclusive, any part may be empty). A trace is copied "
+    "if every selected header is in range. E.g. --select INLINE_3D "
+    "100:200:2 copies every other inline from 100 to 200.",
+)
+@click.option(
+    "--tmin",
+    type=float,
+    default=None,
+    help="First sample of each trace to copy, in the units of the trace "
+    "samples dimension (default the first sample).",
+)
+@click.option(
+    "--tmax",
+    type=float,
+    default=None,
+    help="Last sample of each trace to copy, in the units of the trace "
+    "samples dimension (default the last sample).",
+)
+@click.option(
+    "--sample-step",
+    type=int,
+    default=None,
+    help="Copy every Nth sample of each trace (default 1).",
+)
+@click.option(
+    "--variable-length/--no-variable-length",
+    default=False,
+    help="turn on or off support for traces with different numbers of "
+    "samples: the length of each trace is read from its "
+    "TRACE_SAMPLE_COUNT header, Samples is padded to the longest trace "
+    "with its fill value, and the length of each trace is stored in a "
+    "TraceLength variable (default off).",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="segyio",
+    help="How to read the trace data: with segyio, or by memory-mapping "
+    "the file and decoding blocks of traces with NumPy (mmap). mmap falls "
+    "back to segyio if the file layout or data format does not allow it "
+    "(default segyio).",
+)
+@click.option(
+    "--sample-dtype",
+    type=click.Choice(SAMPLE_DTYPES),
+    default=None,
+    help="Type to store the trace data as: the type of the SEG-Y file's "
+    "data (native), 4 or 2 byte floats (f4, or f2 with --format zarr), or "
+    "2 byte integers with scale_factor and add_offset attributes (i2), "
+    "which needs an extra pass over the data to find its range. f2 and i2 "
+    "are lossy. Default native, or f4 if quantizing.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(OUTPUT_FORMATS),
+    default="netcdf",
+    help="Write a NetCDF4 file, or a Zarr store (a directory) with the "
+    "same variables and attributes, which several processes can write "
+    "at once (with --workers) and which reads faster in parallel "
+    "(default netcdf).",
+)
+@click.option(
+    "--append/--no-append",
+    default=False,
+    help="create the slowest dimension as unlimited, and if the NetCDF file "
+    "already exists, append the traces to it along that dimension instead "
+    "of overwriting it (default off).",
+)
+@click.option(
+    "--checkpoint/--no-checkpoint",
+    default=False,
+    help="record in the NetCDF file, after each block of traces is "
+    "written, how many traces have been copied, so that an interrupted "
+    "conversion can be continued with --resume (default off).",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=False,
+    help="if the NetCDF file is from an interrupted --checkpoint "
+    "conversion, check the trace headers already written and continue "
+    "from the last block written, instead of starting again. Implies "
+    "--checkpoint (default off).",
+)
+@click.option(
+    "--verify/--no-verify",
+    default=False,
+    help="turn on or off checking, after the conversion, that the output "
+    "matches the SEG-Y file, by reading both again in blocks (with "
+    "--workers processes), and storing a SHA-256 digest of the output's "
+    "content in its segy2netcdf_sha256 attribute (default off).",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write the time spent, bytes read and written, and peak memory "
+    "of each stage of the conversion to this JSON file.",
+)
+@click.option(
+    "--progress/--no-progress",
+    default=False,
+    help="turn on or off a progress bar, with the rate in MB/s, while "
+    "copying traces (default off).",
+)
+def cli(segy_path, netcdf_path, samples_dim_name, d, compress, verbose,
+        max_memory, workers, queue_depth, chunking, chunk_bytes, contiguous,
+        chunk_cache, compress_profile,
+        compression, compress_level, shuffle, significant_digits,
+        least_significant_digit, header, exclude_header, compact_headers,
+        infer_dims, index_headers, traces, select, tmin, tmax, sample_step,
+        variable_length, engine, sample_dtype, output_format, append,
+        checkpoint, resume, verify, profile, progress):
     """Click CLI for segy2netcdf."""
-    segy2netcdf(segy_path, netcdf_path, samples_dim_name, d, compress, verbose)
+    if infer_dims is not None:
+        infer_dims = infer_dims.split(",")
+    if index_headers is not None:
+        index_headers = index_headers.split(",")
+    if traces is not None:
+        traces = _parse_range(traces)
+    select = [(name,) + _parse_range(value) for name, value in select]
+    segy2netcdf(segy_path, netcdf_path, samples_dim_name, d, compress, verbose,
+                max_memory=max_memory, workers=workers,
+                queue_depth=queue_depth, chunking=chunking,
+                chunk_nbytes=chunk_bytes, contiguous=contiguous,
+                chunk_cache=chunk_cache, compress_profile=compress_profile,
+                compression=compression, complevel=compress_level,
+                shuffle=shuffle, significant_digits=significant_digits,
+                least_significant_digit=least_significant_digit,
+                headers=header or None, exclude_headers=exclude_header,
+                compact_headers=compact_headers, infer_dims=infer_dims,
+                index_headers=index_headers, traces=traces, select=select,
+                tmin=tmin, tmax=tmax, sample_step=sample_step,
+                variable_length=variable_length, engine=engine,
+                sample_dtype=sample_dtype, output_format=output_format,
+                append=append, checkpoint=checkpoint, resume=resume,
+                verify=verify, profile=profile, progress=progress)
+
+
+def _parse_chunking(value):
+    """Convert the chunking CLI option into a preset name or tuple of ints."""
+    if value is None or value in CHUNKING_PRESETS:
+        return value
+    try:
+        return tuple(int(x) for x in value.split(","))
+    except ValueError:
+        raise click.BadParameter(
+            "must be one of {} or a comma-separated list of "
+            "ints".format(", ".join(CHUNKING_PRESETS))
+        )
+
+
+def _parse_range(value):
+    """Convert a START:STOP[:STEP] CLI option into a tuple of ints or None."""
+    parts = value.split(":")
+    if len(parts) == 2:
+        parts.append("")
+    try:
+        if len(parts) != 3:
+            raise ValueError
+        return tuple(int(x) if x.strip() else None for x in parts)
+    except ValueError:
+        raise click.BadParameter(
+            "must be START:STOP or START:STOP:STEP, not {}".format(value))
 
 
 def segy2netcdf(
-    segy_path, netcdf_path, samples_dim_name=None, d=(), compress=False, verbose=False
+    segy_path, netcdf_path, samples_dim_name=None, d=(), compress=False,
+    verbose=False, max_memory=None, workers=1, chunking=None,
+    chunk_nbytes=None, compress_profile=None, compression=None,
+    complevel=None, shuffle=None, significant_digits=None,
+    least_significant_digit=None, headers=None, exclude_headers=(),
+    compact_headers=False, infer_dims=None, index_headers=None,
+    traces=None, select=(),
+    tmin=None, tmax=None, sample_step=None, variable_length=False,
+    engine="segyio",
+    sample_dtype=None, output_format="netcdf", append=False,
+    checkpoint=False, resume=False, profile=None, progress=False,
+    contiguous=False, chunk_cache=None, queue_depth=DEFAULT_QUEUE_DEPTH,
+    verify=False
 ):
     """Convert a SEG-Y file to a NetCDF file.
 
@@ -70,30 +469,477 @@ def segy2netcdf(
             compression should be used. Default False.
         verbose: An optional boolean flag indicating whether to print
             progress. Default False.
+        max_memory: An optional int specifying the approximate maximum
+            number of bytes of trace data to hold in memory at once.
+            Default DEFAULT_MAX_MEMORY.
+        workers: An optional int specifying the number of processes to use
+            to read the SEG-Y file. Each process reads blocks of traces
+            using its own file handle, while the NetCDF file is written, in
+            order, by the calling process. Default 1.
+        chunking: An optional string or tuple of ints specifying the NetCDF
+            chunk shape. If it is one of CHUNKING_PRESETS, a heuristic (see
+            _chunk_shape) chooses the chunk shape, while a tuple provides the
+            chunk length for each dimension of Samples, in slowest to
+            fastest order. Default None, leaving the choice to NetCDF.
+        chunk_nbytes: An optional int specifying the target size, in bytes,
+            of chunks chosen by a chunking preset. Default
+            DEFAULT_CHUNK_NBYTES.
+        compress_profile: An optional string, one of the keys of
+            COMPRESS_PROFILES, that turns on compression using the first
+            filter and level of that profile supported by netCDF4.
+        compression: An optional string, one of COMPRESSION_FILTERS, that
+            turns on compression with that filter. Default zlib, if
+            compression is turned on by another argument.
+        complevel: An optional int from 0 to 9 that turns on compression
+            with that level. Default 4, or set by compress_profile.
+        shuffle: An optional boolean flag indicating whether to apply the
+            byte-shuffle filter when compressing. Default True.
+        significant_digits: An optional int specifying the number of
+            significant digits to keep when (lossily) quantizing Samples.
+        least_significant_digit: An optional int N, specifying that Samples
+            should be (lossily) quantized to be accurate to 10**-N.
+        headers: An optional list of strings specifying the names of the
+            trace headers (using segyio.TraceField names) to copy. Headers
+            used as dimensions are always copied. Default all headers.
+        exclude_headers: An optional list of strings specifying the names of
+            trace headers not to copy.
+        compact_headers: An optional boolean flag indicating whether each
+            trace header should be stored with the smallest integer type
+            that holds its values, and headers that have the same value in
+            every trace should be stored as a single attribute of the file
+            with the header's name. Default False.
+        infer_dims: An optional list of strings specifying the names of
+            trace headers to use as the dimensions (excluding the trace
+            samples dimension), in slowest to fastest order. This is an
+            alternative to d. The coordinates of each dimension are the
+            sorted unique values of that header in the file, and each trace
+            is copied to the position given by its header values, so the
+            traces do not need to be in order. Positions without a trace
+            are set to the fill value of each variable.
+        index_headers: An optional list of strings specifying the names of
+            trace headers to index. Their values are read from every
+            copied trace in one pass, and, for each header, its sorted
+            unique values (with min, max, and unique_count attributes)
+            and the positions of the traces with each value are stored in
+            the index.INDEX_GROUP group of the NetCDF file, so that
+            index.find_traces and index.read_gather can find the traces
+            with a value without reading the whole header variable. The
+            min, max, and unique_count statistics are only stored for
+            these headers, not for every header that is copied, as the
+            unique values of a header are held in memory to count them.
+            It cannot be used with append or Zarr output. Default None.
+        traces: An optional (start, stop, step) tuple selecting the
+            indices of the traces to copy as a slice does (see
+            _select_traces). Default all traces.
+        select: An optional list of (name, vmin, vmax, step) tuples
+            selecting the traces to copy by the values of their headers
+            (see _select_traces). Default all traces. d or infer_dims
+            then describe the selected traces, in file order.
+        tmin: An optional float specifying the first sample of each trace
+            to copy, in the units of the trace samples dimension. Default
+            the first sample.
+        tmax: An optional float specifying the last sample of each trace
+            to copy, as for tmin. Default the last sample.
+        sample_step: An optional int N specifying that every Nth sample
+            from tmin should be copied. Default 1.
+        variable_length: An optional boolean flag indicating whether the
+            traces may have different numbers of samples. The SEG-Y file
+            is then read without segyio (see variable_length.convert):
+            the length of each trace is read from its TRACE_SAMPLE_COUNT
+            header in one pass, Samples is as long as the longest trace,
+            with the end of shorter traces set to its fill value, and the
+            length of each trace is stored in the
+            variable_length.TRACE_LENGTH_VARIABLE variable. Only
+            big-endian files can be read, and only the dimension, header,
+            compression, chunking, and output format options (and
+            max_memory, verbose, profile, and progress) can be used.
+            Default False.
+        engine: An optional string, one of ENGINES, specifying how to read
+            the trace data. 'mmap' memory-maps the file and decodes blocks
+            of traces with NumPy, which is usually faster, but is only
+            possible if the file consists of fixed-length traces in one of
+            SAMPLE_FORMAT_DTYPES; otherwise segyio is used. Default
+            'segyio'.
+        sample_dtype: An optional string, one of SAMPLE_DTYPES, specifying
+            the type to store Samples as. 'native' keeps the type of the
+            SEG-Y file's data (IBM floats become 4 byte IEEE floats), so
+            every sample is stored exactly. 'f2' (only supported by Zarr
+            output) rounds to 2 byte floats. 'i2' stores 2 byte integers
+            packed following the CF conventions: the range of the data is
+            found with an extra pass over the file, and the scale_factor
+            and add_offset attributes of Samples map it onto the range of
+            the integers (excluding the fill value). Readers such as
+            netCDF4 and xarray unpack the values when reading. Default
+            'native', or 'f4' if significant_digits or
+            least_significant_digit is provided, as only floats can be
+            quantized.
+        output_format: An optional string, one of OUTPUT_FORMATS,
+            specifying whether to write a NetCDF4 file or a Zarr store (see
+            zarr_output.ZarrDataset) to netcdf_path. A Zarr store has the
+            same variables and attributes, and is chunked with the
+            'trace' preset if chunking is not provided. If workers is more
+            than one, and the blocks of traces do not share chunks of
+            Samples, each worker process also writes the trace data of
+            the blocks it reads. Zarr output does not support append or
+            significant_digits, or the szip and bzip2 filters. Default
+            'netcdf'.
+        append: An optional boolean flag indicating whether to create the
+            slowest dimension (a Traces dimension is added if there would
+            otherwise be none) as unlimited, so that more traces can be
+            appended to it, and, if netcdf_path already exists, to append
+            the traces of the SEG-Y file to it along that dimension
+            instead of overwriting it. The other dimensions, and the trace
+            samples dimension, of the SEG-Y file must match those of the
+            NetCDF file, which keeps its header variables and file header
+            attributes. compact_headers cannot be used. Default False.
+        checkpoint: An optional boolean flag indicating whether to record
+            the index of the first trace not yet copied in the
+            CHECKPOINT_ATTRIBUTE attribute of the NetCDF file, and to
+            flush the file to disk, after each block of traces is written.
+            The attribute is removed when the conversion is complete.
+            Default False.
+        resume: An optional boolean flag indicating whether, if
+            netcdf_path has a CHECKPOINT_ATTRIBUTE attribute, to continue
+            the conversion from the recorded trace, after checking that
+            the trace headers already written match those of the SEG-Y
+            file, rather than starting again. If netcdf_path exists
+            without the attribute, it is complete, and is left unchanged.
+            Implies checkpoint. Default False.
+        profile: An optional string specifying the path of a JSON file to
+            write the time spent, bytes read and written, and peak memory
+            of each stage of the conversion to (see profiling.Profiler).
+            Default None, which does not write the report.
+        progress: An optional boolean flag indicating whether to show a
+            progress bar, with the rate in MB/s, while copying the traces.
+            It may instead be a function, which is called with the number
+            of bytes of traces copied so far and the total after each block
+            (see profiling.Progress). Default False.
+        contiguous: An optional boolean flag indicating whether to store
+            Samples and the per-trace header variables contiguously, rather
+            than in chunks, and to turn off NetCDF's pre-filling of
+            variables with their fill value, as every value is written.
+            Each block of traces (see _trace_blocks) is then one
+            contiguous range of each variable, so writes have no chunk
+            index overhead and the output is written once. It cannot be
+            used with compression, quantization, chunking, append, or Zarr
+            output. Default False.
+        chunk_cache: An optional int specifying the size, in bytes, of the
+            HDF5 chunk cache of each chunked variable of a NetCDF file
+            while it is written (see _set_chunk_cache). Default None,
+            which keeps NetCDF's default.
+        queue_depth: An optional int specifying how many blocks of traces
+            each stage of the copy pipeline may run ahead of writing (see
+            _copy_data). Reading and decoding blocks, and arranging them
+            for writing, then happen in background threads, at the same
+            time as the output is written. 0 does everything in the
+            calling thread. Default DEFAULT_QUEUE_DEPTH.
+        verify: An optional boolean flag indicating whether to check,
+            after the conversion, that the output matches the SEG-Y file
+            (see verify.verify_netcdf), using workers processes. A
+            ValueError is raised if it does not, otherwise a digest of the
+            output's content is stored in its verify.DIGEST_ATTRIBUTE
+            attribute. It cannot be used with append or variable_length.
+            Default False.
     """
+    if engine not in ENGINES:
+        raise ValueError("engine must be one of {}, not "
+                         "{}".format(", ".join(ENGINES), engine))
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("output_format must be one of {}, not "
+                         "{}".format(", ".join(OUTPUT_FORMATS),
+                                     output_format))
+    if index_headers and (append or output_format == "zarr"):
+        raise ValueError("index_headers cannot be used with append or Zarr "
+                         "output")
+    if output_format == "zarr":
+        if append:
+            raise ValueError("append cannot be used with Zarr output")
+        if chunking is None:
+            chunking = "trace"
+    compress = _compression_options(compress, compress_profile, compression,
+                                    complevel, shuffle)
+    quantize = _quantize_options(significant_digits,
+                                 least_significant_digit)
+    if sample_dtype is None:
+        sample_dtype = "f4" if quantize else "native"
+    if sample_dtype not in SAMPLE_DTYPES:
+        raise ValueError("sample_dtype must be one of {}, not "
+                         "{}".format(", ".join(SAMPLE_DTYPES), sample_dtype))
+    if sample_dtype == "f2" and output_format != "zarr":
+        raise ValueError("NetCDF does not support 2 byte floats; use i2, or "
+                         "Zarr output")
+    if contiguous:
+        if output_format == "zarr":
+            raise ValueError("contiguous cannot be used with Zarr output")
+        if compress.get("compression") or quantize:
+            raise ValueError("contiguous cannot be used with compression or "
+                             "quantization")
+        if chunking is not None:
+            raise ValueError("contiguous cannot be used with chunking")
+        if append:
+            raise ValueError("contiguous cannot be used with append, as "
+                             "unlimited dimensions must be chunked")
+    if chunk_cache is not None and output_format == "zarr":
+        raise ValueError("chunk_cache cannot be used with Zarr output")
+    if append and compact_headers:
+        raise ValueError("compact_headers cannot be used with append")
+    if verify and (append or variable_length):
+        raise ValueError("verify cannot be used with append or "
+                         "variable_length")
+    if append and (checkpoint or resume):
+        raise ValueError("checkpoint and resume cannot be used with append")
+    checkpoint = checkpoint or resume
 
     # set default name for trace samples dimension
     if not samples_dim_name:
         samples_dim_name = "SampleNumber"
 
-    with segyio.open(segy_path, ignore_geometry=True) as segy:
-        ns = len(segy.samples)
-        ntraces = segy.tracecount
+    profiler = Profiler()
+    profiler.info["segy_path"] = str(segy_path)
+    profiler.info["netcdf_path"] = str(netcdf_path)
+    if variable_length:
+        unsupported = [name for name, used in [
+            ("workers", workers > 1), ("contiguous", contiguous),
+            ("chunk_cache", chunk_cache is not None),
+            ("compact_headers", compact_headers), ("infer_dims", infer_dims),
+            ("index_headers", index_headers), ("traces", traces is not None),
+            ("select", select),
+            ("tmin, tmax, or sample_step",
+             tmin is not None or tmax is not None or sample_step),
+            ("the mmap engine", engine != "segyio"),
+            ("sample_dtype", sample_dtype not in ("native", "f4")),
+            ("append", append), ("checkpoint or resume", checkpoint)]
+            if used]
+        if unsupported:
+            raise ValueError("variable_length cannot be used with "
+                             "{}".format(", ".join(unsupported)))
+        from netcdf_segy import variable_length as vl
+        vl.convert(segy_path, netcdf_path, samples_dim_name, d, verbose,
+                   max_memory, compress, quantize, chunking, chunk_nbytes,
+                   headers, exclude_headers, output_format, profiler,
+                   progress)
+        _report_profile(profiler, netcdf_path, verbose, profile)
+        return
+
+    with profiler.stage("open"):
+        segy = segyio.open(segy_path, ignore_geometry=True)
+        records = _trace_records(segy_path, segy)
 
-        dim_names, dim_lens = _make_dim_name_len(samples_dim_name, ns, d)
-        dims_ntraces = _count_traces_in_user_dims(d)
+    with segy:
+        sample_window = _sample_window(segy, tmin, tmax, sample_step)
+        ns = len(_sample_indexes(segy, sample_window))
+        trace_ids = None
+        if traces is not None or select:
+            if verbose:
+                click.echo("selecting traces")
+            with profiler.stage("select traces") as stage:
+                trace_ids = _select_traces(segy, records, traces, select,
+                                           max_memory)
+                if select:
+                    stage.nbytes_read = segy.tracecount * TRACE_HEADER_NBYTES
+        ntraces = segy.tracecount if trace_ids is None else len(trace_ids)
+
+        coords = None
+        positions = None
+        if infer_dims:
+            if d:
+                raise ValueError("only one of d and infer_dims may be "
+                                 "specified")
+            if verbose:
+                click.echo("inferring dimensions from trace headers")
+            with profiler.stage("infer dimensions") as stage:
+                coords, positions = _infer_dims(segy, records, infer_dims,
+                                                max_memory, trace_ids)
+                stage.nbytes_read = ntraces * TRACE_HEADER_NBYTES
+            d = tuple((name, len(c)) for name, c in zip(infer_dims, coords))
+            dim_names, dim_lens = _make_dim_name_len(samples_dim_name, ns, d)
+            fill_missing = ntraces < _count_traces_in_user_dims(d)
+        else:
+            dim_names, dim_lens = _make_dim_name_len(samples_dim_name, ns, d)
+            dims_ntraces = _count_traces_in_user_dims(d)
 
-        _check_user_dims(dims_ntraces, ntraces)
+            _check_user_dims(dims_ntraces, ntraces)
 
-        _fill_missing_dims(dims_ntraces, ntraces, dim_names, dim_lens)
+            _fill_missing_dims(dims_ntraces, ntraces, dim_names, dim_lens)
+            fill_missing = False
+            if trace_ids is not None:
+                # The selected traces fill the dimensions in order
+                positions = np.full(segy.tracecount, -1, np.int64)
+                positions[trace_ids] = np.arange(ntraces)
+                coords = [_dim_coordinates(segy, records, name, dim_names,
+                                           dim_lens, trace_ids)
+                          if name in segyio.tracefield.keys else None
+                          for name in dim_names[:-1]]
+        if append and len(dim_names) == 1:
+            # There must be a trace dimension to append along
+            dim_names.insert(0, "Traces")
+            dim_lens.insert(0, ntraces)
+
+        fields = _select_header_fields(headers, exclude_headers)
+        fields = [field for field in fields if field not in dim_names]
+        header_constants = {}
+        if compact_headers:
+            if verbose:
+                click.echo("scanning trace headers")
+            with profiler.stage("header stats") as stage:
+                stats = _header_stats(segy, records, fields, max_memory)
+                stage.nbytes_read = ntraces * TRACE_HEADER_NBYTES
+            if sample_window is not None:
+                window_stats = dict((name, np.array(stats[name]))
+                                    for name in WINDOW_HEADERS
+                                    if name in stats)
+                _window_trace_headers(window_stats, segy, sample_window)
+                stats.update((name, tuple(int(v) for v in values))
+                             for name, values in window_stats.items())
+            header_dtypes, header_constants = _compact_header_dtypes(
+                stats, fill_missing)
+        else:
+            header_dtypes = dict((field, "i4") for field in fields)
+
+        if engine == "mmap" and (records is None
+                                 or _sample_dtype(segy) is None):
+            if verbose:
+                click.echo("cannot memory-map trace data; using segyio")
+            engine = "segyio"
+
+        offset = 0
+        start_trace = 0
+        if resume and os.path.exists(str(netcdf_path)):
+            with profiler.stage("dimensions"):
+                rootgrp = _open_output(netcdf_path, "a", output_format)
+                if CHECKPOINT_ATTRIBUTE not in rootgrp.ncattrs():
+                    rootgrp.close()
+                    if verbose:
+                        click.echo("{} is already complete".format(
+                            netcdf_path))
+                    return
+                try:
+                    start_trace = _check_resume(segy, rootgrp, dim_names,
+                                                dim_lens, sample_window)
+                except ValueError:
+                    rootgrp.close()
+                    raise
+                variables = list(rootgrp.variables.values())
+            if verbose:
+                click.echo("resuming from trace {}".format(start_trace))
+        elif append and os.path.exists(str(netcdf_path)):
+            if verbose:
+                click.echo("appending to {}".format(netcdf_path))
+            with profiler.stage("dimensions"):
+                rootgrp = Dataset(netcdf_path, "a")
+                try:
+                    offset = _check_append(segy, rootgrp, dim_names,
+                                           dim_lens, sample_window)
+                except ValueError:
+                    rootgrp.close()
+                    raise
+                variables = list(rootgrp.variables.values())
+        else:
+            samples_dtype = segy.dtype if sample_dtype == "native" else \
+                np.dtype(sample_dtype)
+            if quantize and samples_dtype.kind != "f":
+                raise ValueError("only floats can be quantized, not the {} "
+                                 "sample_dtype".format(sample_dtype))
+            packing = None
+            if sample_dtype == "i2":
+                if verbose:
+                    click.echo("finding the range of the trace data")
+                with profiler.stage("sample range") as stage:
+                    vmin, vmax = _sample_range(segy, records, engine,
+                                               max_memory, trace_ids,
+                                               sample_window)
+                    stage.nbytes_read = ntraces * ns * segy.dtype.itemsize
+                packing = _packing_attributes(vmin, vmax, samples_dtype,
+                                              segy.dtype)
+            indexes = {}
+            if index_headers:
+                if verbose:
+                    click.echo("indexing trace headers")
+                with profiler.stage("index headers") as stage:
+                    indexes = _index_headers(segy, records, index_headers,
+                                             max_memory, trace_ids,
+                                             positions)
+                    stage.nbytes_read = ntraces * TRACE_HEADER_NBYTES
+            with profiler.stage("dimensions"):
+                rootgrp = _open_output(netcdf_path, "w", output_format)
+                _create_dimensions(dim_names, dim_lens, rootgrp, append)
+            with profiler.stage("variables"):
+                variables = _create_variables(rootgrp, dim_names, compress,
+                                              chunking, chunk_nbytes,
+                                              quantize, header_dtypes,
+                                              fill_missing, dim_lens,
+                                              samples_dtype, packing,
+                                              contiguous)
+                if contiguous:
+                    rootgrp.set_fill_off()
+            with profiler.stage("attributes") as stage:
+                _set_attributes(segy, rootgrp, sample_window)
+                for name, value in header_constants.items():
+                    rootgrp.setncattr(name, value)
+                if checkpoint:
+                    rootgrp.setncattr(CHECKPOINT_ATTRIBUTE, 0)
+                stage.nbytes_read = (TEXT_HEADER_NBYTES
+                                     + BINARY_HEADER_NBYTES
+                                     + segy.ext_headers * TEXT_HEADER_NBYTES)
+            for name in index_headers or []:
+                with profiler.stage("write index " + name) as stage:
+                    write_index(rootgrp, name, indexes[name])
+                    stage.nbytes_written = sum(
+                        values.nbytes for values in indexes[name].values())
+        if chunk_cache is not None:
+            _set_chunk_cache(variables, chunk_cache)
+        try:
+            _copy_data(segy, variables, dim_names, dim_lens, verbose,
+                       max_memory, records, workers, segy_path, coords,
+                       positions, engine, profiler, progress, offset,
+                       checkpoint, start_trace, queue_depth, sample_window)
+            if checkpoint:
+                rootgrp.delncattr(CHECKPOINT_ATTRIBUTE)
+        finally:
+            with profiler.stage("close"):
+                rootgrp.close()
 
-        rootgrp = Dataset(netcdf_path, "w", format="NETCDF4")
-        _create_dimensions(dim_names, dim_lens, rootgrp)
-        variables = _create_variables(rootgrp, dim_names, compress)
-        _set_attributes(segy, rootgrp)
-        _copy_data(segy, variables, dim_names, dim_lens, verbose)
+    if verify:
+        from netcdf_segy.verify import verify_netcdf
+        if verbose:
+            click.echo("verifying {}".format(netcdf_path))
+        with profiler.stage("verify"):
+            result = verify_netcdf(segy_path, netcdf_path, samples_dim_name,
+                                   infer_dims, traces, select, tmin, tmax,
+                                   sample_step, max_memory, workers,
+                                   write_digest=True)
+        if result["mismatches"]:
+            raise ValueError("{} does not match {}: {}".format(
+                netcdf_path, segy_path, "; ".join(result["mismatches"])))
+    _report_profile(profiler, netcdf_path, verbose, profile)
 
-        rootgrp.close()
+
+def _report_profile(profiler, netcdf_path, verbose=False, profile=None):
+    """Print the profiler's summary if verbose, and write it to profile."""
+    if verbose:
+        for line in profiler.summary():
+            click.echo(line)
+    if profile:
+        profiler.info["output_bytes"] = _output_nbytes(netcdf_path)
+        profiler.write(profile)
+
+
+def _open_output(path, mode, output_format="netcdf"):
+    """Open the output, as a netCDF4 Dataset or a ZarrDataset."""
+    if output_format == "zarr":
+        return ZarrDataset(path, mode)
+    if mode == "w":
+        return Dataset(path, mode, format="NETCDF4")
+    return Dataset(path, mode)
+
+
+def _output_nbytes(path):
+    """Get the size, in bytes, of the output file or store."""
+    path = str(path)
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for directory, _, names in os.walk(path) for name in names)
 
 
 def _make_dim_name_len(samples_dim_name, ns, d):
@@ -160,113 +1006,1623 @@ def _fill_missing_dims(dims_ntraces, ntraces, dim_names, dim_lens):
         dim_lens.insert(0, int(ntraces / dims_ntraces))
 
 
-def _create_dimensions(dim_names, dim_lens, rootgrp):
-    """Create the dimensions in the NetCDF file."""
-    for dim in zip(dim_names, dim_lens):
-        rootgrp.createDimension(dim[0], dim[1])
+def _sample_window(segy, tmin=None, tmax=None, step=None):
+    """Choose the samples of each trace to copy.
+
+    Args:
+        segy: The SEG-Y file opened with segyio
+        tmin: An optional float specifying the first sample to copy, in the
+            units of the trace samples dimension (see
+            segyio.sample_indexes). Default the first sample.
+        tmax: An optional float specifying the last sample to copy, as
+            for tmin. Default the last sample.
+        step: An optional int N, specifying that every Nth sample from
+            tmin should be copied. Default 1.
+
+    Returns:
+        A slice of the sample indices, or None if every sample is copied
+    """
+    if step is not None and step < 1:
+        raise ValueError("sample_step must be at least 1")
+    if tmin is None and tmax is None and step in (None, 1):
+        return None
+    indexes = _sample_indexes(segy)
+    start = 0
+    stop = len(indexes)
+    if tmin is not None:
+        start = int(np.searchsorted(indexes, tmin, "left"))
+    if tmax is not None:
+        stop = int(np.searchsorted(indexes, tmax, "right"))
+    if start >= stop:
+        raise ValueError("no samples between tmin {} and tmax "
+                         "{}".format(tmin, tmax))
+    return slice(start, stop, step or 1)
+
+
+def _window_nsamples(segy, sample_window):
+    """Return the number of samples of each trace in sample_window."""
+    return len(range(*sample_window.indices(len(segy.samples))))
 
 
-def _create_variables(rootgrp, dim_names, compress):
+def _window_trace_headers(headers, segy, sample_window):
+    """Make trace headers describe only the samples in sample_window.
+
+       The WINDOW_HEADERS (the number of samples and the sample interval)
+       of headers, a mapping from header name to a NumPy array of its
+       values (see _read_block), are replaced in place.
+    """
+    if isinstance(headers, np.ndarray):
+        names = headers.dtype.names
+    else:
+        names = headers
+    if "TRACE_SAMPLE_COUNT" in names:
+        headers["TRACE_SAMPLE_COUNT"] = np.full(
+            np.shape(headers["TRACE_SAMPLE_COUNT"]),
+            _window_nsamples(segy, sample_window),
+            np.asarray(headers["TRACE_SAMPLE_COUNT"]).dtype)
+    if "TRACE_SAMPLE_INTERVAL" in names:
+        headers["TRACE_SAMPLE_INTERVAL"] = (
+            headers["TRACE_SAMPLE_INTERVAL"] * sample_window.step)
+
+
+def _sample_indexes(segy, sample_window=None):
+    """Return the values of the trace samples dimension.
+
+       These are segyio.sample_indexes, as 4 byte floats, of the samples
+       in sample_window (see _sample_window) if it is provided.
+    """
+    indexes = np.array(segyio.sample_indexes(segy), np.float32)
+    if sample_window is None:
+        return indexes
+    return indexes[sample_window]
+
+
+def _select_traces(segy, records, traces=None, select=(), max_memory=None):
+    """Find the traces to copy, by their indices and header values.
+
+       The headers in select are read from the traces in range in one pass.
+
+    Args:
+        segy: The SEG-Y file opened with segyio
+        records: The traces of the file (see _trace_records), or None
+        traces: An optional (start, stop, step) tuple selecting trace
+            indices as a slice does. Any of them may be None. Default all
+            traces.
+        select: An optional list of (name, vmin, vmax, step) tuples. A
+            trace is selected if the value v of the header called name
+            satisfies vmin <= v <= vmax and (v - vmin) is a multiple of
+            step. vmin, vmax, and step may be None for no lower limit, no
+            upper limit, and a step of 1 (from 0 if vmin is None).
+        max_memory: An optional int specifying the approximate maximum
+            number of bytes of trace headers to read at once
+
+    Returns:
+        A sorted NumPy int64 array of the indices of the selected traces
+    """
+    if traces is None:
+        traces = (None, None, None)
+    trace_ids = np.arange(segy.tracecount, dtype=np.int64)[slice(*traces)]
+    if trace_ids[1:].size and trace_ids[1] < trace_ids[0]:
+        trace_ids = trace_ids[::-1]
+    for name, _, _, step in select:
+        _get_header_field(name)
+        if step is not None and step < 1:
+            raise ValueError("the step of {} must be at least "
+                             "1".format(name))
+    if select:
+        if max_memory is None:
+            max_memory = DEFAULT_MAX_MEMORY
+        block_ntraces = max(1, max_memory // TRACE_HEADER_NBYTES)
+        names = [name for name, _, _, _ in select]
+        keep = []
+        for start in range(0, len(trace_ids), block_ntraces):
+            block_ids = trace_ids[start:start + block_ntraces]
+            headers = _read_block_headers(segy, records, 0, 0, names,
+                                          block_ids)
+            block_keep = np.ones(len(block_ids), bool)
+            for name, vmin, vmax, step in select:
+                values = np.asarray(headers[name], np.int64)
+                if vmin is not None:
+                    block_keep &= values >= vmin
+                if vmax is not None:
+                    block_keep &= values <= vmax
+                if step not in (None, 1):
+                    block_keep &= (values - (vmin or 0)) % step == 0
+            keep.append(block_keep)
+        trace_ids = trace_ids[np.concatenate(keep or [np.zeros(0, bool)])]
+    if not len(trace_ids):
+        raise ValueError("no traces are selected")
+    return trace_ids
+
+
+def _selected_blocks(ntraces, block_ntraces, trace_ids=None):
+    """Split the traces, or only those in trace_ids, into blocks.
+
+    Yields:
+        (start, stop, block_ids) tuples, suitable for _read_block: the
+        block is traces start to stop - 1 if block_ids is None, or the
+        traces in block_ids
+    """
+    if trace_ids is None:
+        for start in range(0, ntraces, block_ntraces):
+            yield start, min(start + block_ntraces, ntraces), None
+    else:
+        for start in range(0, len(trace_ids), block_ntraces):
+            yield 0, 0, trace_ids[start:start + block_ntraces]
+
+
+def _infer_dims(segy, records, names, max_memory=None, trace_ids=None):
+    """Make dimensions from the values of trace headers.
+
+       The requested headers are read from every trace (or every trace in
+       trace_ids) in one pass.
+
+    Args:
+        segy: The SEG-Y file opened with segyio
+        records: The traces of the file (see _trace_records), or None
+        names: A list of the names of the headers to use as dimensions, in
+            slowest to fastest order
+        max_memory: An optional int specifying the approximate maximum
+            number of bytes of trace headers to read at once
+        trace_ids: An optional sorted array of the indices of the traces
+            to use (see _select_traces). Default all traces.
+
+    Returns:
+        coords: A list containing, for each dimension, a NumPy array of the
+            sorted unique values of its header
+        positions: A NumPy array containing, for each trace, the index of its
+            position in the flattened (C order) grid of the dimensions, or
+            -1 if the trace is not in trace_ids
+    """
+    for name in _select_header_fields(names):
+        if names.count(name) > 1:
+            raise ValueError("{} is repeated in infer_dims".format(name))
+    if max_memory is None:
+        max_memory = DEFAULT_MAX_MEMORY
+    block_ntraces = max(1, max_memory // TRACE_HEADER_NBYTES)
+    values = dict((name, []) for name in names)
+    for start, stop, block_ids in _selected_blocks(segy.tracecount,
+                                                   block_ntraces, trace_ids):
+        headers = _read_block_headers(segy, records, start, stop, names,
+                                      block_ids)
+        for name in names:
+            values[name].append(np.array(headers[name]))
+    coords = []
+    grid_idxs = []
+    for name in names:
+        name_values = np.concatenate(values[name] or [np.zeros(0, int)])
+        name_coords, grid_idx = np.unique(name_values, return_inverse=True)
+        coords.append(name_coords)
+        grid_idxs.append(grid_idx.reshape(-1))
+    positions = np.ravel_multi_index(grid_idxs,
+                                     [len(c) for c in coords])
+    if len(np.unique(positions)) < len(positions):
+        raise ValueError(
+            "multiple traces have the same values of {}; another header "
+            "may be needed to distinguish them".format(", ".join(names))
+        )
+    if trace_ids is not None:
+        all_positions = np.full(segy.tracecount, -1, positions.dtype)
+        all_positions[trace_ids] = positions
+        positions = all_positions
+    return coords, positions
+
+
+def _create_dimensions(dim_names, dim_lens, rootgrp, unlimited=False):
+    """Create the dimensions in the NetCDF file.
+
+       If unlimited is True, the first (slowest) dimension is created as
+       unlimited, so that it can be appended to.
+    """
+    for i, dim in enumerate(zip(dim_names, dim_lens)):
+        if unlimited and i == 0:
+            rootgrp.createDimension(dim[0], None)
+        else:
+            rootgrp.createDimension(dim[0], dim[1])
+
+
+def _check_append(segy, rootgrp, dim_names, dim_lens, sample_window=None):
+    """Check that the traces of a SEG-Y file can be appended to a NetCDF file.
+
+       The slowest dimension of the NetCDF file must be unlimited, and the
+       SEG-Y file must have the same dimensions, with the same lengths
+       (apart from the slowest), and the same trace sample indices (in
+       sample_window, if provided; see _sample_window).
+
+    Returns:
+        An int specifying the current length of the slowest dimension,
+        which is the index that the SEG-Y file's traces are appended at
+    """
+    _check_dimensions(segy, rootgrp, dim_names, dim_lens, "append",
+                      sample_window)
+    slowest = rootgrp.dimensions[dim_names[0]]
+    if not slowest.isunlimited():
+        raise ValueError("cannot append: the {} dimension of the NetCDF "
+                         "file is not unlimited".format(dim_names[0]))
+    return len(slowest)
+
+
+def _check_resume(segy, rootgrp, dim_names, dim_lens, sample_window=None):
+    """Check that a conversion to a NetCDF file can be resumed.
+
+       The NetCDF file must have been made with checkpoint (see
+       _copy_data), and have the same dimensions, with the same lengths, and
+       the same trace sample indices (in sample_window, if provided), as
+       the SEG-Y file.
+
+    Returns:
+        An int specifying the index of the first trace that was not copied
+    """
+    if CHECKPOINT_ATTRIBUTE not in rootgrp.ncattrs():
+        raise ValueError("cannot resume: the NetCDF file does not have a "
+                         "{} attribute".format(CHECKPOINT_ATTRIBUTE))
+    _check_dimensions(segy, rootgrp, dim_names, dim_lens, "resume",
+                      sample_window)
+    slowest = rootgrp.dimensions[dim_names[0]]
+    if len(slowest) != dim_lens[0]:
+        raise ValueError("cannot resume: the {} dimension has length {} in "
+                         "the SEG-Y file but {} in the NetCDF "
+                         "file".format(dim_names[0], dim_lens[0],
+                                       len(slowest)))
+    return int(rootgrp.getncattr(CHECKPOINT_ATTRIBUTE))
+
+
+def _check_dimensions(segy, rootgrp, dim_names, dim_lens, action,
+                      sample_window=None):
+    """Check that a NetCDF file has the dimensions of the SEG-Y file.
+
+       The lengths of all of the dimensions, apart from the slowest, and the
+       trace sample indices (in sample_window, if provided) must match.
+       action is a string describing what is being checked for, to use in
+       error messages.
+    """
+    if "Samples" not in rootgrp.variables:
+        raise ValueError("cannot {}: the NetCDF file does not have a "
+                         "Samples variable; was it made by "
+                         "segy2netcdf?".format(action))
+    file_dim_names = list(rootgrp["Samples"].dimensions)
+    if file_dim_names != list(dim_names):
+        raise ValueError("cannot {}: the dimensions {} do not match the "
+                         "NetCDF file's dimensions "
+                         "{}".format(action, dim_names, file_dim_names))
+    for name, length in zip(dim_names[1:], dim_lens[1:]):
+        if len(rootgrp.dimensions[name]) != length:
+            raise ValueError("cannot {}: the {} dimension has length {} in "
+                             "the SEG-Y file but {} in the NetCDF "
+                             "file".format(action, name, length,
+                                           len(rootgrp.dimensions[name])))
+    sample_indexes = _sample_indexes(segy, sample_window)
+    if not np.array_equal(rootgrp[dim_names[-1]][:], sample_indexes):
+        raise ValueError("cannot {}: the trace sample indices do not match "
+                         "those of the NetCDF file".format(action))
+
+
+def _create_variables(rootgrp, dim_names, compress, chunking=None,
+                      chunk_nbytes=None, quantize=None, header_dtypes=None,
+                      fill_missing=False, dim_lens=None, samples_dtype="f4",
+                      packing=None, contiguous=False):
     """Create variables in the NetCDF file.
 
        The trace data, Time/Depth dimension, and trace headers, are all
-       created as variables.
+       created as variables. compress may be a boolean flag or a dictionary
+       of compression options (see _compression_options), and quantize is
+       an optional dictionary of quantization options applied to the trace
+       data (see _quantize_options). header_dtypes is an optional dictionary
+       from the names of the per-trace header variables to create to their
+       types (default all headers, as i4). If fill_missing is True, the
+       variables with one value per trace are given an explicit _FillValue
+       (NetCDF's default for their type) to mark missing traces. dim_lens
+       is an optional list of the lengths of the dimensions to use when
+       choosing chunk shapes, which is needed if a dimension is unlimited
+       (default the current lengths of the dimensions). samples_dtype is
+       the type of the trace data, and packing an optional dictionary of
+       the scale_factor and add_offset attributes to give it (see
+       _packing_attributes). If contiguous is True, the trace data and
+       per-trace header variables are stored contiguously rather than in
+       chunks, which requires that they are not compressed.
     """
+    if not isinstance(compress, dict):
+        compress = _compression_options(compress)
+    if quantize is None:
+        quantize = {}
+    if dim_lens is None:
+        dim_lens = [len(rootgrp.dimensions[name]) for name in dim_names]
+    if chunking is not None and chunking not in CHUNKING_PRESETS:
+        chunking = _check_chunking(chunking, dim_names)
+    samples_dtype = np.dtype(samples_dtype)
+    if contiguous:
+        layout = {"contiguous": True}
+    else:
+        layout = {"chunksizes": _chunk_shape(dim_lens, samples_dtype.itemsize,
+                                             chunking, chunk_nbytes)}
     variables = []
     # Trace data
     variables.append(
-        rootgrp.createVariable("Samples", "f4", tuple(dim_names), zlib=compress)
+        rootgrp.createVariable(
+            "Samples", samples_dtype, tuple(dim_names),
+            fill_value=_fill_value(samples_dtype, fill_missing),
+            **dict(compress, **dict(quantize, **layout))
+        )
     )
+    for name, value in (packing or {}).items():
+        variables[-1].setncattr(name, value)
     # Time/Depth dimension
     variables.append(
-        rootgrp.createVariable(dim_names[-1], "f4", dim_names[-1], zlib=compress)
+        rootgrp.createVariable(dim_names[-1], "f4", dim_names[-1], **compress)
     )
     # Other dimensions
-    variables += _create_traceheader_variables(rootgrp, dim_names, compress)
+    variables += _create_traceheader_variables(rootgrp, dim_names, compress,
+                                               chunking, chunk_nbytes,
+                                               header_dtypes, fill_missing,
+                                               dim_lens, contiguous)
     return variables
 
 
-def _create_traceheader_variables(rootgrp, dim_names, compress):
+def _create_traceheader_variables(rootgrp, dim_names, compress, chunking=None,
+                                  chunk_nbytes=None, header_dtypes=None,
+                                  fill_missing=False, dim_lens=None,
+                                  contiguous=False):
     """Create NetCDF variables for each trace header field.
 
        Fields that are used as dimensions are only the length of that
-       dimension, others have one entry for every trace.
+       dimension, others have one entry for every trace. If header_dtypes is
+       provided, only fields that are dimensions or are in it are created,
+       with the types that it specifies. dim_lens and contiguous are as in
+       _create_variables.
     """
-    fields = [
-        attr
-        for attr in dir(segyio.TraceField)
-        if not callable(getattr(segyio.TraceField, attr)) and not attr.startswith("__")
-    ]
+    if not isinstance(compress, dict):
+        compress = _compression_options(compress)
+    fields = _select_header_fields()
+    if dim_lens is None:
+        dim_lens = [len(rootgrp.dimensions[name]) for name in dim_names]
+    trace_dim_lens = list(dim_lens[:-1])
+    if chunking is None or chunking in CHUNKING_PRESETS:
+        # Header variables are usually read whole, so only chunk them to
+        # keep each chunk near the target size
+        header_chunking = chunking and "trace"
+    else:
+        header_chunking = _check_chunking(chunking, dim_names)[:-1]
+    if contiguous:
+        layout = {"contiguous": True}
+    else:
+        layout = {"chunksizes": _chunk_shape(trace_dim_lens, 4,
+                                             header_chunking, chunk_nbytes)}
     variables = []
     for field in fields:
         # for variables that are dimensions of the dataset, they should be the
         # size of their dimension. All others should be the size of the dataset
         # (excluding the trace samples dimension)
         if field in dim_names:
-            variables.append(rootgrp.createVariable(field, "i4", field, zlib=compress))
-        else:
+            variables.append(rootgrp.createVariable(field, "i4", field, **compress))
+        elif header_dtypes is None or field in header_dtypes:
+            dtype = "i4" if header_dtypes is None else header_dtypes[field]
             variables.append(
                 rootgrp.createVariable(
-                    field, "i4", tuple(dim_names[:-1]), zlib=compress
+                    field, dtype, tuple(dim_names[:-1]),
+                    fill_value=_fill_value(dtype, fill_missing),
+                    **dict(compress, **layout)
                 )
             )
 
     return variables
 
 
-def _set_attributes(segy, rootgrp):
+def _set_chunk_cache(variables, nbytes):
+    """Set the size of the HDF5 chunk cache of each chunked variable.
+
+       A chunk that a block of traces only partly covers stays in the
+       cache until the next block completes it; if it is evicted first, it
+       is written (and compressed) more than once. Chunks are only written
+       once, so fully written chunks are evicted first (preemption 1).
+    """
+    for v in variables:
+        if v.chunking() != "contiguous":
+            v.set_var_chunk_cache(size=nbytes, preemption=1.0)
+
+
+def _fill_value(dtype, fill_missing):
+    """Get the fill value to set for a variable of the given type.
+
+       None, which leaves the choice to NetCDF, is returned if fill_missing
+       is False. NetCDF has no default for 2 byte floats (which only Zarr
+       output supports), so NaN is used for them.
+    """
+    if not fill_missing:
+        return None
+    return netCDF4.default_fillvals.get(np.dtype(dtype).str[1:], np.nan)
+
+
+def _select_header_fields(headers=None, exclude_headers=()):
+    """Make a list of the names of the trace headers to copy.
+
+       All segyio.TraceField names are used if headers is None, excluding
+       any in exclude_headers.
+    """
+    fields = _header_fields()
+    for name in list(headers or []) + list(exclude_headers):
+        if name not in segyio.tracefield.keys:
+            raise ValueError("{} is not a trace header name".format(name))
+    if headers is not None:
+        headers = set(headers)
+        fields = [field for field in fields if field in headers]
+    exclude_headers = set(exclude_headers)
+    return [field for field in fields if field not in exclude_headers]
+
+
+@functools.lru_cache(maxsize=None)
+def _header_fields():
+    """Get the names of all of the segyio.TraceField trace headers.
+
+       They are in alphabetical order (the order of dir(segyio.TraceField),
+       which header variables have always been created in). The table is
+       made once, rather than by inspecting segyio.TraceField for every
+       file.
+    """
+    return tuple(sorted(segyio.tracefield.keys))
+
+
+def _header_stats(segy, records, names, max_memory=None):
+    """Find the minimum and maximum of trace header fields in one pass.
+
+    Returns:
+        A dictionary from header name to a (min, max) tuple of ints. Headers
+        of a file with no traces are given (0, 0).
+    """
+    if max_memory is None:
+        max_memory = DEFAULT_MAX_MEMORY
+    stats = dict((name, (0, 0)) for name in names)
+    if not names:
+        return stats
+    block_ntraces = max(1, max_memory // TRACE_HEADER_NBYTES)
+    for start in range(0, segy.tracecount, block_ntraces):
+        stop = min(start + block_ntraces, segy.tracecount)
+        headers = _read_trace_headers(segy, records, start, stop, names)
+        for name in names:
+            values = headers[name]
+            block_min = int(values.min())
+            block_max = int(values.max())
+            if start > 0:
+                block_min = min(block_min, stats[name][0])
+                block_max = max(block_max, stats[name][1])
+            stats[name] = (block_min, block_max)
+    return stats
+
+
+def _compact_header_dtypes(stats, fill_missing=False):
+    """Choose how to store trace headers, given their (min, max) stats.
+
+       If fill_missing is True, types whose fill value (see _fill_value) is
+       within the range of a header are not chosen for it.
+
+    Returns:
+        header_dtypes: A dictionary from the name of each header that varies
+            between traces to the smallest integer type that holds its values
+        header_constants: A dictionary from the name of each header that has
+            the same value in every trace to that value
+    """
+    header_dtypes = {}
+    header_constants = {}
+    for name, (vmin, vmax) in stats.items():
+        if vmin == vmax:
+            header_constants[name] = np.int32(vmin)
+            continue
+        for dtype in ("i1", "i2", "i4"):
+            info = np.iinfo(dtype)
+            vmin_allowed = info.min
+            if fill_missing:
+                vmin_allowed = _fill_value(dtype, fill_missing) + 1
+            if vmin_allowed <= vmin and vmax <= info.max:
+                header_dtypes[name] = dtype
+                break
+        else:
+            header_dtypes[name] = "i4"
+    return header_dtypes, header_constants
+
+
+def _index_headers(segy, records, names, max_memory=None, trace_ids=None,
+                   positions=None):
+    """Read trace headers in one pass and make an index of each.
+
+       Only the headers in names are read, so the statistics stored with
+       the indexes (see index.write_index) are only of these headers.
+
+    Args:
+        segy: The SEG-Y file opened with segyio
+        records: The traces of the file (see _trace_records), or None
+        names: A list of the names of the headers to index
+        max_memory: An optional int specifying the approximate maximum
+            number of bytes of trace headers to read at once
+        trace_ids: An optional sorted array of the indices of the traces
+            to index (see _select_traces). Default all traces.
+        positions: The position of each trace (see _infer_dims), or None
+            if the traces are in order
+
+    Returns:
+        A dictionary from header name to its index (see
+        index.build_index)
+    """
+    for name in names:
+        _get_header_field(name)
+        if names.count(name) > 1:
+            raise ValueError("{} is repeated in index_headers".format(name))
+    if max_memory is None:
+        max_memory = DEFAULT_MAX_MEMORY
+    block_ntraces = max(1, max_memory // TRACE_HEADER_NBYTES)
+    values = dict((name, []) for name in names)
+    for start, stop, block_ids in _selected_blocks(segy.tracecount,
+                                                   block_ntraces, trace_ids):
+        headers = _read_block_headers(segy, records, start, stop, names,
+                                      block_ids)
+        for name in names:
+            values[name].append(np.asarray(headers[name], np.int32))
+    if positions is None:
+        ntraces = segy.tracecount if trace_ids is None else len(trace_ids)
+        positions = np.arange(ntraces)
+    else:
+        positions = positions[positions >= 0]
+    return dict((name, build_index(np.concatenate(values[name]
+                                                   or [np.zeros(0, int)]),
+                                    positions))
+                for name in names)
+
+
+def _sample_range(segy, records, engine="segyio", max_memory=None,
+                  trace_ids=None, sample_window=None):
+    """Find the minimum and maximum of the trace data in one pass.
+
+       The traces (only those in trace_ids, and the samples in
+       sample_window, if provided) are read in blocks of about max_memory
+       bytes, and values that are not finite are ignored.
+
+    Returns:
+        A (min, max) tuple of floats, which is (0.0, 0.0) if there are no
+        finite values
+    """
+    if max_memory is None:
+        max_memory = DEFAULT_MAX_MEMORY
+    trace_nbytes = max(1, len(segy.samples) * segy.dtype.itemsize)
+    block_ntraces = max(1, max_memory // trace_nbytes)
+    vmin = np.inf
+    vmax = -np.inf
+    for start, stop, block_ids in _selected_blocks(segy.tracecount,
+                                                   block_ntraces, trace_ids):
+        samples, _ = _read_block(segy, records, start, stop, [], block_ids,
+                                 engine, sample_window)
+        if samples.dtype.kind == "f":
+            samples = samples[np.isfinite(samples)]
+        if samples.size:
+            vmin = min(vmin, float(samples.min()))
+            vmax = max(vmax, float(samples.max()))
+    if vmin > vmax:
+        return 0.0, 0.0
+    return vmin, vmax
+
+
+def _packing_attributes(vmin, vmax, dtype="i2", unpacked_dtype="f4"):
+    """Choose the scale_factor and add_offset to pack values into integers.
+
+       Following the CF conventions, a value v is stored as
+       round((v - add_offset) / scale_factor). add_offset is the middle of
+       the range vmin to vmax, and scale_factor maps the range onto the
+       integers of dtype between -max and max, so that its smallest value
+       (NetCDF's default fill value) is not used. The scale_factor is
+       chosen after add_offset is rounded to the type of the attributes,
+       so that the whole range still fits.
+
+    Args:
+        vmin, vmax: Floats specifying the range of the values to pack
+        dtype: An optional NumPy integer type to pack into. Default i2.
+        unpacked_dtype: An optional NumPy type of the values. The
+            attributes have this type if it is a float, as CF requires,
+            otherwise they are 4 byte floats. Default f4.
+
+    Returns:
+        A dictionary with the scale_factor and add_offset attributes
+    """
+    nsteps = np.iinfo(dtype).max - 1
+    attr_type = np.dtype(unpacked_dtype).type
+    if np.dtype(unpacked_dtype).kind != "f":
+        attr_type = np.float32
+    add_offset = attr_type((vmin + vmax) / 2)
+    half_range = max(vmax - float(add_offset), float(add_offset) - vmin)
+    scale_factor = attr_type(1)
+    if half_range > 0:
+        scale_factor = attr_type(half_range / nsteps)
+        if float(scale_factor) * nsteps < half_range:
+            scale_factor = np.nextafter(scale_factor, attr_type(np.inf))
+    return collections.OrderedDict([
+        ("scale_factor", scale_factor),
+        ("add_offset", add_offset),
+    ])
+
+
+def _pack_samples(samples, scale_factor, add_offset, dtype,
+                  fill_value=None):
+    """Pack trace data into integers (see _packing_attributes).
+
+       Masked values, and values that are not finite, are returned masked,
+       or replaced by fill_value if it is provided (as netCDF4 only fills
+       masked values itself when it also packs them).
+
+    Raises:
+        ValueError: If a value is outside the range that can be packed,
+            which can happen when appending to a file whose packing was
+            chosen for another SEG-Y file
+    """
+    info = np.iinfo(dtype)
+    packed = np.ma.masked_invalid(
+        (np.asarray(samples, np.float64) - float(add_offset))
+        / float(scale_factor))
+    if np.ma.isMaskedArray(samples):
+        packed[np.ma.getmaskarray(samples)] = np.ma.masked
+    packed = np.ma.round(packed)
+    if packed.count() and (packed.min() < -info.max
+                           or packed.max() > info.max):
+        raise ValueError("trace data is outside the range that the "
+                         "scale_factor and add_offset of Samples can pack")
+    packed = np.ma.masked_array(packed.filled(0).astype(dtype),
+                                np.ma.getmaskarray(packed))
+    if fill_value is not None:
+        return packed.filled(fill_value)
+    return packed
+
+
+def _compression_options(compress=False, compress_profile=None,
+                         compression=None, complevel=None, shuffle=None):
+    """Make the compression keyword arguments for createVariable.
+
+       Compression is used if compress is True or any of compress_profile,
+       compression, or complevel are provided.
+
+    Returns:
+        A dictionary of keyword arguments for netCDF4's createVariable
+    """
+    if not (compress or compress_profile or compression
+            or complevel is not None):
+        return {"compression": None}
+    profile_level = None
+    if compress_profile is not None:
+        if compress_profile not in COMPRESS_PROFILES:
+            raise ValueError(
+                "compress_profile must be one of {}, not "
+                "{}".format(", ".join(sorted(COMPRESS_PROFILES)),
+                            compress_profile)
+            )
+        for profile_compression, level in COMPRESS_PROFILES[compress_profile]:
+            if compression in (None, profile_compression) and \
+                    _compression_available(profile_compression):
+                compression = profile_compression
+                profile_level = level
+                break
+    if compression is None:
+        compression = "zlib"
+    if compression not in COMPRESSION_FILTERS:
+        raise ValueError(
+            "compression must be one of {}, not "
+            "{}".format(", ".join(COMPRESSION_FILTERS), compression)
+        )
+    if not _compression_available(compression):
+        raise ValueError(
+            "{} compression is not supported by the installed netCDF4 "
+            "library".format(compression)
+        )
+    if complevel is None:
+        complevel = 4 if profile_level is None else profile_level
+    if shuffle is None:
+        shuffle = True
+    return {"compression": compression, "complevel": complevel,
+            "shuffle": shuffle}
+
+
+def _compression_available(compression):
+    """Check whether the installed netCDF4 library supports a filter."""
+    if compression == "zlib":
+        return True
+    if compression.startswith("blosc"):
+        flag = "__has_blosc_support__"
+    else:
+        flag = {"szip": "__has_szip_support__",
+                "zstd": "__has_zstandard_support__",
+                "bzip2": "__has_bzip2_support__"}[compression]
+    return bool(getattr(netCDF4, flag, False))
+
+
+def _quantize_options(significant_digits=None, least_significant_digit=None):
+    """Make the quantization keyword arguments for createVariable."""
+    if significant_digits is not None and least_significant_digit is not None:
+        raise ValueError("only one of significant_digits and "
+                         "least_significant_digit may be specified")
+    if least_significant_digit is not None:
+        return {"least_significant_digit": least_significant_digit}
+    if significant_digits is not None:
+        if not getattr(netCDF4, "__has_quantization_support__", False):
+            raise ValueError("significant_digits is not supported by the "
+                             "installed netCDF4 library")
+        return {"significant_digits": significant_digits}
+    return {}
+
+
+def _check_chunking(chunking, dim_names):
+    """Check that a chunk shape has one positive length per dimension."""
+    chunking = tuple(int(x) for x in chunking)
+    if len(chunking) != len(dim_names):
+        raise ValueError(
+            "chunking has {} entries, but there are {} dimensions "
+            "({})".format(len(chunking), len(dim_names), ", ".join(dim_names))
+        )
+    if any(x < 1 for x in chunking):
+        raise ValueError("chunk lengths must be positive")
+    return chunking
+
+
+def _chunk_shape(dim_lens, itemsize, chunking, chunk_nbytes=None):
+    """Choose the chunk shape of a variable.
+
+    Args:
+        dim_lens: A list with the lengths of the variable's dimensions, with
+            the trace samples dimension (if present) last
+        itemsize: An int specifying the number of bytes per value
+        chunking: None, one of CHUNKING_PRESETS, or a tuple of ints
+            specifying the chunk length for each dimension. The presets
+            fill a chunk of about chunk_nbytes by extending along the
+            dimensions in the order: 'trace', the last (samples) dimension
+            and then the others from fastest to slowest; 'timeslice', the
+            other dimensions from fastest to slowest and then the last
+            dimension; 'balanced', all dimensions roughly equally.
+        chunk_nbytes: An optional int specifying the target size, in bytes,
+            of a chunk. Default DEFAULT_CHUNK_NBYTES.
+
+    Returns:
+        A list of chunk lengths, or None if NetCDF should choose
+    """
+    if chunking is None or len(dim_lens) == 0 or min(dim_lens) < 1:
+        return None
+    if chunking not in CHUNKING_PRESETS:
+        return [min(x, n) for x, n in zip(chunking, dim_lens)]
+    if chunk_nbytes is None:
+        chunk_nbytes = DEFAULT_CHUNK_NBYTES
+    target = max(1, chunk_nbytes // itemsize)
+    ndims = len(dim_lens)
+    if chunking == "trace":
+        order = [ndims - 1] + list(range(ndims - 2, -1, -1))
+    elif chunking == "timeslice":
+        order = list(range(ndims - 2, -1, -1)) + [ndims - 1]
+    else:
+        # Smallest dimensions first, so that any of the target they cannot
+        # use is shared among the larger dimensions
+        order = sorted(range(ndims), key=lambda i: dim_lens[i])
+    chunks = [1] * ndims
+    for n_done, i in enumerate(order):
+        if chunking == "balanced":
+            share = int(round(target ** (1.0 / (ndims - n_done))))
+        else:
+            share = target
+        chunks[i] = max(1, min(dim_lens[i], share))
+        target = max(1, target // chunks[i])
+    return chunks
+
+
+def _set_attributes(segy, rootgrp, sample_window=None):
     """Copy the file headers (binary and text) to the NetCDF file."""
-    rootgrp.bin = str(segy.bin)
-    rootgrp.text = segy.text[0].decode(errors='replace')
+    rootgrp.setncatts(_file_header_attributes(segy, sample_window))
+
+
+def _file_header_attributes(segy, sample_window=None):
+    """Make the attributes that store the file headers (binary and text).
+
+       The text headers are decoded as Latin-1 so that every byte is kept
+       and they can be restored exactly by netcdf2segy. If sample_window
+       (see _sample_window) is provided, the number of samples and the
+       sample interval in the binary header describe only those samples.
+
+    Returns:
+        A dictionary from attribute name to string
+    """
+    binary_header = dict(segy.bin)
+    if sample_window is not None:
+        binary_header[segyio.BinField.Samples] = _window_nsamples(
+            segy, sample_window)
+        binary_header[segyio.BinField.Interval] *= sample_window.step
+    attributes = collections.OrderedDict()
+    attributes["bin"] = str(binary_header)
+    attributes["text"] = segy.text[0].decode("latin-1")
     if segy.ext_headers:
-        rootgrp.ext_headers = segy.text[1].decode(errors='replace')
+        attributes["ext_headers"] = segy.text[1].decode("latin-1")
+    return attributes
 
 
-def _copy_data(segy, variables, dim_names, dim_lens, verbose):
+def _copy_data(segy, variables, dim_names, dim_lens, verbose,
+               max_memory=None, records=None, workers=1, segy_path=None,
+               coords=None, positions=None, engine="segyio", profiler=None,
+               progress=False, offset=0, checkpoint=False, start_trace=0,
+               queue_depth=0, sample_window=None):
     """Copy the data to the NetCDF file.
 
        Trace data, Time/Depth dimension indices, and trace header values are
-       copied.
+       copied. Trace data and per-trace header values are streamed in blocks
+       of traces (see _trace_blocks) so that memory usage is bounded by
+       max_memory rather than by the size of the file. If records (see
+       _trace_records) is provided, all of the trace headers of each block are
+       decoded from one read, otherwise each header field is read separately.
+       If workers is more than one, the blocks are read by a pool of
+       processes that each open segy_path (see _read_blocks_parallel). If the
+       output is a ZarrDataset, the blocks are also aligned to the chunks of
+       Samples (see _trace_blocks), so that no chunk is written twice, and,
+       if workers is more than one, so that the processes can write the
+       trace data of each block directly to the store, while the trace
+       headers are written by the calling process.
+       If coords and positions (see _infer_dims) are provided, they are
+       used as the coordinates of the dimensions and the position of each
+       trace, and positions without a trace are masked (so they are set to
+       the fill value); traces with a position of -1 are not copied.
+       engine specifies how to read the trace data, and sample_window which
+       samples of each trace to copy (see _read_block). If Samples has
+       scale_factor and add_offset attributes, the trace data is packed
+       (see _pack_samples) before it is written.
+
+       If queue_depth is more than zero, the copy is a pipeline (see
+       _pipeline): one background thread reads and decodes blocks (unless
+       workers is more than one, when the pool does), another arranges
+       them for writing (see _prepare_block), and the calling thread
+       writes them, with up to queue_depth blocks waiting between each
+       stage. As up to 2 * queue_depth + 3 blocks are then in memory at
+       once, each is made smaller to share max_memory.
+
+       If a profiler (see profiling.Profiler) is provided, reading (and
+       decoding) the blocks is recorded as the 'read traces' stage, and
+       writing each variable as a 'copy <name>' stage. When workers is more
+       than one, or queue_depth is more than zero, 'read traces' is the
+       time spent waiting for the next block to be ready.
+
+       If offset is more than zero, the traces are written starting at that
+       index of the first (slowest) dimension, to append them to those
+       already in the file (see _check_append). The sample indices and the
+       coordinates of the other dimensions are then not written, but the
+       coordinates are checked to match those already in the file.
+
+       If checkpoint is True, the index of the first trace not yet copied is
+       stored in the CHECKPOINT_ATTRIBUTE attribute of the file, which is
+       then flushed to disk, after each block is written. If start_trace is
+       more than zero, the blocks before it were already copied by an
+       interrupted conversion, so their trace headers are checked (see
+       _check_written_headers) instead of being copied again, and the sample
+       indices and the coordinates of the dimensions are checked instead of
+       being written.
     """
-    traceIDs = np.reshape(np.arange(segy.tracecount), dim_lens[:-1])
-    n_trace_dims = len(dim_names[:-1])
+    if profiler is None:
+        profiler = Profiler()
+    trace_vars = []
+    header_vars = []
+    dim_vars = []
     for v in variables:
         if v.name == "Samples":
-            if verbose:
-                click.echo("copying trace data")
-            v[:] = segy.trace.raw[:].reshape(v.shape)
+            trace_vars.append((v, _samples_packing(v)))
         elif v.name == dim_names[-1]:
+            if offset or start_trace:
+                continue
             if verbose:
                 click.echo("copying time/depth indices")
-            v[:] = np.array(segyio.sample_indexes(segy)).reshape(v.shape)
+            with profiler.stage("copy " + v.name) as stage:
+                values = _sample_indexes(segy, sample_window)
+                v[:] = values.reshape(v.shape)
+                stage.nbytes_written += values.nbytes
         elif v.name in dim_names[:-1]:
-            if verbose:
-                click.echo("copying {}".format(v.name))
-            v_traceIDs = _get_variable_traceIDs(v, n_trace_dims, dim_names, traceIDs)
-            header_field = _get_header_field(v.name)
-            v[:] = segy.attributes(header_field)[v_traceIDs.flatten()[:]].reshape(
-                v.shape)
+            dim_vars.append(v)
         else:
+            header_vars.append(v)
+
+    dim_values = []
+    for v in dim_vars:
+        if coords is not None:
+            values = coords[dim_names.index(v.name)]
+        else:
+            values = _dim_coordinates(segy, records, v.name, dim_names,
+                                      dim_lens)
+        if (offset and v.dimensions[0] != dim_names[0]) or start_trace:
+            if not np.array_equal(v[:], values):
+                raise ValueError("cannot {}: the coordinates of the {} "
+                                 "dimension do not match those of the "
+                                 "NetCDF file".format(
+                                     "resume" if start_trace else "append",
+                                     v.name))
+            continue
+        dim_values.append((v, values))
+    for v, values in dim_values:
+        if verbose:
+            click.echo("copying {}".format(v.name))
+        with profiler.stage("copy " + v.name) as stage:
+            v[offset:offset + len(values)] = values
+            stage.nbytes_written += values.nbytes
+
+    if max_memory is None:
+        max_memory = DEFAULT_MAX_MEMORY
+    header_names = [v.name for v in header_vars]
+    trace_nbytes = dim_lens[-1] * segy.dtype.itemsize
+    parallel_writes = (workers > 1 and segy_path is not None and trace_vars
+                       and isinstance(trace_vars[0][0].group(), ZarrDataset))
+    # Blocks that cover whole chunks of a Zarr array are written without
+    # first reading the chunks back
+    align = None
+    if trace_vars and isinstance(trace_vars[0][0].group(), ZarrDataset):
+        align = trace_vars[0][0].chunks[:-1]
+    if workers > 1 and segy_path is not None:
+        # Several blocks are in memory at once, so share the budget
+        blocks = _trace_blocks(dim_lens[:-1], trace_nbytes,
+                               max_memory // (2 * workers), align)
+    else:
+        if queue_depth > 0:
+            max_memory //= 2 * queue_depth + 3
+        blocks = _trace_blocks(dim_lens[:-1], trace_nbytes, max_memory,
+                               align)
+    if positions is not None:
+        order = np.argsort(positions, kind="stable")
+        sorted_positions = positions[order]
+        blocks = ((block, order[np.searchsorted(sorted_positions, block[0]):
+                                np.searchsorted(sorted_positions, block[1])])
+                  for block in blocks)
+    else:
+        blocks = ((block, None) for block in blocks)
+    if start_trace:
+        blocks = list(blocks)
+        if verbose:
+            click.echo("checking trace headers already copied")
+        with profiler.stage("check headers"):
+            _check_written_headers(
+                segy, records, header_vars,
+                [b for b in blocks if b[0][1] <= start_trace], positions)
+        blocks = [b for b in blocks if b[0][1] > start_trace]
+    if checkpoint:
+        rootgrp = next(iter(variables)).group()
+    samples_output = None
+    if parallel_writes:
+        blocks = list(blocks)
+        if _blocks_aligned([b[0] for b in blocks], align, dim_lens[:-1]):
+            samples_output = (trace_vars[0][0].group().path,
+                              trace_vars[0][0].name)
+        elif verbose:
+            click.echo("blocks of traces share chunks; writing the trace "
+                       "data in one process")
+    if workers > 1 and segy_path is not None:
+        blocks = _read_blocks_parallel(segy_path, blocks, header_names,
+                                       workers, engine, samples_output,
+                                       positions, sample_window)
+    else:
+        def read(item):
+            block, trace_ids = item
+            return block, trace_ids, _read_block(
+                segy, records, block[0], block[1], header_names, trace_ids,
+                engine, sample_window, read_samples=bool(trace_vars))
+        blocks = _pipeline(blocks, read, queue_depth)
+    packings = [packing for _, packing in trace_vars]
+    blocks = _pipeline(blocks, lambda item: _prepare_block(
+        item, packings, header_names, positions), queue_depth)
+    ntraces = (segy.tracecount if positions is None
+               else int(np.count_nonzero(positions >= 0)))
+    with Progress(ntraces * (TRACE_HEADER_NBYTES + trace_nbytes),
+                  "copying traces", progress) as bar:
+        while True:
+            with profiler.stage("read traces") as stage:
+                item = next(blocks, None)
+                if item is None:
+                    break
+                (start, stop, index, shape), trace_ids, samples, headers = \
+                    item
+                block_ntraces = (stop - start if trace_ids is None
+                                 else len(trace_ids))
+                block_nbytes = block_ntraces * (TRACE_HEADER_NBYTES
+                                                + trace_nbytes)
+                stage.nbytes_read += block_nbytes
             if verbose:
-                click.echo("copying {}".format(v.name))
-            header_field = _get_header_field(v.name)
-            v[:] = segy.attributes(header_field)[:].reshape(v.shape)
+                click.echo("copying traces {} to {}".format(start, stop - 1))
+            if offset:
+                index = _offset_index(index, offset)
+            # samples is None if a worker process wrote it
+            for (v, _), values in zip(trace_vars, samples or []):
+                with profiler.stage("copy " + v.name) as stage:
+                    v[index] = values
+                    stage.nbytes_written += values.nbytes
+            for v in header_vars:
+                with profiler.stage("copy " + v.name) as stage:
+                    values = headers[v.name]
+                    v[index] = values
+                    stage.nbytes_written += values.nbytes
+            if checkpoint:
+                with profiler.stage("checkpoint"):
+                    rootgrp.setncattr(CHECKPOINT_ATTRIBUTE, stop)
+                    rootgrp.sync()
+            bar.update(block_nbytes)
+
+
+def _prepare_block(item, packings, header_names, positions=None):
+    """Arrange a block of traces that has been read for writing.
+
+       Traces are placed at their positions in the block if they were
+       selected by trace_ids (see _scatter), the trace data is packed for
+       each Samples variable that needs it (see _pack_samples), and all of
+       the values are reshaped to the shape of the block.
+
+    Args:
+        item: A (block, trace_ids, (samples, headers)) tuple, as yielded
+            by _read_blocks_parallel
+        packings: A list with the packing of each Samples variable (see
+            _samples_packing)
+        header_names: A list of the names of the trace headers read
+        positions: The position of each trace (see _infer_dims), if
+            trace_ids are provided
+
+    Returns:
+        block: The block
+        trace_ids: The indices of the traces read for it
+        samples: A list of the values to write to each Samples variable,
+            or None if a worker process wrote the trace data
+        headers: A dictionary from header name to the values to write
+    """
+    block, trace_ids, (samples, headers) = item
+    start, stop, _, shape = block
+    if trace_ids is not None:
+        block_positions = positions[trace_ids] - start
+        if samples is not None:
+            samples = _scatter(samples, block_positions, stop - start)
+        if headers is not None:
+            headers = dict((name, _scatter(headers[name], block_positions,
+                                           stop - start))
+                           for name in header_names)
+    if samples is not None:
+        samples_shape = tuple(shape) + samples.shape[-1:]
+        samples = [(samples if packing is None
+                    else _pack_samples(samples, **packing)).reshape(
+                        samples_shape)
+                   for packing in packings]
+    headers = dict((name, headers[name].reshape(shape))
+                   for name in header_names)
+    return block, trace_ids, samples, headers
+
+
+def _pipeline(items, func, queue_depth):
+    """Apply a function to each item in a background thread.
+
+       The thread runs ahead of the caller by up to queue_depth results,
+       which wait in a queue, so that the work of func (such as reading
+       and decoding blocks of traces) overlaps with the caller's (such as
+       writing them). Stages can be chained by passing the generator
+       returned by one as the items of the next. Exceptions raised by
+       func or by iterating items are raised in the caller, and the thread
+       stops when the generator is closed.
+
+    Args:
+        items: An iterable of the items to apply func to
+        func: A function of one item
+        queue_depth: An int specifying the maximum number of results
+            waiting in the queue. If it is zero, func is applied in the
+            calling thread as each result is requested.
+
+    Yields:
+        func(item) for each item, in order
+    """
+    if queue_depth < 1:
+        for item in items:
+            yield func(item)
+        return
+    results = queue.Queue(queue_depth)
+    stopping = threading.Event()
+
+    def put(result):
+        # Wait for space in the queue, unless the caller has stopped
+        while not stopping.is_set():
+            try:
+                results.put(result, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run():
+        try:
+            for item in items:
+                if not put((True, func(item))):
+                    return
+            put((None, None))
+        except BaseException as e:
+            put((False, e))
+        finally:
+            if hasattr(items, "close"):
+                items.close()
+
+    thread = threading.Thread(target=run, name="segy2netcdf pipeline")
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            ok, value = results.get()
+            if ok is None:
+                return
+            if not ok:
+                raise value
+            yield value
+    finally:
+        stopping.set()
+        thread.join()
 
 
-def _get_variable_traceIDs(variable, n_trace_dims, dim_names, traceIDs):
-    """Make a list of trace IDs to copy trace header data from.
+def _check_written_headers(segy, records, header_vars, blocks,
+                           positions=None):
+    """Check that trace headers written to a NetCDF file match the SEG-Y file.
 
-       Headers used as dimensions will only copy from traces that should
-       contain unique values for them, while other headers will copy from
-       every trace.
+    Args:
+        segy: The SEG-Y file opened with segyio
+        records: The traces of the file (see _trace_records), or None
+        header_vars: A list of the per-trace header variables to check
+        blocks: A list of (block, trace_ids) tuples, as in
+            _read_blocks_parallel, of the blocks that were written
+        positions: The position of each trace (see _infer_dims), if
+            trace_ids are provided
+
+    Raises:
+        ValueError: If the values of a header do not match
+    """
+    header_names = [v.name for v in header_vars]
+    for (start, stop, index, shape), trace_ids in blocks:
+        headers = _read_block_headers(segy, records, start, stop,
+                                      header_names, trace_ids)
+        for v in header_vars:
+            values = headers[v.name]
+            if trace_ids is not None:
+                values = _scatter(values, positions[trace_ids] - start,
+                                  stop - start)
+            if not np.ma.allequal(v[index], values.reshape(shape)):
+                raise ValueError("cannot resume: the {} trace headers "
+                                 "already written do not match those of "
+                                 "the SEG-Y file".format(v.name))
+
+
+def _samples_packing(v):
+    """Get the packing of a Samples variable.
+
+       netCDF4's automatic scaling of the variable is turned off, as the
+       trace data is packed by _pack_samples.
+
+    Returns:
+        A dictionary of the keyword arguments of _pack_samples, or None if
+        the variable does not have scale_factor and add_offset attributes
+    """
+    attrs = v.ncattrs()
+    if "scale_factor" not in attrs or "add_offset" not in attrs:
+        return None
+    v.set_auto_scale(False)
+    fill_value = netCDF4.default_fillvals[v.dtype.str[1:]]
+    if "_FillValue" in attrs:
+        fill_value = v.getncattr("_FillValue")
+    return {"scale_factor": v.getncattr("scale_factor"),
+            "add_offset": v.getncattr("add_offset"),
+            "dtype": v.dtype, "fill_value": fill_value}
+
+
+def _offset_index(index, offset):
+    """Shift an index from _trace_blocks along the first dimension."""
+    first = index[0]
+    if isinstance(first, slice):
+        first = slice(first.start + offset, first.stop + offset)
+    else:
+        first = first + offset
+    return (first,) + tuple(index[1:])
+
+
+def _scatter(values, block_positions, block_ntraces):
+    """Place the values of traces at their positions in a block of traces.
+
+    Returns:
+        A NumPy masked array with block_ntraces rows, where the rows that
+        do not correspond to a trace are masked
+    """
+    values = np.asarray(values)
+    block = np.ma.masked_all((block_ntraces,) + values.shape[1:],
+                             values.dtype)
+    block[block_positions] = values
+    return block
+
+
+def _read_block(segy, records, start, stop, header_names, trace_ids=None,
+                engine="segyio", sample_window=None, read_samples=True):
+    """Read the trace data and requested trace headers of a block of traces.
+
+       The block consists of traces start to stop - 1, or, if provided, the
+       traces with indices in trace_ids. If engine is 'mmap', the trace data
+       is decoded from records (see _trace_records), which must have been
+       made with a known sample type, otherwise it is read by segyio. If
+       sample_window (see _sample_window) is provided, only those samples
+       of each trace are returned (with the mmap engine, only they are
+       decoded), and the trace headers describe only them (see
+       _window_trace_headers). If read_samples is False, only the trace
+       headers are read.
+
+    Returns:
+        samples: A NumPy array of the trace data, with one row per trace,
+            or None if read_samples is False
+        headers: A mapping from header name to a NumPy array of its values
+            (see _read_trace_headers), or None if header_names is empty
+    """
+    window = slice(None) if sample_window is None else sample_window
+    if not read_samples:
+        samples = None
+    elif engine == "mmap" and trace_ids is None:
+        samples = _decode_samples(segy,
+                                  records["samples"][start:stop, window])
+    elif engine == "mmap":
+        samples = _decode_samples(segy, records["samples"][trace_ids, window])
+    else:
+        if trace_ids is None:
+            samples = segy.trace.raw[start:stop]
+        else:
+            samples = _read_trace_samples(segy, trace_ids)
+        if sample_window is not None:
+            samples = np.ascontiguousarray(samples[:, sample_window])
+    headers = None
+    if header_names:
+        headers = _read_block_headers(segy, records, start, stop,
+                                      header_names, trace_ids)
+        if sample_window is not None:
+            _window_trace_headers(headers, segy, sample_window)
+    return samples, headers
+
+
+def _read_block_headers(segy, records, start, stop, header_names,
+                        trace_ids=None):
+    """Read the requested trace headers of a block of traces.
+
+       The block is specified as in _read_block.
+
+    Returns:
+        A mapping from header name to a NumPy array of its values
+    """
+    if trace_ids is None:
+        return _read_trace_headers(segy, records, start, stop, header_names)
+    if records is not None:
+        return records["header"][trace_ids]
+    return dict((name, segy.attributes(_get_header_field(name))[trace_ids])
+                for name in header_names)
+
+
+def _read_trace_samples(segy, trace_ids):
+    """Read the trace data of the traces with the given indices.
+
+       Runs of consecutive trace indices are each read with one call.
+    """
+    trace_ids = np.asarray(trace_ids, dtype=np.int64)
+    samples = np.empty((len(trace_ids), len(segy.samples)), segy.dtype)
+    if len(trace_ids) == 0:
+        return samples
+    order = np.argsort(trace_ids, kind="stable")
+    sorted_ids = trace_ids[order]
+    breaks = np.nonzero(np.diff(sorted_ids) != 1)[0] + 1
+    run_starts = np.concatenate(([0], breaks))
+    run_stops = np.concatenate((breaks, [len(sorted_ids)]))
+    for run_start, run_stop in zip(run_starts, run_stops):
+        first = int(sorted_ids[run_start])
+        last = int(sorted_ids[run_stop - 1])
+        samples[order[run_start:run_stop]] = segy.trace.raw[first:last + 1]
+    return samples
+
+
+# SEG-Y file opened by each process of the pool in _read_blocks_parallel,
+# and the Zarr variable it writes the trace data to, if any
+_worker_segy = None
+_worker_records = None
+_worker_output = None
+
+
+def _init_worker(segy_path):
+    """Open the SEG-Y file in a process of the pool."""
+    global _worker_segy, _worker_records
+    _worker_segy = segyio.open(segy_path, ignore_geometry=True)
+    _worker_records = _trace_records(segy_path, _worker_segy)
+
+
+def _read_block_worker(start, stop, header_names, trace_ids, engine,
+                       sample_window=None):
+    """Read a block of traces in a process of the pool (see _read_block)."""
+    return _read_block(_worker_segy, _worker_records, start, stop,
+                       header_names, trace_ids, engine, sample_window)
+
+
+def _copy_block_worker(block, header_names, trace_ids, block_positions,
+                       engine, samples_output, sample_window=None):
+    """Read a block of traces and write its trace data, in a process of the
+       pool.
+
+    Returns:
+        None, in place of the trace data, and the trace headers (see
+        _read_block)
+    """
+    global _worker_output
+    start, stop, index, shape = block
+    samples, headers = _read_block(_worker_segy, _worker_records, start,
+                                   stop, header_names, trace_ids, engine,
+                                   sample_window)
+    if block_positions is not None:
+        samples = _scatter(samples, block_positions, stop - start)
+    if _worker_output is None or _worker_output[0] != samples_output:
+        v = open_variable(*samples_output)
+        _worker_output = (samples_output, v, _samples_packing(v))
+    _, v, packing = _worker_output
+    if packing is not None:
+        samples = _pack_samples(samples, **packing)
+    v[index] = samples.reshape(shape + samples.shape[-1:])
+    return None, headers
+
+
+def _read_blocks_parallel(segy_path, blocks, header_names, workers,
+                          engine="segyio", samples_output=None,
+                          positions=None, sample_window=None):
+    """Read blocks of traces using a pool of processes.
+
+       Each process opens its own handle to the SEG-Y file. At most
+       2 * workers blocks are requested ahead of the one currently being
+       written, so that memory usage stays bounded even if writing is slower
+       than reading.
+
+    Args:
+        blocks: An iterable of (block, trace_ids) tuples, where block is a
+            tuple provided by _trace_blocks and trace_ids is None or the
+            indices of the traces to read for it (see _read_block)
+        samples_output: An optional tuple of the path of a Zarr store and
+            the name of the variable in it to which the processes should
+            write the trace data of each block (see _copy_block_worker),
+            instead of returning it. The blocks must not share chunks.
+        positions: The position of each trace (see _infer_dims), if
+            trace_ids are provided and samples_output is used
+        sample_window: An optional slice of the samples of each trace to
+            read (see _sample_window)
+
+    Yields:
+        block: The block
+        trace_ids: The indices of the traces read for it
+        data: The (samples, headers) tuple read for it (see _read_block),
+            with samples None if samples_output is provided
+    """
+    pool = multiprocessing.Pool(workers, _init_worker, (segy_path,))
+    try:
+        pending = collections.deque()
+        for block, trace_ids in blocks:
+            if samples_output is None:
+                result = pool.apply_async(
+                    _read_block_worker,
+                    (block[0], block[1], header_names, trace_ids, engine,
+                     sample_window))
+            else:
+                block_positions = None
+                if trace_ids is not None:
+                    block_positions = positions[trace_ids] - block[0]
+                result = pool.apply_async(
+                    _copy_block_worker,
+                    (block, header_names, trace_ids, block_positions, engine,
+                     samples_output, sample_window))
+            pending.append((block, trace_ids, result))
+            if len(pending) >= 2 * workers:
+                block, trace_ids, result = pending.popleft()
+                yield block, trace_ids, result.get()
+        while pending:
+            block, trace_ids, result = pending.popleft()
+            yield block, trace_ids, result.get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+@functools.lru_cache(maxsize=None)
+def _header_dtype(endian="big"):
+    """Make a NumPy structured dtype describing one trace header.
+
+       Each segyio.TraceField is a 2 or 4 byte signed integer that continues
+       until the start of the next field (or the end of the trace header).
+       The dtype for each byte order is only made once.
+    """
+    byteorder = ">" if endian == "big" else "<"
+    fields = sorted(segyio.tracefield.keys.items(), key=lambda x: x[1])
+    ends = [pos for _, pos in fields[1:]] + [TRACE_HEADER_NBYTES + 1]
+    names = []
+    formats = []
+    offsets = []
+    for (name, pos), end in zip(fields, ends):
+        names.append(name)
+        formats.append("{}i{}".format(byteorder, end - pos))
+        offsets.append(pos - 1)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets,
+                     "itemsize": TRACE_HEADER_NBYTES})
+
+
+def _trace_records(segy_path, segy):
+    """Memory-map the traces of a SEG-Y file as an array of records.
+
+       Each record has a "header" field (see _header_dtype) and a "samples"
+       field containing the undecoded trace data, with the type given by
+       _sample_dtype, or as raw bytes if that is None.
+
+    Returns:
+        A read-only NumPy memmap with one record per trace, or None if the
+        file does not consist of fixed-length traces following the file
+        headers (in which case segyio must be used to read it).
+    """
+    ns = len(segy.samples)
+    offset = (TEXT_HEADER_NBYTES + BINARY_HEADER_NBYTES
+              + segy.ext_headers * TEXT_HEADER_NBYTES)
+    sample_dtype = _sample_dtype(segy)
+    if sample_dtype is not None:
+        samples_field = ("samples", sample_dtype, (ns,))
+    else:
+        samples_field = ("samples", "V{}".format(ns * segy.dtype.itemsize))
+    record_dtype = np.dtype([("header", _header_dtype(segy.endian)),
+                             samples_field])
+    try:
+        file_nbytes = os.path.getsize(segy_path)
+    except (OSError, TypeError):
+        return None
+    if file_nbytes != offset + segy.tracecount * record_dtype.itemsize:
+        return None
+    if segy.tracecount == 0:
+        return None
+    return np.memmap(segy_path, dtype=record_dtype, mode="r", offset=offset,
+                     shape=(segy.tracecount,))
+
+
+def _sample_dtype(segy):
+    """Get the NumPy type of the trace data, as stored in the SEG-Y file.
+
+    Returns:
+        A NumPy dtype (with IBM floats as uint32), or None if the data
+        sample format is not in SAMPLE_FORMAT_DTYPES or does not have the
+        same size as the type that segyio uses
+    """
+    fmt = segy.bin[segyio.BinField.Format]
+    if fmt not in SAMPLE_FORMAT_DTYPES:
+        return None
+    dtype = np.dtype(SAMPLE_FORMAT_DTYPES[fmt])
+    if segy.endian == "little":
+        dtype = dtype.newbyteorder("<")
+    if dtype.itemsize != segy.dtype.itemsize:
+        return None
+    return dtype
+
+
+def _decode_samples(segy, samples):
+    """Convert trace data, as stored in the file, to the type segyio uses.
+
+       IBM floats are converted to IEEE floats, and other types are
+       converted to native byte order, if necessary. The conversion is done
+       a few traces at a time (about DECODE_CHUNK_NSAMPLES samples), as this
+       keeps the intermediate arrays in the processor's cache.
+
+    Args:
+        segy: The SEG-Y file opened with segyio
+        samples: A NumPy array with one row per trace, such as the "samples"
+            field of a block of records (see _trace_records)
+    """
+    decoded = np.empty(samples.shape, segy.dtype)
+    ibm = segy.bin[segyio.BinField.Format] == 1
+    chunk_ntraces = max(1, DECODE_CHUNK_NSAMPLES // max(1, samples.shape[-1]))
+    for start in range(0, len(samples), chunk_ntraces):
+        chunk = samples[start:start + chunk_ntraces]
+        if ibm:
+            decoded[start:start + chunk_ntraces] = ibm2ieee(chunk)
+        else:
+            decoded[start:start + chunk_ntraces] = chunk
+    return decoded
+
+
+def _read_trace_headers(segy, records, start, stop, names):
+    """Read the requested trace header fields of a block of traces.
+
+       If records (see _trace_records) is provided, the headers of the block
+       are read in one pass and decoded with a structured dtype view.
+       Otherwise segyio is used to read each field separately.
+
+    Returns:
+        A mapping from header name to a NumPy array of its values
+    """
+    if records is not None:
+        return np.array(records["header"][start:stop])
+    return {name: segy.attributes(_get_header_field(name))[start:stop]
+            for name in names}
+
+
+def _trace_blocks(trace_dim_lens, trace_nbytes, max_memory, align=None):
+    """Split the traces into blocks that can be written as hyperslabs.
+
+       Blocks are made along the slowest dimension for which one entry
+       (including all of the faster dimensions) fits within max_memory, and
+       contain as many entries of that dimension as fit.
+
+    Args:
+        trace_dim_lens: A list with the lengths of the dimensions, excluding
+            the trace samples dimension
+        trace_nbytes: An int specifying the number of bytes in one trace
+        max_memory: An int specifying the approximate maximum number of bytes
+            in one block
+        align: An optional tuple with the chunk length of each dimension.
+            If provided, the number of entries of the dimension that blocks
+            are made along is rounded down to a multiple of its chunk
+            length (or up to the chunk length, if it is smaller), so that
+            blocks start at chunk boundaries (see _blocks_aligned).
+
+    Yields:
+        start: An int specifying the index of the first trace in the block
+        stop: An int specifying one more than the index of the last trace in
+            the block
+        index: A tuple of ints and slices that selects the block from a
+            variable with the trace dimensions
+        shape: A tuple with the shape of the block in the trace dimensions
+    """
+    n_trace_dims = len(trace_dim_lens)
+    ntraces = int(np.prod(trace_dim_lens, dtype=np.int64))
+    if n_trace_dims == 0:
+        yield 0, ntraces, Ellipsis, ()
+        return
+    if ntraces == 0:
+        return
+    strides = [int(np.prod(trace_dim_lens[i + 1:], dtype=np.int64))
+               for i in range(n_trace_dims)]
+    max_traces = max(1, max_memory // max(1, trace_nbytes))
+    axis = 0
+    while strides[axis] > max_traces:
+        axis += 1
+    count = max(1, min(max_traces // strides[axis], trace_dim_lens[axis]))
+    if align is not None and count < trace_dim_lens[axis]:
+        count = max(align[axis], count - count % align[axis])
+    for outer in np.ndindex(*trace_dim_lens[:axis]):
+        outer_start = sum(i * stride for i, stride in zip(outer, strides))
+        for i in range(0, trace_dim_lens[axis], count):
+            n = min(count, trace_dim_lens[axis] - i)
+            start = outer_start + i * strides[axis]
+            stop = start + n * strides[axis]
+            index = (tuple(outer) + (slice(i, i + n),)
+                     + (slice(None),) * (n_trace_dims - axis - 1))
+            shape = (n,) + tuple(trace_dim_lens[axis + 1:])
+            yield start, stop, index, shape
+
+
+def _dim_coordinates(segy, records, name, dim_names, dim_lens,
+                     trace_ids=None):
+    """Read the values of a header used as a dimension.
+
+       Headers used as dimensions are only read from traces that should
+       contain unique values for them: the first trace of each entry in
+       their dimension. If trace_ids (see _select_traces) is provided, the
+       dimensions are made of those traces, in order.
+
+    Returns:
+        A NumPy array with the value of the header for each entry
+    """
+    d_idx = dim_names.index(name)
+    stride = int(np.prod(dim_lens[d_idx + 1:-1], dtype=np.int64))
+    first_ids = np.arange(dim_lens[d_idx]) * stride
+    if trace_ids is None:
+        trace_ids = first_ids
+    else:
+        trace_ids = trace_ids[first_ids]
+    if records is not None:
+        return records["header"][name][trace_ids]
+    return segy.attributes(_get_header_field(name))[trace_ids]
+
+
+def _blocks_aligned(blocks, chunks, trace_dim_lens):
+    """Check that no two blocks of traces contain parts of the same chunk.
+
+    Args:
+        blocks: A list of blocks provided by _trace_blocks
+        chunks: A tuple with the chunk length of each trace dimension
+        trace_dim_lens: A list with the lengths of the trace dimensions
     """
-    vdims = [slice(1)] * n_trace_dims
-    v_trace_dims = variable.dimensions
-    for d in v_trace_dims:
-        d_idx = dim_names.index(d)
-        vdims[d_idx] = slice(None)
-    v_traceIDs = traceIDs[tuple(vdims)]
-    return v_traceIDs
+    for _, _, index, _ in blocks:
+        if index is Ellipsis:
+            continue
+        for idx, chunk, length in zip(index, chunks, trace_dim_lens):
+            if not isinstance(idx, slice):
+                if chunk != 1:
+                    return False
+            elif idx.start is not None and (
+                    idx.start % chunk
+                    or (idx.stop % chunk and idx.stop != length)):
+                return False
+    return True
 
 
 def _get_header_field(name):
@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""Variable length: convert SEG-Y files whose traces have different lengths.
+
+segyio, and so the rest of segy2netcdf, requires every trace of a file to
+have the number of samples given in the binary header. Here the number of
+samples of each trace is instead read from its TRACE_SAMPLE_COUNT header
+(or the binary header, if that is zero), in one pass over the trace headers
+that finds where each trace starts. The traces are then copied in blocks
+into a Samples variable long enough for the longest trace, padded with its
+fill value, and the number of samples of each trace is stored in the
+TRACE_LENGTH_VARIABLE variable. Only big-endian files, with a data sample
+format in segy2netcdf.SAMPLE_FORMAT_DTYPES, are supported.
+"""
+import mmap
+import os
+import click
+import numpy as np
+import segyio
+from netcdf_segy import segy2netcdf as s2n
+from netcdf_segy.ibm import ibm2ieee
+from netcdf_segy.profiling import Profiler, Progress
+
+# Name of the variable that stores the number of samples of each trace
+TRACE_LENGTH_VARIABLE = "TraceLength"
+
+# Sample interval used if neither the binary header nor the first trace
+# header has one, as in segyio.tools.dt
+DEFAULT_SAMPLE_INTERVAL = 4000.0
+
+# Types of the binary header fields that are not 2 byte signed integers, as
+# segyio reads them
+BINARY_HEADER_FORMATS = {
+    "JobID": "i4", "LineNumber": "i4", "ReelNumber": "i4",
+    "Samples": "u2", "SamplesOriginal": "u2",
+    "ExtTraces": "i4", "ExtAuxTraces": "i4", "ExtSamples": "i4",
+    "ExtSamplesOriginal": "i4", "ExtEnsembleFold": "i4",
+    "SEGYRevision": "u1", "SEGYRevisionMinor": "u1",
+}
+
+# Translation table from EBCDIC to ASCII, as segyio converts text headers
+# (the table of dd conv=ascii), so that the text attributes are the same as
+# those of a fixed-length conversion and netcdf2segy restores the bytes
+EBCDIC_TO_ASCII = (
+    b"\x00\x01\x02\x03\x9c\x09\x86\x7f\x97\x8d\x8e\x0b"
+    b"\x0c\x0d\x0e\x0f\x10\x11\x12\x13\x9d\x85\x08\x87"
+    b"\x18\x19\x92\x8f\x1c\x1d\x1e\x1f\x80\x81\x82\x83"
+    b"\x84\x0a\x17\x1b\x88\x89\x8a\x8b\x8c\x05\x06\x07"
+    b"\x90\x91\x16\x93\x94\x95\x96\x04\x98\x99\x9a\x9b"
+    b"\x14\x15\x9e\x1a\x20\xa0\xa1\xa2\xa3\xa4\xa5\xa6"
+    b"\xa7\xa8\x5b\x2e\x3c\x28\x2b\x21\x26\xa9\xaa\xab"
+    b"\xac\xad\xae\xaf\xb0\xb1\x5d\x24\x2a\x29\x3b\x5e"
+    b"\x2d\x2f\xb2\xb3\xb4\xb5\xb6\xb7\xb8\xb9\x7c\x2c"
+    b"\x25\x5f\x3e\x3f\xba\xbb\xbc\xbd\xbe\xbf\xc0\xc1"
+    b"\xc2\x60\x3a\x23\x40\x27\x3d\x22\xc3\x61\x62\x63"
+    b"\x64\x65\x66\x67\x68\x69\xc4\xc5\xc6\xc7\xc8\xc9"
+    b"\xca\x6a\x6b\x6c\x6d\x6e\x6f\x70\x71\x72\xcb\xcc"
+    b"\xcd\xce\xcf\xd0\xd1\x7e\x73\x74\x75\x76\x77\x78"
+    b"\x79\x7a\xd2\xd3\xd4\xd5\xd6\xd7\xd8\xd9\xda\xdb"
+    b"\xdc\xdd\xde\xdf\xe0\xe1\xe2\xe3\xe4\xe5\xe6\xe7"
+    b"\x7b\x41\x42\x43\x44\x45\x46\x47\x48\x49\xe8\xe9"
+    b"\xea\xeb\xec\xed\x7d\x4a\x4b\x4c\x4d\x4e\x4f\x50"
+    b"\x51\x52\xee\xef\xf0\xf1\xf2\xf3\x5c\x9f\x53\x54"
+    b"\x55\x56\x57\x58\x59\x5a\xf4\xf5\xf6\xf7\xf8\xf9"
+    b"\x30\x31\x32\x33\x34\x35\x36\x37\x38\x39\xfa\xfb"
+    b"\xfc\xfd\xfe\xff"
+)
+
+
+def convert(segy_path, netcdf_path, samples_dim_name="SampleNumber", d=(),
+            verbose=False, max_memory=None, compress=None, quantize=None,
+            chunking=None, chunk_nbytes=None, headers=None,
+            exclude_headers=(), output_format="netcdf", profiler=None,
+            progress=False):
+    """Convert a SEG-Y file with traces of different lengths.
+
+       The arguments are as for segy2netcdf.segy2netcdf, with compress and
+       quantize the dictionaries made by segy2netcdf._compression_options
+       and segy2netcdf._quantize_options (or, as for
+       segy2netcdf._create_variables, compress may be a bool, and quantize
+       None for no quantization). The dimensions in d describe the
+       traces, and the trace samples dimension is as long as the longest
+       trace. The traces are streamed in blocks of about max_memory bytes
+       of (padded) trace data.
+    """
+    if max_memory is None:
+        max_memory = s2n.DEFAULT_MAX_MEMORY
+    if profiler is None:
+        profiler = Profiler()
+    if not isinstance(compress, dict):
+        compress = s2n._compression_options(compress)
+    if quantize is None:
+        quantize = {}
+    with open(segy_path, "rb") as f:
+        with profiler.stage("file headers") as stage:
+            file_headers = _read_file_headers(f)
+            stage.nbytes_read = file_headers["data_offset"]
+        if verbose:
+            click.echo("scanning trace lengths")
+        with profiler.stage("scan traces") as stage:
+            offsets, lengths = _scan_traces(f, file_headers)
+            stage.nbytes_read = len(offsets) * s2n.TRACE_HEADER_NBYTES
+        ntraces = len(offsets)
+        ns = int(lengths.max()) if ntraces else 0
+        dim_names, dim_lens = s2n._make_dim_name_len(samples_dim_name, ns, d)
+        dims_ntraces = s2n._count_traces_in_user_dims(d)
+        s2n._check_user_dims(dims_ntraces, ntraces)
+        s2n._fill_missing_dims(dims_ntraces, ntraces, dim_names, dim_lens)
+        fields = [field for field in s2n._select_header_fields(
+            headers, exclude_headers) if field not in dim_names]
+        samples_dtype = file_headers["dtype"]
+        if quantize and samples_dtype.kind != "f":
+            raise ValueError("only floats can be quantized, not "
+                             "{}".format(samples_dtype))
+
+        with profiler.stage("dimensions"):
+            rootgrp = s2n._open_output(netcdf_path, "w", output_format)
+            s2n._create_dimensions(dim_names, dim_lens, rootgrp)
+        try:
+            with profiler.stage("variables"):
+                variables = s2n._create_variables(
+                    rootgrp, dim_names, compress, chunking, chunk_nbytes,
+                    quantize, dict((field, "i4") for field in fields), True,
+                    dim_lens, samples_dtype)
+                variables.append(rootgrp.createVariable(
+                    TRACE_LENGTH_VARIABLE, "i4", tuple(dim_names[:-1]),
+                    **compress))
+            with profiler.stage("attributes"):
+                rootgrp.setncatts(file_headers["attributes"])
+            _copy_traces(f, file_headers, offsets, lengths, variables,
+                         dim_names, dim_lens, verbose, max_memory, profiler,
+                         progress)
+        finally:
+            with profiler.stage("close"):
+                rootgrp.close()
+
+
+def _read_file_headers(f):
+    """Read the text and binary file headers of a SEG-Y file.
+
+    Returns:
+        A dictionary with the 'attributes' that store the file headers
+        (as in segy2netcdf._file_header_attributes), the binary header's
+        number of 'samples', sample 'interval', and data sample 'format',
+        the NumPy types of the samples as stored ('file_dtype') and
+        decoded ('dtype'), and the 'data_offset' of the first trace
+    """
+    text = f.read(s2n.TEXT_HEADER_NBYTES)
+    binary = f.read(s2n.BINARY_HEADER_NBYTES)
+    if len(binary) < s2n.BINARY_HEADER_NBYTES:
+        raise ValueError("the file is too short to be SEG-Y")
+    bin_header = np.frombuffer(binary, _binary_header_dtype())[0]
+    fmt = int(bin_header["Format"])
+    if fmt not in s2n.SAMPLE_FORMAT_DTYPES:
+        raise ValueError("cannot read data sample format {}; only "
+                         "big-endian files with a format in "
+                         "SAMPLE_FORMAT_DTYPES are supported".format(fmt))
+    ext_headers = int(bin_header["ExtendedHeaders"])
+    if ext_headers < 0:
+        raise ValueError("a variable number of extended text headers is "
+                         "not supported")
+    attributes = {"bin": _binary_header_string(bin_header),
+                  "text": _decode_text(text)}
+    if ext_headers:
+        attributes["ext_headers"] = _decode_text(
+            f.read(s2n.TEXT_HEADER_NBYTES))
+    file_dtype = np.dtype(s2n.SAMPLE_FORMAT_DTYPES[fmt])
+    dtype = np.dtype("f4") if fmt == 1 else file_dtype.newbyteorder("=")
+    return {"attributes": attributes,
+            "samples": int(bin_header["Samples"]),
+            "interval": int(bin_header["Interval"]),
+            "format": fmt, "file_dtype": file_dtype, "dtype": dtype,
+            "data_offset": (s2n.TEXT_HEADER_NBYTES + s2n.BINARY_HEADER_NBYTES
+                            + ext_headers * s2n.TEXT_HEADER_NBYTES)}
+
+
+def _decode_text(text):
+    """Convert an EBCDIC text header to a string, as segyio would read it.
+
+       As in segy2netcdf._file_header_attributes, the converted bytes are
+       decoded as Latin-1 so that netcdf2segy can restore them exactly.
+    """
+    return text.translate(EBCDIC_TO_ASCII).decode("latin-1")
+
+
+def _binary_header_dtype():
+    """Make a NumPy structured dtype describing a big-endian binary header.
+
+       Each segyio.BinField (other than the unassigned ones) is a field, at
+       the same position and with the same type as segyio reads it (see
+       BINARY_HEADER_FORMATS).
+    """
+    names = []
+    formats = []
+    offsets = []
+    for name, pos in segyio.binfield.keys.items():
+        if name.startswith("Unassigned"):
+            continue
+        names.append(name)
+        formats.append(">" + BINARY_HEADER_FORMATS.get(name, "i2"))
+        offsets.append(pos - 1 - s2n.TEXT_HEADER_NBYTES)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets,
+                     "itemsize": s2n.BINARY_HEADER_NBYTES})
+
+
+def _binary_header_string(bin_header):
+    """Format a binary header as segy2netcdf stores it in the bin attribute.
+
+       The fields are those that segyio includes when it formats a binary
+       header, so the string is the same as str(segy.bin).
+
+    Args:
+        bin_header: A NumPy structured scalar (see _binary_header_dtype)
+    """
+    fields = [field for field in segyio.BinField.enums()
+              if field != segyio.BinField.Unassigned1
+              and field != segyio.BinField.Unassigned2]
+    return str(dict((field, int(bin_header[str(field)]))
+                    for field in fields))
+
+
+def _scan_traces(f, file_headers):
+    """Find where each trace starts, and its number of samples.
+
+       Only the TRACE_SAMPLE_COUNT header of each trace is read, through a
+       memory map of the file.
+
+    Args:
+        f: The SEG-Y file, opened in binary mode
+        file_headers: The file headers (see _read_file_headers)
+
+    Returns:
+        offsets: A NumPy int64 array with the byte offset of each trace
+        lengths: A NumPy int64 array with the number of samples of each
+            trace
+    """
+    field = s2n._get_header_field("TRACE_SAMPLE_COUNT") - 1
+    itemsize = file_headers["file_dtype"].itemsize
+    offsets = []
+    lengths = []
+    file_nbytes = os.fstat(f.fileno()).st_size
+    offset = file_headers["data_offset"]
+    if offset >= file_nbytes:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        while offset < file_nbytes:
+            if offset + s2n.TRACE_HEADER_NBYTES > file_nbytes:
+                raise ValueError("trace {} is truncated".format(len(offsets)))
+            length = int.from_bytes(mm[offset + field:offset + field + 2],
+                                    "big")
+            if length == 0:
+                length = file_headers["samples"]
+            offsets.append(offset)
+            lengths.append(length)
+            offset += s2n.TRACE_HEADER_NBYTES + length * itemsize
+    finally:
+        mm.close()
+    if offset > file_nbytes:
+        raise ValueError("trace {} is truncated".format(len(offsets) - 1))
+    return np.array(offsets, np.int64), np.array(lengths, np.int64)
+
+
+def _read_traces(f, file_headers, offsets, lengths, ns):
+    """Read and decode the headers and data of consecutive traces.
+
+       The traces are read with one call, and the data is padded to ns
+       samples with masked values.
+
+    Returns:
+        samples: A NumPy masked array with one row of ns samples per trace
+        headers: A NumPy structured array (see segy2netcdf._header_dtype)
+            of the trace headers
+    """
+    file_dtype = file_headers["file_dtype"]
+    if not len(offsets):
+        return (np.ma.masked_all((0, ns), file_headers["dtype"]),
+                np.zeros(0, s2n._header_dtype()))
+    start = int(offsets[0])
+    stop = int(offsets[-1] + s2n.TRACE_HEADER_NBYTES
+               + lengths[-1] * file_dtype.itemsize)
+    f.seek(start)
+    buf = f.read(stop - start)
+    raw = np.zeros((len(offsets), ns), file_dtype)
+    headers = np.empty((len(offsets), s2n.TRACE_HEADER_NBYTES), np.uint8)
+    for i, (offset, length) in enumerate(zip(offsets - start, lengths)):
+        headers[i] = np.frombuffer(buf, np.uint8, s2n.TRACE_HEADER_NBYTES,
+                                   offset)
+        raw[i, :length] = np.frombuffer(buf, file_dtype, length,
+                                        offset + s2n.TRACE_HEADER_NBYTES)
+    if file_headers["format"] == 1:
+        samples = ibm2ieee(raw)
+    else:
+        samples = raw.astype(file_headers["dtype"])
+    mask = np.arange(ns) >= lengths[:, np.newaxis]
+    return (np.ma.masked_array(samples, mask),
+            headers.view(s2n._header_dtype()).reshape(-1))
+
+
+def _copy_traces(f, file_headers, offsets, lengths, variables, dim_names,
+                 dim_lens, verbose=False, max_memory=None, profiler=None,
+                 progress=False):
+    """Copy the trace data and headers, in blocks, to the variables.
+
+       The blocks are made as by segy2netcdf._copy_data, for traces of the
+       length of the longest trace.
+    """
+    if max_memory is None:
+        max_memory = s2n.DEFAULT_MAX_MEMORY
+    if profiler is None:
+        profiler = Profiler()
+    ns = dim_lens[-1]
+    trace_nbytes = ns * file_headers["dtype"].itemsize
+    samples_var = None
+    header_vars = []
+    for v in variables:
+        if v.name == "Samples":
+            samples_var = v
+        elif v.name == dim_names[-1]:
+            with profiler.stage("copy " + v.name) as stage:
+                values = _sample_indexes(f, file_headers, offsets, ns)
+                v[:] = values
+                stage.nbytes_written += values.nbytes
+        elif v.name in dim_names[:-1]:
+            with profiler.stage("copy " + v.name) as stage:
+                values = _dim_coordinates(f, offsets, v.name, dim_names,
+                                          dim_lens)
+                v[:] = values
+                stage.nbytes_written += values.nbytes
+        else:
+            header_vars.append(v)
+
+    blocks = s2n._trace_blocks(dim_lens[:-1], trace_nbytes, max_memory)
+    nbytes = int(np.sum(s2n.TRACE_HEADER_NBYTES
+                        + lengths * file_headers["file_dtype"].itemsize))
+    with Progress(nbytes, "copying traces", progress) as bar:
+        for start, stop, index, shape in blocks:
+            with profiler.stage("read traces") as stage:
+                samples, headers = _read_traces(
+                    f, file_headers, offsets[start:stop],
+                    lengths[start:stop], ns)
+                block_nbytes = int(np.sum(
+                    s2n.TRACE_HEADER_NBYTES + lengths[start:stop]
+                    * file_headers["file_dtype"].itemsize))
+                stage.nbytes_read += block_nbytes
+            if verbose:
+                click.echo("copying traces {} to {}".format(start, stop - 1))
+            with profiler.stage("copy Samples") as stage:
+                samples_var[index] = samples.reshape(shape + (ns,))
+                stage.nbytes_written += samples.nbytes
+            for v in header_vars:
+                with profiler.stage("copy " + v.name) as stage:
+                    if v.name == TRACE_LENGTH_VARIABLE:
+                        values = lengths[start:stop].astype(np.int32)
+                    else:
+                        values = headers[v.name].astype(np.int32)
+                    v[index] = values.reshape(shape)
+                    stage.nbytes_written += values.nbytes
+            bar.update(block_nbytes)
+
+
+def _sample_indexes(f, file_headers, offsets, ns):
+    """Make the values of the trace samples dimension.
+
+       They are the sample number times the sample interval of the binary
+       header, or of the first trace header if that is zero, as in
+       segyio.sample_indexes.
+    """
+    interval = file_headers["interval"]
+    if not interval and len(offsets):
+        interval = int(_read_header(f, offsets[0])["TRACE_SAMPLE_INTERVAL"])
+    if not interval:
+        interval = DEFAULT_SAMPLE_INTERVAL
+    return (np.arange(ns) * float(interval)).astype(np.float32)
+
+
+def _dim_coordinates(f, offsets, name, dim_names, dim_lens):
+    """Read the values of a header used as a dimension.
+
+       As in segy2netcdf._dim_coordinates, the header is read from the first
+       trace of each entry of its dimension.
+    """
+    d_idx = dim_names.index(name)
+    stride = int(np.prod(dim_lens[d_idx + 1:-1], dtype=np.int64))
+    trace_ids = np.arange(dim_lens[d_idx]) * stride
+    return np.array([_read_header(f, offsets[trace_id])[name]
+                     for trace_id in trace_ids], np.int32)
+
+
+def _read_header(f, offset):
+    """Read the header of the trace that starts at offset.
+
+    Returns:
+        A NumPy structured scalar (see segy2netcdf._header_dtype)
+    """
+    f.seek(int(offset))
+    return np.frombuffer(f.read(s2n.TRACE_HEADER_NBYTES),
+                         s2n._header_dtype())[0]
@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+"""Verify: check that the output of segy2netcdf matches its SEG-Y file.
+
+The SEG-Y file and the NetCDF file (or Zarr store) are read in matching
+blocks of traces (see segy2netcdf._trace_blocks), and Samples, the trace
+samples dimension, the coordinates of the other dimensions, every trace
+header variable, and the trace headers stored as attributes, are compared
+with the values in the SEG-Y file. These are read with segyio, rather than
+with the code that segy2netcdf copies the traces with (whichever engine it
+used), so that a mistake in that code is found rather than repeated. Only
+one block (per worker process) is held in memory at once.
+
+The values of each trace (Samples and the trace header variables, as stored
+in the output) are also hashed, and the hashes of the traces, in the order
+of their positions in the output, are hashed with the values of the
+dimension variables to make a SHA-256 digest of the content of the output.
+This does not depend on how the traces were split into blocks or workers.
+It can be stored in the output's DIGEST_ATTRIBUTE attribute.
+"""
+import hashlib
+import multiprocessing
+import os
+import click
+import numpy as np
+import segyio
+import netCDF4
+from netCDF4 import Dataset
+from netcdf_segy import segy2netcdf as s2n
+from netcdf_segy.zarr_output import ZarrDataset
+
+# Name of the attribute that stores the digest of the output's content
+DIGEST_ATTRIBUTE = "segy2netcdf_sha256"
+
+# Maximum number of mismatches reported
+MAX_MISMATCHES = 100
+
+
+def verify_netcdf(segy_path, netcdf_path, samples_dim_name=None,
+                  infer_dims=None, traces=None, select=(), tmin=None,
+                  tmax=None, sample_step=None, max_memory=None, workers=1,
+                  write_digest=False, verbose=False):
+    """Check that a NetCDF file (or Zarr store) matches its SEG-Y file.
+
+    Args:
+        segy_path: A string specifying the path to the SEG-Y file.
+        netcdf_path: A string specifying the path to the output of
+            segy2netcdf. A directory is opened as a Zarr store.
+        samples_dim_name, infer_dims, traces, select, tmin, tmax,
+        sample_step: The options that the output was made with, as for
+            segy2netcdf, which determine where each trace was copied to.
+            The other dimensions are read from the output. samples_dim_name
+            is only used to check the name of the trace samples dimension.
+        max_memory: An optional int specifying the approximate maximum
+            number of bytes of trace data that each process holds in
+            memory at once. Default DEFAULT_MAX_MEMORY.
+        workers: An optional int specifying the number of processes that
+            compare blocks of traces. Each opens its own handles to both
+            files. Default 1.
+        write_digest: An optional boolean flag indicating whether to store
+            the digest in the DIGEST_ATTRIBUTE attribute of the output, if
+            it matches. Default False.
+        verbose: An optional boolean flag indicating whether to print
+            progress. Default False.
+
+    Returns:
+        A dictionary with a list of strings describing the 'mismatches'
+        found (empty if the output matches; at most MAX_MISMATCHES), the
+        hexadecimal 'digest' of the output's content (None if the layout
+        does not match), and the number of 'blocks' compared
+    """
+    if max_memory is None:
+        max_memory = s2n.DEFAULT_MAX_MEMORY
+    digest = hashlib.sha256()
+    traces_digest = hashlib.sha256()
+    mismatches = []
+    nblocks = 0
+    with segyio.open(segy_path, ignore_geometry=True) as segy:
+        sample_window = s2n._sample_window(segy, tmin, tmax, sample_step)
+        trace_ids = None
+        if traces is not None or select:
+            trace_ids = s2n._select_traces(segy, None, traces, select,
+                                           max_memory)
+        ntraces = segy.tracecount if trace_ids is None else len(trace_ids)
+        coords = None
+        positions = None
+        if infer_dims:
+            coords, positions = s2n._infer_dims(segy, None, infer_dims,
+                                                max_memory, trace_ids)
+        elif trace_ids is not None:
+            positions = np.full(segy.tracecount, -1, np.int64)
+            positions[trace_ids] = np.arange(ntraces)
+
+        rootgrp = _open(netcdf_path, "r")
+        try:
+            samples_var = rootgrp["Samples"]
+            dim_names = list(samples_var.dimensions)
+            dim_lens = list(samples_var.shape)
+            mismatches += _check_layout(segy, rootgrp, dim_names, dim_lens,
+                                        ntraces, coords, sample_window,
+                                        samples_dim_name)
+            if not mismatches:
+                mismatches += _check_dimensions(
+                    segy, rootgrp, dim_names, dim_lens, coords,
+                    trace_ids, sample_window, digest)
+                header_names = [
+                    v.name for v in rootgrp.variables.values()
+                    if v.name in segyio.tracefield.keys
+                    and tuple(v.dimensions) == tuple(dim_names[:-1])]
+                constant_names = [name for name in rootgrp.ncattrs()
+                                  if name in segyio.tracefield.keys
+                                  and name not in rootgrp.variables]
+        finally:
+            rootgrp.close()
+        if mismatches:
+            return {"mismatches": mismatches, "digest": None, "blocks": 0}
+
+        if workers > 1:
+            block_nbytes = max_memory // (2 * workers)
+        else:
+            block_nbytes = max_memory
+        trace_nbytes = dim_lens[-1] * segy.dtype.itemsize
+        tasks = _block_tasks(dim_lens[:-1], trace_nbytes, block_nbytes,
+                             positions)
+        settings = (segy_path, netcdf_path, header_names, constant_names,
+                    sample_window)
+        # The blocks are compared, and their results used, in order
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, _init_worker, settings)
+            try:
+                results = pool.imap(_verify_block_worker, tasks)
+                for block_digests, block_mismatches in results:
+                    nblocks += 1
+                    traces_digest.update(block_digests)
+                    _add_mismatches(mismatches, block_mismatches)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            verifier = _BlockVerifier(segy, _open(netcdf_path, "r"),
+                                      *settings[2:])
+            try:
+                for task in tasks:
+                    if verbose:
+                        click.echo("verifying traces {} to {}".format(
+                            task[0][0], task[0][1] - 1))
+                    block_digests, block_mismatches = verifier.verify(*task)
+                    nblocks += 1
+                    traces_digest.update(block_digests)
+                    _add_mismatches(mismatches, block_mismatches)
+            finally:
+                verifier.rootgrp.close()
+
+    digest.update(traces_digest.digest())
+    hexdigest = digest.hexdigest()
+    if write_digest and not mismatches:
+        rootgrp = _open(netcdf_path, "a")
+        try:
+            rootgrp.setncattr(DIGEST_ATTRIBUTE, hexdigest)
+        finally:
+            rootgrp.close()
+    return {"mismatches": mismatches, "digest": hexdigest, "blocks": nblocks}
+
+
+def _open(path, mode):
+    """Open the output of segy2netcdf, as a netCDF4 Dataset or ZarrDataset."""
+    if os.path.isdir(str(path)):
+        return ZarrDataset(path, "r+" if mode == "a" else mode)
+    return Dataset(path, mode)
+
+
+def _check_layout(segy, rootgrp, dim_names, dim_lens, ntraces, coords,
+                  sample_window, samples_dim_name=None):
+    """Check that the output is complete, and has the expected shape.
+
+    Returns:
+        A list of strings describing the problems found
+    """
+    problems = []
+    if s2n.CHECKPOINT_ATTRIBUTE in rootgrp.ncattrs():
+        problems.append("the conversion is incomplete")
+    if samples_dim_name and dim_names[-1] != samples_dim_name:
+        problems.append("the trace samples dimension is {}, not "
+                        "{}".format(dim_names[-1], samples_dim_name))
+    ns = len(s2n._sample_indexes(segy, sample_window))
+    if dim_lens[-1] != ns:
+        problems.append("traces have {} samples, not {}".format(dim_lens[-1],
+                                                                ns))
+    if coords is not None:
+        expected = [len(c) for c in coords]
+        if dim_lens[:-1] != expected:
+            problems.append("the dimensions have lengths {}, not "
+                            "{}".format(dim_lens[:-1], expected))
+    else:
+        output_ntraces = int(np.prod(dim_lens[:-1], dtype=np.int64))
+        if output_ntraces != ntraces:
+            problems.append("there are {} traces, not {}".format(
+                output_ntraces, ntraces))
+    return problems
+
+
+def _check_dimensions(segy, rootgrp, dim_names, dim_lens, coords,
+                      trace_ids, sample_window, digest):
+    """Compare the trace samples dimension and the dimension coordinates.
+
+       The coordinates are read with segyio. Their values, as stored, are
+       added to the digest.
+
+    Returns:
+        A list of strings describing the mismatches found
+    """
+    mismatches = []
+    v = rootgrp.variables.get(dim_names[-1])
+    if v is not None:
+        expected = s2n._sample_indexes(segy, sample_window)
+        mismatches += _compare(v, expected, v[:], digest=digest)
+    for i, name in enumerate(dim_names[:-1]):
+        v = rootgrp.variables.get(name)
+        if v is None or name not in segyio.tracefield.keys:
+            continue
+        if coords is not None:
+            expected = coords[i]
+        else:
+            expected = s2n._dim_coordinates(segy, None, name, dim_names,
+                                            dim_lens, trace_ids)
+        mismatches += _compare(v, expected, v[:], digest=digest)
+    return mismatches
+
+
+def _block_tasks(trace_dim_lens, trace_nbytes, max_memory, positions=None):
+    """Make the blocks of traces to compare, as segy2netcdf._copy_data does.
+
+    Yields:
+        (block, trace_ids, block_positions) tuples: the block (see
+        _trace_blocks), and, if positions is provided, the indices of the
+        traces in it and their positions in the block
+    """
+    blocks = s2n._trace_blocks(trace_dim_lens, trace_nbytes, max_memory)
+    if positions is None:
+        for block in blocks:
+            yield block, None, None
+        return
+    order = np.argsort(positions, kind="stable")
+    sorted_positions = positions[order]
+    for block in blocks:
+        start = np.searchsorted(sorted_positions, block[0])
+        stop = np.searchsorted(sorted_positions, block[1])
+        yield block, order[start:stop], sorted_positions[start:stop] - block[0]
+
+
+class _BlockVerifier(object):
+    """Compare blocks of traces of a SEG-Y file and the output made from it.
+
+    Args:
+        segy: The SEG-Y file opened with segyio
+        rootgrp: The output, opened for reading
+        header_names: A list of the names of the trace header variables
+        constant_names: A list of the names of trace headers stored as
+            attributes of the output (by compact_headers)
+        sample_window: The samples of each trace that were copied (see
+            segy2netcdf._sample_window)
+    """
+
+    def __init__(self, segy, rootgrp, header_names, constant_names,
+                 sample_window=None):
+        self.segy = segy
+        self.rootgrp = rootgrp
+        self.header_names = header_names
+        self.constant_names = constant_names
+        self.sample_window = sample_window
+        self.samples_var = rootgrp["Samples"]
+        self.packing = s2n._samples_packing(self.samples_var)
+        self.tolerance = _sample_tolerance(self.samples_var, segy.dtype)
+
+    def verify(self, block, trace_ids=None, block_positions=None):
+        """Compare one block of traces (see _block_tasks).
+
+        Returns:
+            trace_digests: The SHA-256 digests of the values in the output
+                of each trace in the block, in order, joined
+            mismatches: A list of strings describing the mismatches found
+        """
+        start, stop, index, shape = block
+        names = self.header_names + self.constant_names
+        samples, headers = self._read(start, stop, names, trace_ids)
+        if trace_ids is not None:
+            samples = _place(samples, block_positions, stop - start)
+            headers = dict((name, _place(headers[name], block_positions,
+                                         stop - start))
+                           for name in names)
+        samples = samples.reshape(tuple(shape) + samples.shape[-1:])
+        rows = []
+        mismatches = _compare(self.samples_var, samples,
+                              self.samples_var[index], self.tolerance, rows,
+                              packing=self.packing)
+        for name in self.header_names:
+            v = self.rootgrp[name]
+            mismatches += _compare(v, np.reshape(headers[name], shape),
+                                   v[index], rows=rows)
+        for name in self.constant_names:
+            values = np.ma.compressed(np.ma.asarray(headers[name]))
+            if np.any(values != self.rootgrp.getncattr(name)):
+                mismatches.append("{} is not constant".format(name))
+        rows = np.concatenate([np.reshape(values, (stop - start, -1))
+                               for values in rows], axis=1)
+        trace_digests = b"".join(hashlib.sha256(row).digest()
+                                 for row in rows)
+        return trace_digests, ["{} in traces {} to {}".format(
+            mismatch, start, stop - 1) for mismatch in mismatches]
+
+    def _read(self, start, stop, names, trace_ids=None):
+        """Read traces start to stop, or trace_ids, with segyio.
+
+           Only the samples in sample_window are kept, and the
+           TRACE_SAMPLE_COUNT and TRACE_SAMPLE_INTERVAL headers are changed
+           to describe them, as segy2netcdf stores them.
+
+        Returns:
+            samples: A NumPy array with one row per trace
+            headers: A dictionary from the name of each header to a NumPy
+                array of its values
+        """
+        segy = self.segy
+        if trace_ids is None:
+            samples = segy.trace.raw[start:stop]
+            ids = slice(start, stop)
+        else:
+            samples = np.empty((len(trace_ids), len(segy.samples)),
+                               segy.dtype)
+            for i, trace_id in enumerate(trace_ids):
+                samples[i] = segy.trace.raw[int(trace_id)]
+            ids = trace_ids
+        headers = dict((name, segy.attributes(
+            segyio.tracefield.keys[name])[ids]) for name in names)
+        if self.sample_window is not None:
+            samples = samples[:, self.sample_window]
+            for name in names:
+                if name == "TRACE_SAMPLE_COUNT":
+                    headers[name][:] = samples.shape[1]
+                elif name == "TRACE_SAMPLE_INTERVAL":
+                    headers[name] *= self.sample_window.step
+        return samples, headers
+
+
+def _place(values, positions, ntraces):
+    """Place the values of traces at their positions in a block of traces.
+
+    Returns:
+        A NumPy masked array with ntraces rows, where the rows that do not
+        correspond to a trace are masked
+    """
+    block = np.ma.masked_all((ntraces,) + values.shape[1:], values.dtype)
+    block[positions] = values
+    return block
+
+
+def _sample_tolerance(v, source_dtype):
+    """Get the (atol, rtol) within which the stored trace data should match.
+
+       Differences are only allowed for the lossy ways of storing the trace
+       data: quantization (see _quantize_tolerance), packing into integers
+       with scale_factor and add_offset (half of scale_factor, plus the
+       rounding of 4 byte floats), and rounding to a float type with less
+       precision than the trace data of the SEG-Y file (half a unit in the
+       last place, as for sample_dtype f2). The tolerances of these are
+       added.
+
+    Args:
+        v: The Samples variable
+        source_dtype: The NumPy type of the trace data, as segyio reads it
+
+    Returns:
+        An (atol, rtol) tuple, or None if the values should match exactly
+    """
+    tolerances = []
+    quantize = _quantize_tolerance(v)
+    if quantize is not None:
+        tolerances.append(quantize)
+    attrs = v.ncattrs()
+    if "scale_factor" in attrs and "add_offset" in attrs:
+        tolerances.append((0.5 * abs(float(v.getncattr("scale_factor"))),
+                           float(np.finfo(np.float32).eps)))
+    elif v.dtype.kind == "f" and _precision(v.dtype) < _precision(
+            source_dtype):
+        info = np.finfo(v.dtype)
+        tolerances.append((float(info.smallest_subnormal) / 2,
+                           float(info.eps) / 2))
+    if not tolerances:
+        return None
+    return (sum(atol for atol, _ in tolerances),
+            sum(rtol for _, rtol in tolerances))
+
+
+def _precision(dtype):
+    """Get the number of significant bits of a NumPy int or float type."""
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return np.finfo(dtype).nmant + 1
+    return 8 * dtype.itemsize - (dtype.kind == "i")
+
+
+def _quantize_tolerance(v):
+    """Get the (atol, rtol) within which quantized values should match.
+
+       netCDF4 records least_significant_digit as an attribute, and
+       significant digits as attributes named after the quantization
+       algorithm. Values that are not quantized should match exactly.
+    """
+    attrs = v.ncattrs()
+    if "least_significant_digit" in attrs:
+        return 10.0 ** -int(v.getncattr("least_significant_digit")), 0.0
+    for name in attrs:
+        if name.startswith("_Quantize") \
+                and name.endswith("NumberOfSignificantDigits"):
+            return 0.0, 10.0 ** (1 - int(v.getncattr(name)))
+    return None
+
+
+def _compare(v, expected, actual, tolerance=None, rows=None, digest=None,
+             packing=None):
+    """Compare values read from the SEG-Y file with those in the output.
+
+       The values are compared as 8 byte integers, or as 8 byte floats if
+       either of them are floats, so that a value that was changed when it
+       was stored (by wrapping around in a smaller integer type, for
+       example) does not match. If packing (see
+       segy2netcdf._samples_packing) is provided, the values in the output
+       are unpacked first. Floats are compared exactly (with NaNs equal),
+       or, if tolerance is provided, within its (atol, rtol). Missing
+       (masked) values should be the variable's fill value in the output.
+       The values in the output, as stored (little-endian bytes), are added
+       to the digest, if provided, or appended to the list rows.
+
+    Returns:
+        A list with a string describing the mismatch, or an empty list
+    """
+    fill_value = _variable_fill_value(v)
+    actual = np.ma.filled(actual, fill_value)
+    values = np.ascontiguousarray(actual, actual.dtype.newbyteorder("<"))
+    if digest is not None:
+        digest.update(v.name.encode())
+        digest.update(values.tobytes())
+    if rows is not None:
+        rows.append(values.view(np.uint8))
+    expected = np.ma.asarray(expected)
+    if expected.shape != actual.shape:
+        return ["{} has shape {}, not {}".format(v.name, actual.shape,
+                                                 expected.shape)]
+    missing = np.ma.getmaskarray(expected)
+    differ = missing & ~_equal(actual, fill_value)
+    stored = actual[~missing]
+    wanted = expected.data[~missing]
+    if packing is not None:
+        stored = (stored.astype(np.float64)
+                  * float(packing["scale_factor"])
+                  + float(packing["add_offset"]))
+    if stored.dtype.kind == "f" or wanted.dtype.kind == "f":
+        stored = stored.astype(np.float64)
+        wanted = wanted.astype(np.float64)
+        if tolerance is None:
+            close = _equal(stored, wanted)
+        else:
+            close = np.isclose(stored, wanted, rtol=tolerance[1],
+                               atol=tolerance[0], equal_nan=True)
+    else:
+        close = stored.astype(np.int64) == wanted.astype(np.int64)
+    ndiffer = int(np.count_nonzero(differ)) + int(np.count_nonzero(~close))
+    if ndiffer:
+        return ["{} differs in {} values".format(v.name, ndiffer)]
+    return []
+
+
+def _equal(a, b):
+    """Compare values exactly, with NaNs equal."""
+    equal = np.asarray(a == b)
+    if np.asarray(a).dtype.kind == "f" or np.asarray(b).dtype.kind == "f":
+        equal |= np.isnan(a) & np.isnan(b)
+    return equal
+
+
+def _variable_fill_value(v):
+    """Get the value that missing values of a variable are stored as."""
+    if "_FillValue" in v.ncattrs():
+        return v.getncattr("_FillValue")
+    if isinstance(v, netCDF4.Variable):
+        return netCDF4.default_fillvals.get(v.dtype.str[1:], np.nan)
+    return v.fill_value
+
+
+def _add_mismatches(mismatches, new):
+    """Add to the list of mismatches, up to MAX_MISMATCHES."""
+    mismatches.extend(new[:MAX_MISMATCHES - len(mismatches)])
+
+
+# Files opened by each process of the pool in verify_netcdf
+_worker_verifier = None
+
+
+def _init_worker(segy_path, netcdf_path, header_names, constant_names,
+                 sample_window):
+    """Open the SEG-Y file and the output in a process of the pool."""
+    global _worker_verifier
+    segy = segyio.open(segy_path, ignore_geometry=True)
+    _worker_verifier = _BlockVerifier(
+        segy, _open(netcdf_path, "r"), header_names, constant_names,
+        sample_window)
+
+
+def _verify_block_worker(task):
+    """Compare one block of traces in a process of the pool."""
+    return _worker_verifier.verify(*task)
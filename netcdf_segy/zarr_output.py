@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""Zarr output: write the layout made by segy2netcdf to a Zarr store.
+
+ZarrDataset wraps a Zarr group with the part of the netCDF4.Dataset
+interface that segy2netcdf uses (creating dimensions and variables, writing
+hyperslabs, and attributes), so that the same code can write either format.
+Each variable is a Zarr array with the names of its dimensions in its
+metadata, so the store can be opened with xarray.open_zarr. As every chunk
+of a Zarr array is a separate object, blocks of traces that do not share
+chunks can be written by several processes at once. This requires the
+optional zarr (version 3 or later) package.
+"""
+import collections
+import warnings
+import numpy as np
+from netCDF4 import default_fillvals
+
+# Names of the Blosc compressors used for each compression filter
+BLOSC_CNAMES = {
+    "zlib": "zlib",
+    "zstd": "zstd",
+    "blosc_lz": "blosclz",
+    "blosc_lz4": "lz4",
+    "blosc_lz4hc": "lz4hc",
+    "blosc_zlib": "zlib",
+    "blosc_zstd": "zstd",
+}
+
+
+def _import_zarr():
+    """Import zarr, with a helpful message if it is not installed."""
+    try:
+        import zarr
+    except ImportError:
+        raise ImportError("Zarr output requires the zarr package")
+    return zarr
+
+
+class ZarrDimension(object):
+    """A dimension of a ZarrDataset, with a fixed length."""
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def isunlimited(self):
+        return False
+
+
+class ZarrVariable(object):
+    """A Zarr array used like a netCDF4.Variable.
+
+       Masked values written to it are replaced by its fill value.
+    """
+
+    def __init__(self, array, dataset):
+        self._array = array
+        self._dataset = dataset
+        self.name = array.basename
+        self.dimensions = tuple(array.metadata.dimension_names)
+
+    @property
+    def shape(self):
+        return self._array.shape
+
+    @property
+    def dtype(self):
+        return self._array.dtype
+
+    @property
+    def chunks(self):
+        return self._array.chunks
+
+    @property
+    def fill_value(self):
+        return self._array.fill_value
+
+    def group(self):
+        return self._dataset
+
+    def __getitem__(self, index):
+        return self._array[index]
+
+    def __setitem__(self, index, values):
+        if np.ma.isMaskedArray(values):
+            # Convert first, as the fill value may not fit the input's type
+            values = values.astype(self._array.dtype).filled(
+                self._array.fill_value)
+        self._array[index] = values
+
+    def set_auto_scale(self, value):
+        """Nothing to do: values are never packed or unpacked."""
+
+    def ncattrs(self):
+        return list(self._array.attrs.keys())
+
+    def getncattr(self, name):
+        return self._array.attrs[name]
+
+    def setncattr(self, name, value):
+        self._array.attrs[name] = _attribute_value(value)
+
+
+class ZarrDataset(object):
+    """A Zarr group used like a netCDF4.Dataset.
+
+    Args:
+        path: A string specifying the path to the Zarr store (a directory)
+        mode: An optional string: 'r' to read, 'a' to modify an existing
+            store, or 'w' to create a new store, replacing any existing
+            one. Default 'r'.
+    """
+
+    def __init__(self, path, mode="r"):
+        zarr = _import_zarr()
+        self.path = str(path)
+        self._group = zarr.open_group(self.path, mode=mode)
+        self.dimensions = collections.OrderedDict()
+        self.variables = collections.OrderedDict()
+        for name, array in self._group.arrays():
+            variable = ZarrVariable(array, self)
+            self.variables[name] = variable
+            for dim_name, size in zip(variable.dimensions, array.shape):
+                self.dimensions[dim_name] = ZarrDimension(dim_name, size)
+
+    def createDimension(self, name, size):
+        if size is None:
+            raise ValueError("Zarr output does not support unlimited "
+                             "dimensions")
+        self.dimensions[name] = ZarrDimension(name, size)
+        return self.dimensions[name]
+
+    def createVariable(self, name, dtype, dimensions, compression=None,
+                       complevel=4, shuffle=True, chunksizes=None,
+                       fill_value=None, least_significant_digit=None,
+                       significant_digits=None):
+        """Create a variable, with the arguments of netCDF4's.
+
+           fill_value False means no fill value, and None means NetCDF's
+           default for the type (or NaN for 2 byte floats, which NetCDF
+           does not support).
+        """
+        zarr = _import_zarr()
+        if isinstance(dimensions, str):
+            dimensions = (dimensions,)
+        dimensions = tuple(dimensions)
+        if significant_digits is not None:
+            raise ValueError("significant_digits is not supported with Zarr "
+                             "output; use least_significant_digit")
+        shape = tuple(len(self.dimensions[dim]) for dim in dimensions)
+        dtype = np.dtype(dtype)
+        if fill_value is None:
+            fill_value = default_fillvals.get(dtype.str[1:], np.nan)
+        elif fill_value is False:
+            fill_value = 0
+        filters = None
+        if least_significant_digit is not None:
+            filters = [zarr.codecs.Quantize(digits=least_significant_digit,
+                                            dtype=dtype.str)]
+        chunks = "auto" if chunksizes is None else tuple(chunksizes)
+        array = self._group.create_array(
+            name, shape=shape, dtype=dtype, chunks=chunks,
+            filters=filters if filters else "auto",
+            compressors=_compressors(compression, complevel, shuffle,
+                                     dtype.itemsize),
+            fill_value=dtype.type(fill_value), dimension_names=dimensions)
+        if least_significant_digit is not None:
+            # As netCDF4 does, so readers know the precision of the values
+            array.attrs["least_significant_digit"] = least_significant_digit
+        self.variables[name] = ZarrVariable(array, self)
+        return self.variables[name]
+
+    def __getitem__(self, name):
+        return self.variables[name]
+
+    def ncattrs(self):
+        return list(self._group.attrs.keys())
+
+    def getncattr(self, name):
+        return self._group.attrs[name]
+
+    def setncattr(self, name, value):
+        self._group.attrs[name] = _attribute_value(value)
+
+    def setncatts(self, attributes):
+        self._group.attrs.update(dict(
+            (name, _attribute_value(value))
+            for name, value in attributes.items()))
+
+    def delncattr(self, name):
+        del self._group.attrs[name]
+
+    def sync(self):
+        """Nothing to do: every write is stored when it is made."""
+
+    def close(self):
+        """Consolidate the metadata of a store that was written to.
+
+           Every write is stored when it is made, but consolidated
+           metadata lets readers such as xarray.open_zarr find all of the
+           arrays with one read.
+        """
+        if not self._group.read_only:
+            with warnings.catch_warnings():
+                # Zarr warns that consolidated metadata is not yet part of
+                # the version 3 specification
+                warnings.simplefilter("ignore")
+                _import_zarr().consolidate_metadata(self.path)
+
+
+def open_variable(path, name):
+    """Open one variable of a Zarr store for writing, in another process."""
+    return ZarrDataset(path, "r+")[name]
+
+
+def _compressors(compression, complevel, shuffle, itemsize):
+    """Make the Zarr compressor equivalent to NetCDF compression options.
+
+       Each filter is applied with Blosc, which also provides the
+       byte-shuffle filter.
+    """
+    if compression is None:
+        return None
+    if compression not in BLOSC_CNAMES:
+        raise ValueError("{} compression is not supported with Zarr "
+                         "output".format(compression))
+    zarr = _import_zarr()
+    return zarr.codecs.BloscCodec(
+        cname=BLOSC_CNAMES[compression], clevel=complevel,
+        shuffle="shuffle" if shuffle else "noshuffle", typesize=itemsize)
+
+
+def _attribute_value(value):
+    """Convert a NumPy scalar attribute to a JSON-serializable value."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
@@ -9,10 +9,17 @@ with open('README.rst') as readme_file:
 requirements = [
     'Click>=6.0',
     'segyio',
-    'netCDF4',
+    'netCDF4>=1.6',
     'numpy'
 ]
 
+extras_requirements = {
+    'xarray': ['xarray', 'dask'],
+    # zarr 3 itself requires Python 3.11 or later
+    'zarr': ['zarr>=3'],
+    'benchmarks': ['pytest', 'pytest-benchmark'],
+}
+
 test_requirements = [
     'pytest'
 ]
@@ -32,11 +39,16 @@ setup(
                  'netcdf_segy'},
     entry_points={
         'console_scripts': [
-            'segy2netcdf=netcdf_segy.segy2netcdf:cli'
+            'segy2netcdf=netcdf_segy.segy2netcdf:cli',
+            'netcdf2segy=netcdf_segy.netcdf2segy:cli',
+            'segy2netcdf-batch=netcdf_segy.batch:cli',
+            'segy2netcdf-daemon=netcdf_segy.daemon:cli'
         ]
     },
     include_package_data=True,
+    python_requires='>=3.7',
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="GNU General Public License v3",
     zip_safe=False,
     keywords='netcdf_segy',
@@ -45,11 +57,14 @@ setup(
         'Intended Audience :: Developers',
         'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
         'Natural Language :: English',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
     ],
     test_suite='tests',
     tests_require=test_requirements
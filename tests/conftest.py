@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Fixtures shared by the tests.
+"""
+
+import numpy as np
+import pytest
+import segyio
+
+
+@pytest.fixture
+def segy_unsorted(tmpdir):
+    """A SEG-Y file of an inline/crossline grid, with traces in random order
+       and two traces missing. Each sample is 100 * inline + crossline."""
+    path = str(tmpdir.join("unsorted.segy"))
+    grid = [(il, xl) for il in (30, 10, 20) for xl in (4, 1, 3, 2)]
+    rng = np.random.RandomState(0)
+    rng.shuffle(grid)
+    grid = grid[2:]
+    spec = segyio.spec()
+    spec.format = 5
+    spec.samples = range(5)
+    spec.tracecount = len(grid)
+    with segyio.create(path, spec) as segy:
+        for i, (il, xl) in enumerate(grid):
+            segy.header[i] = {segyio.TraceField.INLINE_3D: il,
+                              segyio.TraceField.CROSSLINE_3D: xl,
+                              segyio.TraceField.CDP: il * 100 + xl}
+            segy.trace[i] = np.full(5, il * 100 + xl, np.float32)
+    return path, grid
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Tests for batch.
+"""
+
+import os
+import shutil
+from click.testing import CliRunner
+from netCDF4 import Dataset
+import pytest
+from netcdf_segy import batch
+
+
+@pytest.fixture
+def segy_files(tmpdir):
+    paths = []
+    for name in ["a.segy", "b.segy", "c.segy"]:
+        path = str(tmpdir.join(name))
+        shutil.copy("tests/testsegy1.segy", path)
+        paths.append(path)
+    return paths
+
+
+class Test_find_jobs:
+    def test_glob(self, tmpdir, segy_files):
+        jobs = batch._find_jobs([str(tmpdir.join("*.segy"))])
+        assert jobs == [(path, path[:-5] + ".nc") for path in segy_files]
+
+    def test_output_dir(self, segy_files):
+        jobs = batch._find_jobs(segy_files[:1], output_dir="out")
+        assert jobs == [(segy_files[0], os.path.join("out", "a.nc"))]
+
+    def test_manifest(self, tmpdir, segy_files):
+        manifest = tmpdir.join("manifest.txt")
+        manifest.write("# comment\n{} x.nc\n\n{}\n".format(segy_files[0],
+                                                           segy_files[1]))
+        jobs = batch._find_jobs(segy_files[:1], str(manifest))
+        assert jobs == [(segy_files[0], segy_files[0][:-5] + ".nc"),
+                        (segy_files[1], segy_files[1][:-5] + ".nc")]
+
+    def test_same_input(self, tmpdir, segy_files):
+        jobs = batch._find_jobs([segy_files[0], str(tmpdir.join("*.segy"))])
+        assert [segy_path for segy_path, _ in jobs] == segy_files
+
+    def test_same_output(self, tmpdir, segy_files):
+        other = str(tmpdir.join("a.sgy"))
+        shutil.copy(segy_files[0], other)
+        with pytest.raises(ValueError, match="a.nc"):
+            batch._find_jobs([segy_files[0], other])
+
+    def test_same_output_dir(self, tmpdir, segy_files):
+        other = tmpdir.mkdir("other").join("a.segy")
+        shutil.copy(segy_files[0], str(other))
+        with pytest.raises(ValueError, match="both"):
+            batch._find_jobs([segy_files[0], str(other)],
+                             output_dir=str(tmpdir.join("out")))
+
+
+class Test_segy2netcdf_batch:
+    @pytest.mark.parametrize("check", ["mtime", "checksum"])
+    def test_skip(self, segy_files, check):
+        jobs = batch._find_jobs(segy_files)
+        summary = batch.segy2netcdf_batch(jobs, 2, check,
+                                          d=(("FieldRecord", 3),))
+        assert len(summary["converted"]) == 3
+        assert summary["bytes"] == 3 * os.path.getsize(segy_files[0])
+        for _, netcdf_path in jobs:
+            rootgrp = Dataset(netcdf_path, "r")
+            assert rootgrp["Samples"].shape == (10, 3, 20)
+            if check == "checksum":
+                assert len(rootgrp.getncattr(batch.CHECKSUM_ATTRIBUTE)) == 64
+            rootgrp.close()
+        summary = batch.segy2netcdf_batch(jobs, 2, check)
+        assert len(summary["skipped"]) == 3
+        summary = batch.segy2netcdf_batch(jobs, 2, check, force=True)
+        assert len(summary["converted"]) == 3
+
+    def test_modified(self, segy_files):
+        jobs = batch._find_jobs(segy_files[:1])
+        batch.segy2netcdf_batch(jobs, 1, "checksum")
+        with open(segy_files[0], "r+b") as f:
+            f.seek(3600 + 240)
+            f.write(b"\x00\x00\x00\x00")
+        summary = batch.segy2netcdf_batch(jobs, 1, "checksum")
+        assert len(summary["converted"]) == 1
+
+    def test_failed(self, tmpdir, segy_files):
+        bad = str(tmpdir.join("bad.segy"))
+        with open(bad, "wb") as f:
+            f.write(b"not a SEG-Y file")
+        jobs = batch._find_jobs(segy_files[:1] + [bad])
+        summary = batch.segy2netcdf_batch(jobs, 2)
+        assert len(summary["converted"]) == 1
+        assert len(summary["failed"]) == 1
+        assert summary["failed"][0]["segy_path"] == bad
+        assert not os.path.exists(jobs[1][1])
+        assert not os.path.exists(jobs[1][1] + ".part")
+
+
+class Test_cli:
+    def test_cli(self, tmpdir, segy_files):
+        runner = CliRunner()
+        out = str(tmpdir.join("out"))
+        result = runner.invoke(batch.cli, [str(tmpdir.join("*.segy")),
+                                           "--output-dir", out,
+                                           "--processes", "2"])
+        assert result.exit_code == 0
+        assert "converted 3, skipped 0, failed 0" in result.output
+        assert sorted(os.listdir(out)) == ["a.nc", "b.nc", "c.nc"]
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Tests for daemon.
+"""
+
+import http.client
+import json
+import os
+import shutil
+import socket
+import stat
+import threading
+from netCDF4 import Dataset
+import pytest
+from netcdf_segy import batch, daemon
+from netcdf_segy.zarr_output import ZarrDataset
+
+
+@pytest.fixture
+def segy_files(tmpdir):
+    paths = []
+    for name in ["a.segy", "b.segy"]:
+        path = str(tmpdir.join(name))
+        shutil.copy("tests/testsegy1.segy", path)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def conversion_daemon():
+    conversion_daemon = daemon.ConversionDaemon(processes=2)
+    yield conversion_daemon
+    conversion_daemon.close()
+
+
+@pytest.fixture
+def token_file(tmpdir):
+    return str(tmpdir.join("token"))
+
+
+@pytest.fixture(params=["tcp", "unix"])
+def server(request, tmpdir, conversion_daemon, token_file):
+    if request.param == "tcp":
+        address = ("127.0.0.1", 0)
+    else:
+        address = str(tmpdir.join("daemon.sock"))
+    token = daemon.write_token(token_file)
+    server = daemon.make_server(conversion_daemon, address, token)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def job(job_id, nbytes):
+    return {"id": job_id, "bytes": nbytes}
+
+
+class Test_next_job:
+    @pytest.mark.parametrize("schedule,expected", [("smallest", 2),
+                                                   ("largest", 3),
+                                                   ("fifo", 1)])
+    def test_schedule(self, schedule, expected):
+        queued = [job(1, 20), job(2, 10), job(3, 30), job(4, 10)]
+        assert daemon._next_job(queued, schedule)["id"] == expected
+
+
+class Test_ConversionDaemon:
+    def test_convert(self, tmpdir, segy_files, conversion_daemon):
+        d = (("FieldRecord", 3), ("GroupX", 10))
+        for segy_path in segy_files:
+            report = conversion_daemon.submit(
+                segy_path, segy_path[:-5] + ".nc", d=[list(x) for x in d],
+                compress=True)
+            assert report["status"] in ["queued", "running"]
+        assert conversion_daemon.wait(60)
+        for report in conversion_daemon.report():
+            assert report["status"] == "converted"
+            assert report["error"] is None
+            assert report["progress"] == 1.0
+            assert report["bytes_copied"] == 30 * (240 + 20 * 4)
+            rootgrp = Dataset(report["netcdf_path"], "r")
+            assert rootgrp["Samples"].dimensions == ("FieldRecord", "GroupX",
+                                                     "SampleNumber")
+            rootgrp.close()
+
+    def test_zarr(self, tmpdir, segy_files, conversion_daemon):
+        pytest.importorskip("zarr")
+        zarr_path = str(tmpdir.join("out.zarr"))
+        for _ in range(2):
+            # The second job replaces the store made by the first
+            report = conversion_daemon.submit(
+                segy_files[0], zarr_path, check="checksum", force=True,
+                output_format="zarr")
+            assert conversion_daemon.wait(60)
+            report = conversion_daemon.report(report["id"])
+            assert report["status"] == "converted", report["error"]
+        assert not os.path.exists(zarr_path + ".part")
+        rootgrp = ZarrDataset(zarr_path)
+        assert rootgrp["Samples"].shape == (30, 20)
+        assert batch.CHECKSUM_ATTRIBUTE in rootgrp.ncattrs()
+        rootgrp.close()
+
+    def test_failed(self, tmpdir, conversion_daemon):
+        segy_path = str(tmpdir.join("bad.segy"))
+        with open(segy_path, "wb") as f:
+            f.write(b"not SEG-Y")
+        report = conversion_daemon.submit(segy_path, segy_path + ".nc")
+        assert conversion_daemon.wait(60)
+        report = conversion_daemon.report(report["id"])
+        assert report["status"] == "failed"
+        assert report["error"]
+        assert not os.path.exists(segy_path + ".nc")
+
+    def test_invalid(self, tmpdir, segy_files, conversion_daemon):
+        with pytest.raises(ValueError):
+            conversion_daemon.submit(str(tmpdir.join("missing.segy")),
+                                     "out.nc")
+        with pytest.raises(ValueError):
+            conversion_daemon.submit(segy_files[0], "out.nc", append=True)
+        with pytest.raises(ValueError):
+            daemon.ConversionDaemon(1, "random")
+
+
+class Test_make_server:
+    def test_not_socket(self, tmpdir, conversion_daemon):
+        path = tmpdir.join("daemon.sock")
+        path.write("data")
+        with pytest.raises(ValueError, match="not a socket"):
+            daemon.make_server(conversion_daemon, str(path), "token")
+        assert path.read() == "data"
+
+    def test_listening(self, tmpdir, conversion_daemon):
+        path = str(tmpdir.join("daemon.sock"))
+        server = daemon.make_server(conversion_daemon, path, "token")
+        try:
+            with pytest.raises(ValueError, match="already listening"):
+                daemon.make_server(conversion_daemon, path, "token")
+        finally:
+            server.server_close()
+        assert os.path.exists(path)
+
+    def test_stale(self, tmpdir, conversion_daemon):
+        path = str(tmpdir.join("daemon.sock"))
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        server = daemon.make_server(conversion_daemon, path, "token")
+        server.server_close()
+
+
+class Test_write_token:
+    def test_user_only(self, token_file):
+        token = daemon.write_token(token_file)
+        assert len(token) == 64
+        assert stat.S_IMODE(os.stat(token_file).st_mode) == 0o600
+        assert daemon.read_token(token_file) == token
+        assert daemon.write_token(token_file) != token
+
+
+class Test_api:
+    def test_submit(self, tmpdir, segy_files, server, token_file):
+        address = server.server_address
+        report = daemon.submit_job(address, segy_files[0],
+                                   str(tmpdir.join("out.nc")), token_file,
+                                   d=[["FieldRecord", 3], ["GroupX", 10]])
+        assert server.daemon.wait(60)
+        report = daemon.get_job(address, report["id"], token_file)
+        assert report["status"] == "converted"
+        assert report["netcdf_path"] == str(tmpdir.join("out.nc"))
+        assert [r["id"] for r in daemon.get_job(address, None,
+                                                token_file)] \
+            == [report["id"]]
+
+    def test_errors(self, segy_files, server, token_file):
+        address = server.server_address
+        with pytest.raises(ValueError, match="unsupported options"):
+            daemon.submit_job(address, segy_files[0], "out.nc", token_file,
+                              resume=True)
+        with pytest.raises(ValueError, match="no job"):
+            daemon.get_job(address, 7, token_file)
+
+    def test_wrong_token(self, tmpdir, server):
+        token_file = str(tmpdir.join("other_token"))
+        daemon.write_token(token_file)
+        with pytest.raises(ValueError, match="token"):
+            daemon.get_job(server.server_address, None, token_file)
+
+    @pytest.mark.parametrize("headers,status", [
+        ({"Content-Type": "text/plain"}, 415),
+        ({}, 415),
+        ({"Content-Type": "application/json", "Host": "evil.example:80"},
+         403),
+        ({"Content-Type": "application/json", "Authorization": ""}, 403),
+    ])
+    def test_rejected(self, segy_files, conversion_daemon, token_file,
+                      headers, status):
+        token = daemon.write_token(token_file)
+        server = daemon.make_server(conversion_daemon, ("127.0.0.1", 0),
+                                    token)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            headers = dict({"Authorization": "Bearer " + token}, **headers)
+            body = json.dumps({"segy_path": segy_files[0],
+                               "netcdf_path": segy_files[0] + ".nc"})
+            connection = http.client.HTTPConnection(*server.server_address)
+            connection.request("POST", "/jobs", body, headers)
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            assert response.status == status
+            assert conversion_daemon.report() == []
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Tests for ibm.
+"""
+
+import numpy as np
+from netcdf_segy import ibm
+
+
+class Test_ibm2ieee:
+    def test_known(self):
+        # Examples from the IBM floating point documentation
+        bits = np.array([0x42640000, 0xC276A000, 0x00000000, 0x41100000],
+                        dtype=np.uint32)
+        assert np.array_equal(ibm.ibm2ieee(bits),
+                              np.float32([100.0, -118.625, 0.0, 1.0]))
+
+
+class Test_ieee2ibm:
+    def test_known(self):
+        data = np.float32([100.0, -118.625, 0.0, 1.0])
+        assert np.array_equal(
+            ibm.ieee2ibm(data),
+            np.array([0x42640000, 0xC276A000, 0x00000000, 0x41100000],
+                     dtype=np.uint32)
+        )
+
+    def test_roundtrip(self):
+        rng = np.random.RandomState(0)
+        bits = rng.randint(0, 2 ** 32, 10000, dtype=np.uint64).astype(
+            np.uint32)
+        # Keep normalised IBM floats within the range of normal float32s
+        bits = ((bits & np.uint32(0x80FFFFFF)) | np.uint32(0x00100000)
+                | (rng.randint(35, 95, 10000).astype(np.uint32) << 24))
+        assert np.array_equal(ibm.ieee2ibm(ibm.ibm2ieee(bits)), bits)
+
+    def test_not_finite(self):
+        data = np.float32([np.inf, -np.inf])
+        assert np.array_equal(ibm.ieee2ibm(data),
+                              np.array([0x7FFFFFFF, 0xFFFFFFFF],
+                                       dtype=np.uint32))
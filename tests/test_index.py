@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Tests for index.
+"""
+
+from netCDF4 import Dataset
+import numpy as np
+import pytest
+from netcdf_segy import index, segy2netcdf
+
+
+class Test_build_index:
+    def test_build_index(self):
+        values = np.array([5, 3, 5, 1, 3, 5])
+        positions = np.array([10, 0, 2, 7, 4, 1])
+        result = index.build_index(values, positions)
+        assert result["values"].tolist() == [1, 3, 5]
+        assert result["start"].tolist() == [0, 1, 3]
+        assert result["count"].tolist() == [1, 2, 3]
+        assert result["positions"].tolist() == [7, 0, 4, 1, 2, 10]
+
+
+class Test_segy2netcdf_index:
+    def test_stats(self, tmpdir):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                index_headers=["FieldRecord", "GroupX"],
+                                max_memory=240 * 7)
+        rootgrp = Dataset(netcdf_path, "r")
+        group = rootgrp[index.INDEX_GROUP]
+        assert group["FieldRecord"][:].tolist() == [777, 778, 779]
+        assert group["FieldRecord"].getncattr("min") == 777
+        assert group["FieldRecord"].getncattr("max") == 779
+        assert group["FieldRecord"].getncattr("unique_count") == 3
+        assert group["GroupX"].getncattr("unique_count") == 10
+        rootgrp.close()
+
+    def test_find_traces(self, tmpdir):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                index_headers=["GroupX"])
+        positions = index.find_traces(netcdf_path, "GroupX", 458789)
+        assert positions.tolist() == [2, 12, 22]
+        assert len(index.find_traces(netcdf_path, "GroupX", 1)) == 0
+        with pytest.raises(ValueError):
+            index.find_traces(netcdf_path, "FieldRecord", 777)
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_read_gather(self, tmpdir, workers):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                (("FieldRecord", 3), ("GroupX", 10)),
+                                index_headers=["GroupX"], workers=workers)
+        gather = index.read_gather(netcdf_path, "GroupX", 458789)
+        assert "Time" not in gather
+        assert gather["TRACE_SEQUENCE_FILE"].tolist() == [3, 13, 23]
+        expected = (np.array([2, 12, 22])[:, None] * 20 + np.arange(20)
+                    + 123.456)
+        assert np.allclose(gather["Samples"], expected, atol=1e-4)
+        gather = index.read_gather(netcdf_path, "GroupX", 1, ["Samples"])
+        assert gather["Samples"].shape == (0, 20)
+
+    def test_infer_dims(self, tmpdir, segy_unsorted):
+        path, grid = segy_unsorted
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(path, netcdf_path,
+                                infer_dims=["INLINE_3D", "CROSSLINE_3D"],
+                                index_headers=["CDP", "CROSSLINE_3D"],
+                                select=[("INLINE_3D", 20, None, None)])
+        gather = index.read_gather(netcdf_path, "CROSSLINE_3D", 2,
+                                   ["Samples", "CDP"])
+        expected = [il * 100 + 2 for il in (20, 30) if (il, 2) in grid]
+        assert gather["CDP"].tolist() == expected
+        assert np.all(gather["Samples"] == np.array(expected)[:, None])
+        positions = index.find_traces(netcdf_path, "CDP", 3004)
+        assert positions.tolist() == ([7] if (30, 4) in grid else [])
+
+    def test_zarr(self, tmpdir):
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy",
+                                    str(tmpdir.join("tmp.zarr")),
+                                    index_headers=["CDP"],
+                                    output_format="zarr")
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Tests for lazy.
+"""
+
+import pickle
+from netCDF4 import Dataset
+import numpy as np
+import pytest
+import segyio
+from netcdf_segy import lazy, segy2netcdf
+
+pytest.importorskip("xarray")
+pytest.importorskip("dask")
+
+
+@pytest.fixture
+def raw1():
+    with segyio.open("tests/testsegy1.segy", ignore_geometry=True) as segy:
+        return segy.trace.raw[:]
+
+
+@pytest.fixture
+def d1():
+    return (("FieldRecord", 3), ("GroupX", 10))
+
+
+class Test_open_segy:
+    @pytest.mark.parametrize("engine", ["segyio", "mmap"])
+    def test_matches_segy2netcdf(self, tmpdir, d1, engine):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d1)
+        ds = lazy.open_segy("tests/testsegy1.segy", "Time", d1,
+                            max_memory=10 * 20 * 4, engine=engine)
+        rootgrp = Dataset(netcdf_path, "r")
+        assert ds["Samples"].chunks == ((1, 1, 1), (10,), (20,))
+        assert set(ds.variables) == set(rootgrp.variables)
+        for name in rootgrp.variables:
+            assert ds[name].dims == rootgrp[name].dimensions
+            assert ds[name].dtype == rootgrp[name].dtype
+            assert np.array_equal(ds[name].values, rootgrp[name][:])
+        for name in rootgrp.ncattrs():
+            assert ds.attrs[name] == rootgrp.getncattr(name)
+        rootgrp.close()
+        ds.close()
+
+    def test_slices(self, d1, raw1):
+        ds = lazy.open_segy("tests/testsegy1.segy", "Time", d1)
+        expected = raw1.reshape(3, 10, 20)
+        assert np.array_equal(ds["Samples"][1:, 2:7, 3].values,
+                              expected[1:, 2:7, 3])
+        assert np.array_equal(
+            ds["Samples"].isel(FieldRecord=1, GroupX=[1, 5]).values,
+            expected[1, [1, 5]])
+        ds.close()
+
+    def test_traces_dim(self, raw1):
+        ds = lazy.open_segy("tests/testsegy1.segy",
+                            headers=["offset"])
+        assert ds["Samples"].dims == ("Traces", "SampleNumber")
+        assert set(ds.data_vars) == set(["Samples", "offset"])
+        assert np.array_equal(ds["Samples"].values, raw1)
+        ds.close()
+
+    def test_int16(self, tmpdir):
+        path = str(tmpdir.join("int16.segy"))
+        spec = segyio.spec()
+        spec.format = 3
+        spec.samples = range(7)
+        spec.tracecount = 4
+        data = np.arange(-14, 14, dtype=np.int16).reshape(4, 7) * 1000
+        with segyio.create(path, spec) as segy:
+            for i in range(4):
+                segy.header[i] = {segyio.TraceField.FieldRecord: i}
+                segy.trace[i] = data[i]
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(path, netcdf_path)
+        ds = lazy.open_segy(path)
+        rootgrp = Dataset(netcdf_path, "r")
+        assert ds["Samples"].dtype == rootgrp["Samples"].dtype == np.int16
+        assert np.array_equal(ds["Samples"].values, data)
+        rootgrp.close()
+        ds.close()
+
+    def test_pickle(self, d1, raw1):
+        ds = lazy.open_segy("tests/testsegy1.segy", "Time", d1)
+        ds = pickle.loads(pickle.dumps(ds))
+        assert np.array_equal(ds["Samples"].values.reshape(30, 20), raw1)
+        ds.close()
+
+
+class Test_trace_ids:
+    def test_slices(self):
+        ids, shape = lazy._trace_ids((slice(1, 3), slice(2, 4)), [3, 10])
+        assert shape == (2, 2)
+        assert np.array_equal(ids, [[12, 13], [22, 23]])
+
+    def test_int(self):
+        ids, shape = lazy._trace_ids((1, slice(None, None, 5)), [3, 10])
+        assert shape == (2,)
+        assert np.array_equal(ids.ravel(), [10, 15])
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Tests for netcdf2segy.
+"""
+
+from netCDF4 import Dataset
+import pytest
+import segyio
+import numpy as np
+from netcdf_segy import segy2netcdf
+from netcdf_segy import netcdf2segy
+
+
+@pytest.fixture
+def segy_ieee_ext(tmpdir):
+    """A SEG-Y file with IEEE floats, an extended text header, and random
+       trace headers."""
+    path = str(tmpdir.join("ieee.segy"))
+    spec = segyio.spec()
+    spec.format = 5
+    spec.samples = range(7)
+    spec.tracecount = 12
+    spec.ext_headers = 1
+    rng = np.random.RandomState(0)
+    dtype = segy2netcdf._header_dtype()
+    with segyio.create(path, spec) as segy:
+        segy.text[1] = b"extended header"
+        segy.bin.update({segyio.BinField.Interval: 4000})
+        for i in range(spec.tracecount):
+            header = np.zeros(1, dtype)
+            for name in dtype.names:
+                info = np.iinfo(dtype.fields[name][0])
+                header[name] = rng.randint(info.min, info.max)
+            segy.xfd.putth(i, header.tobytes())
+            segy.trace[i] = rng.randn(7).astype(np.float32)
+    return path
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class Test_netcdf2segy:
+    @pytest.mark.parametrize("kwargs", [
+        {},
+        {"d": (("FieldRecord", 3), ("ReceiverID", 10))},
+        {"d": (("FieldRecord", 3), ("GroupX", 10)), "max_memory": 80},
+        {"d": (("FieldRecord", 3), ("ReceiverID", 10)),
+         "compact_headers": True},
+    ])
+    def test_roundtrip(self, tmpdir, kwargs):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy_path = str(tmpdir.join("tmp.segy"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                **kwargs)
+        netcdf2segy.netcdf2segy(netcdf_path, segy_path, max_memory=80 * 7)
+        assert read_bytes(segy_path) == read_bytes("tests/testsegy1.segy")
+
+    def test_roundtrip_ieee_ext(self, tmpdir, segy_ieee_ext):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy_path = str(tmpdir.join("tmp.segy"))
+        segy2netcdf.segy2netcdf(segy_ieee_ext, netcdf_path, "Time",
+                                (("Shot", 3),))
+        netcdf2segy.netcdf2segy(netcdf_path, segy_path)
+        assert read_bytes(segy_path) == read_bytes(segy_ieee_ext)
+
+    @pytest.mark.parametrize("compact_headers", [False, True])
+    def test_roundtrip_window(self, tmpdir, compact_headers):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy_path = str(tmpdir.join("tmp.segy"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                tmin=4000, tmax=20000, sample_step=2,
+                                compact_headers=compact_headers)
+        netcdf2segy.netcdf2segy(netcdf_path, segy_path)
+        with segyio.open("tests/testsegy1.segy",
+                         ignore_geometry=True) as original, \
+                segyio.open(segy_path, ignore_geometry=True) as segy:
+            assert segy.bin[segyio.BinField.Samples] == 7
+            assert segy.bin[segyio.BinField.Interval] == 2 * 1234
+            assert np.all(
+                segy.attributes(segyio.TraceField.TRACE_SAMPLE_COUNT)[:]
+                == 7)
+            assert np.all(
+                segy.attributes(segyio.TraceField.TRACE_SAMPLE_INTERVAL)[:]
+                == 2 * 1234)
+            assert np.array_equal(segy.trace.raw[:],
+                                  original.trace.raw[:][:, 4:17:2])
+            assert np.array_equal(segy.attributes(segyio.TraceField.CDP)[:],
+                                  original.attributes(
+                                      segyio.TraceField.CDP)[:])
+
+    def test_excluded_headers_zero(self, tmpdir):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy_path = str(tmpdir.join("tmp.segy"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                exclude_headers=["GroupX"])
+        netcdf2segy.netcdf2segy(netcdf_path, segy_path)
+        with segyio.open(segy_path, ignore_geometry=True) as segy:
+            assert np.all(segy.attributes(segyio.TraceField.GroupX)[:] == 0)
+            assert np.all(
+                segy.attributes(segyio.TraceField.SourceGroupScalar)[:]
+                == -1000)
+
+    def test_not_segy2netcdf(self, tmpdir):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        rootgrp = Dataset(netcdf_path, "w")
+        rootgrp.createDimension("Time", 5)
+        rootgrp.createVariable("Samples", "f4", ("Time",))
+        rootgrp.close()
+        with pytest.raises(ValueError):
+            netcdf2segy.netcdf2segy(netcdf_path, str(tmpdir.join("x.segy")))
+
+    def test_missing_traces(self, tmpdir):
+        # Drop the last trace, so that one position of the grid is missing
+        segy_in = str(tmpdir.join("in.segy"))
+        with open(segy_in, "wb") as f:
+            f.write(read_bytes("tests/testsegy1.segy")[:-(240 + 4 * 20)])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy_path = str(tmpdir.join("tmp.segy"))
+        segy2netcdf.segy2netcdf(segy_in, netcdf_path,
+                                infer_dims=["FieldRecord", "GroupX"])
+        netcdf2segy.netcdf2segy(netcdf_path, segy_path)
+        assert read_bytes(segy_path) == read_bytes(segy_in)
+
+
+class Test_parse_binary_header:
+    def test_roundtrip(self, tmpdir):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        rootgrp = Dataset(netcdf_path, "w")
+        with segyio.open("tests/testsegy1.segy", ignore_geometry=True) as segy:
+            segy2netcdf._set_attributes(segy, rootgrp)
+            binary_header = netcdf2segy._parse_binary_header(rootgrp)
+            assert binary_header == dict(segy.bin)
+        rootgrp.close()
+
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Tests for profiling.
+"""
+
+import json
+from netcdf_segy import profiling
+
+
+class Test_Profiler:
+    def test_stage(self):
+        profiler = profiling.Profiler()
+        for _ in range(3):
+            with profiler.stage("read") as stage:
+                stage.nbytes_read += 10
+        with profiler.stage("write") as stage:
+            stage.nbytes_written = 5
+        assert list(profiler.stages) == ["read", "write"]
+        read = profiler.stages["read"]
+        assert read.calls == 3
+        assert read.nbytes_read == 30
+        assert read.seconds >= 0
+        report = profiler.report()
+        assert report["bytes_read"] == 30
+        assert report["bytes_written"] == 5
+        assert [s["name"] for s in report["stages"]] == ["read", "write"]
+        assert len(profiler.summary()) == 2
+
+    def test_stage_exception(self):
+        profiler = profiling.Profiler()
+        try:
+            with profiler.stage("fail"):
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        assert profiler.stages["fail"].calls == 1
+
+    def test_write(self, tmpdir):
+        profiler = profiling.Profiler()
+        profiler.info["segy_path"] = "a.segy"
+        with profiler.stage("open"):
+            pass
+        path = str(tmpdir.join("profile.json"))
+        profiler.write(path)
+        with open(path) as f:
+            report = json.load(f)
+        assert report["segy_path"] == "a.segy"
+        assert report["stages"][0]["name"] == "open"
+        assert report["stages"][0]["MB_per_s"] is None
+
+
+class Test_Progress:
+    def test_disabled(self):
+        with profiling.Progress(100, "copying", False) as bar:
+            bar.update(60)
+            bar.update(40)
+        assert bar.nbytes == 100
+
+    def test_enabled(self):
+        with profiling.Progress(100, "copying") as bar:
+            bar.update(100)
+        assert bar.nbytes == 100
+
+    def test_callback(self):
+        calls = []
+        with profiling.Progress(100, "copying",
+                                lambda *args: calls.append(args)) as bar:
+            bar.update(60)
+            bar.update(40)
+        assert calls == [(0, 100), (60, 100), (100, 100)]
@@ -3,6 +3,9 @@
 """
 
 from netCDF4 import Dataset
+import json
+import click
+from click.testing import CliRunner
 import pytest
 import segyio
 import numpy as np
@@ -298,3 +301,990 @@ class Test_segy2netcdf:
         rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
         check_data1(rootgrp.variables, "SampleNumber")
         rootgrp.close()
+
+
+class Test_trace_blocks:
+    def test_all_fit(self):
+        blocks = list(segy2netcdf._trace_blocks([3, 10], 80, 10000))
+        assert len(blocks) == 1
+        start, stop, index, shape = blocks[0]
+        assert (start, stop) == (0, 30)
+        assert index == (slice(0, 3), slice(None))
+        assert shape == (3, 10)
+
+    def test_slowest_dim(self):
+        blocks = list(segy2netcdf._trace_blocks([3, 10], 80, 80 * 10))
+        assert [(b[0], b[1]) for b in blocks] == [(0, 10), (10, 20), (20, 30)]
+        assert blocks[1][2] == (slice(1, 2), slice(None))
+        assert blocks[1][3] == (1, 10)
+
+    def test_faster_dim(self):
+        blocks = list(segy2netcdf._trace_blocks([3, 10], 80, 80 * 4))
+        assert len(blocks) == 9
+        assert (blocks[2][0], blocks[2][1]) == (8, 10)
+        assert blocks[2][2] == (0, slice(8, 10))
+        assert blocks[2][3] == (2,)
+        assert (blocks[3][0], blocks[3][1]) == (10, 14)
+        assert blocks[3][2] == (1, slice(0, 4))
+
+    def test_covers_all_traces(self):
+        blocks = segy2netcdf._trace_blocks([2, 3, 5], 8, 8 * 7)
+        traces = []
+        for start, stop, _, shape in blocks:
+            assert stop - start == int(np.prod(shape))
+            traces += list(range(start, stop))
+        assert traces == list(range(30))
+
+
+class Test_copy_data_blocks:
+    def test_small_max_memory(self, segy1, rootgrp_vars, dim_names1,
+                              dim_lens1):
+        segy2netcdf._copy_data(
+            segy1, rootgrp_vars.variables.values(), dim_names1, dim_lens1,
+            False, max_memory=20 * 4 * 3
+        )
+        check_data1(rootgrp_vars.variables, dim_names1[-1])
+
+
+class Test_header_dtype:
+    def test_fields(self):
+        dtype = segy2netcdf._header_dtype()
+        assert dtype.itemsize == 240
+        assert set(dtype.names) == set(segyio.tracefield.keys)
+        assert dtype.fields["FieldRecord"][1] == 8
+        assert dtype.fields["FieldRecord"][0] == np.dtype(">i4")
+        assert dtype.fields["TRACE_SAMPLE_COUNT"][0] == np.dtype(">i2")
+
+    def test_little_endian(self):
+        dtype = segy2netcdf._header_dtype("little")
+        assert dtype.fields["FieldRecord"][0] == np.dtype("<i4")
+
+
+class Test_read_trace_headers:
+    def test_records_match_segyio(self, segy1):
+        records = segy2netcdf._trace_records("tests/testsegy1.segy", segy1)
+        assert records is not None
+        assert records.shape == (30,)
+        names = list(segyio.tracefield.keys)
+        headers = segy2netcdf._read_trace_headers(segy1, records, 5, 25, names)
+        per_field = segy2netcdf._read_trace_headers(segy1, None, 5, 25, names)
+        for name in names:
+            assert np.array_equal(headers[name], per_field[name])
+
+    def test_bad_layout(self, segy1, tmpdir):
+        path = str(tmpdir.join("tmp.segy"))
+        with open("tests/testsegy1.segy", "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data + b"\0")
+        assert segy2netcdf._trace_records(path, segy1) is None
+
+    def test_copy_data_records(self, segy1, rootgrp_vars, dim_names1,
+                               dim_lens1):
+        records = segy2netcdf._trace_records("tests/testsegy1.segy", segy1)
+        segy2netcdf._copy_data(
+            segy1, rootgrp_vars.variables.values(), dim_names1, dim_lens1,
+            False, max_memory=20 * 4 * 10, records=records
+        )
+        check_data1(rootgrp_vars.variables, dim_names1[-1])
+
+
+class Test_segy2netcdf_workers:
+    def test_workers(self, tmpdir, dim_names1, dim_lens1):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(
+            "tests/testsegy1.segy", netcdf_path, "Time", d,
+            max_memory=20 * 4 * 2 * 2 * 5, workers=2
+        )
+        rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
+        check_data1(rootgrp.variables, "Time")
+        rootgrp.close()
+
+
+class Test_chunk_shape:
+    def test_none(self):
+        assert segy2netcdf._chunk_shape([3, 10, 20], 4, None) is None
+
+    def test_explicit(self):
+        chunks = segy2netcdf._chunk_shape([3, 10, 20], 4, (1, 20, 5))
+        assert chunks == [1, 10, 5]
+
+    def test_trace(self):
+        chunks = segy2netcdf._chunk_shape([100, 200, 1000], 4, "trace",
+                                          4 * 20000)
+        assert chunks == [1, 20, 1000]
+
+    def test_timeslice(self):
+        chunks = segy2netcdf._chunk_shape([100, 200, 1000], 4, "timeslice",
+                                          4 * 20000)
+        assert chunks == [100, 200, 1]
+
+    def test_balanced(self):
+        chunks = segy2netcdf._chunk_shape([100, 200, 1000], 4, "balanced",
+                                          4 * 20000)
+        assert chunks == [27, 27, 27]
+
+    def test_balanced_small_dim(self):
+        chunks = segy2netcdf._chunk_shape([3, 10, 20], 4, "balanced", 4 * 50)
+        assert chunks == [3, 4, 4]
+
+
+class Test_create_variables_chunking:
+    def test_preset(self, rootgrp_dims, dim_names1):
+        segy2netcdf._create_variables(rootgrp_dims, dim_names1, False,
+                                      "trace", 4 * 40)
+        assert rootgrp_dims["Samples"].chunking() == [1, 2, 20]
+        assert rootgrp_dims["GroupX"].chunking() == [3, 10]
+
+    def test_explicit(self, rootgrp_dims, dim_names1):
+        segy2netcdf._create_variables(rootgrp_dims, dim_names1, False,
+                                      (1, 5, 20))
+        assert rootgrp_dims["Samples"].chunking() == [1, 5, 20]
+        assert rootgrp_dims["GroupX"].chunking() == [1, 5]
+
+    def test_wrong_length(self, rootgrp_dims, dim_names1):
+        with pytest.raises(ValueError):
+            segy2netcdf._create_variables(rootgrp_dims, dim_names1, False,
+                                          (1, 5))
+
+
+class Test_parse_chunking:
+    def test_preset(self):
+        assert segy2netcdf._parse_chunking("balanced") == "balanced"
+
+    def test_list(self):
+        assert segy2netcdf._parse_chunking("1,5,20") == (1, 5, 20)
+
+    def test_invalid(self):
+        with pytest.raises(click.BadParameter):
+            segy2netcdf._parse_chunking("fast")
+
+
+class Test_compression_options:
+    def test_off(self):
+        assert segy2netcdf._compression_options() == {"compression": None}
+
+    def test_compress(self):
+        opts = segy2netcdf._compression_options(True)
+        assert opts == {"compression": "zlib", "complevel": 4,
+                        "shuffle": True}
+
+    def test_level_implies_compress(self):
+        opts = segy2netcdf._compression_options(complevel=9, shuffle=False)
+        assert opts == {"compression": "zlib", "complevel": 9,
+                        "shuffle": False}
+
+    def test_profile(self):
+        opts = segy2netcdf._compression_options(compress_profile="small")
+        compression, level = [
+            x for x in segy2netcdf.COMPRESS_PROFILES["small"]
+            if segy2netcdf._compression_available(x[0])
+        ][0]
+        assert opts["compression"] == compression
+        assert opts["complevel"] == level
+
+    def test_profile_with_level(self):
+        opts = segy2netcdf._compression_options(compress_profile="fast",
+                                                compression="zlib",
+                                                complevel=2)
+        assert opts == {"compression": "zlib", "complevel": 2,
+                        "shuffle": True}
+
+    def test_invalid_profile(self):
+        with pytest.raises(ValueError):
+            segy2netcdf._compression_options(compress_profile="tiny")
+
+    def test_invalid_filter(self):
+        with pytest.raises(ValueError):
+            segy2netcdf._compression_options(compression="lzma")
+
+
+class Test_quantize_options:
+    def test_none(self):
+        assert segy2netcdf._quantize_options() == {}
+
+    def test_lsd(self):
+        opts = segy2netcdf._quantize_options(least_significant_digit=2)
+        assert opts == {"least_significant_digit": 2}
+
+    def test_both(self):
+        with pytest.raises(ValueError):
+            segy2netcdf._quantize_options(3, 2)
+
+
+class Test_segy2netcdf_compression:
+    def test_compression(self, tmpdir, dim_names1, dim_lens1):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(
+            "tests/testsegy1.segy", netcdf_path, "Time", d,
+            compression="zlib", complevel=7, shuffle=False
+        )
+        rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
+        filters = rootgrp["Samples"].filters()
+        assert filters["zlib"]
+        assert filters["complevel"] == 7
+        assert not filters["shuffle"]
+        assert rootgrp["GroupX"].filters()["zlib"]
+        check_data1(rootgrp.variables, "Time")
+        rootgrp.close()
+
+    def test_quantize(self, tmpdir, dim_names1, dim_lens1):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(
+            "tests/testsegy1.segy", netcdf_path, "Time", d, True,
+            least_significant_digit=1
+        )
+        rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
+        samples = rootgrp["Samples"][:]
+        expected = np.arange(3 * 10 * 20).reshape(3, 10, 20) + 123.456
+        assert np.allclose(samples, expected, atol=0.1)
+        assert not np.allclose(samples, expected, atol=1e-4)
+        rootgrp.close()
+
+
+class Test_select_header_fields:
+    def test_all(self):
+        fields = segy2netcdf._select_header_fields()
+        assert fields == [
+            attr for attr in dir(segyio.TraceField)
+            if not callable(getattr(segyio.TraceField, attr))
+            and not attr.startswith("__")]
+
+    def test_cached(self):
+        fields = segy2netcdf._select_header_fields()
+        fields.remove("CDP")
+        assert "CDP" in segy2netcdf._select_header_fields()
+
+    def test_include_exclude(self):
+        fields = segy2netcdf._select_header_fields(
+            ["GroupX", "FieldRecord", "CDP"], ["CDP"]
+        )
+        assert fields == ["FieldRecord", "GroupX"]
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            segy2netcdf._select_header_fields(["NotAHeader"])
+
+
+class Test_header_stats:
+    def test_stats(self, segy1):
+        names = ["GroupX", "SourceGroupScalar", "TRACE_SEQUENCE_FILE"]
+        for records in [None, segy2netcdf._trace_records(
+                "tests/testsegy1.segy", segy1)]:
+            stats = segy2netcdf._header_stats(segy1, records, names,
+                                              max_memory=240 * 7)
+            assert stats == {"GroupX": (456789, 456789 + 9000),
+                             "SourceGroupScalar": (-1000, -1000),
+                             "TRACE_SEQUENCE_FILE": (1, 30)}
+
+    def test_compact_header_dtypes(self):
+        header_dtypes, header_constants = segy2netcdf._compact_header_dtypes(
+            {"a": (0, 100), "b": (-200, 5), "c": (0, 40000), "d": (-3, -3)}
+        )
+        assert header_dtypes == {"a": "i1", "b": "i2", "c": "i4"}
+        assert header_constants == {"d": -3}
+
+
+class Test_segy2netcdf_headers:
+    def test_compact_headers(self, tmpdir, dim_names1, dim_lens1):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(
+            "tests/testsegy1.segy", netcdf_path, "Time", d,
+            exclude_headers=["CDP"], compact_headers=True
+        )
+        rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
+        assert "CDP" not in rootgrp.variables
+        assert "CDP" not in rootgrp.ncattrs()
+        assert rootgrp["GroupX"].dtype == np.int32
+        assert rootgrp["TRACE_SEQUENCE_FILE"].dtype == np.int8
+        assert rootgrp["FieldRecord"].dtype == np.int32
+        assert "SourceGroupScalar" not in rootgrp.variables
+        assert rootgrp.SourceGroupScalar == -1000
+        assert rootgrp.UnassignedInt1 == 0
+        check_samples1(rootgrp["Samples"][:])
+        check_fieldrecord1(rootgrp["FieldRecord"][:])
+        check_groupx1(rootgrp["GroupX"][:])
+        check_linear(rootgrp["TRACE_SEQUENCE_FILE"][:])
+        rootgrp.close()
+
+    def test_include(self, tmpdir, dim_names1, dim_lens1):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(
+            "tests/testsegy1.segy", netcdf_path, "Time", d,
+            headers=["GroupX"]
+        )
+        rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
+        assert set(rootgrp.variables) == set(["Samples", "Time",
+                                              "FieldRecord", "GroupX"])
+        check_groupx1(rootgrp["GroupX"][:])
+        rootgrp.close()
+
+
+class Test_infer_dims:
+    def test_infer_dims(self, segy_unsorted):
+        path, grid = segy_unsorted
+        with segyio.open(path, ignore_geometry=True) as segy:
+            for records in [None, segy2netcdf._trace_records(path, segy)]:
+                coords, positions = segy2netcdf._infer_dims(
+                    segy, records, ["INLINE_3D", "CROSSLINE_3D"], 240 * 3)
+                assert np.array_equal(coords[0], [10, 20, 30])
+                assert np.array_equal(coords[1], [1, 2, 3, 4])
+                expected = [[10, 20, 30].index(il) * 4 + xl - 1
+                            for il, xl in grid]
+                assert np.array_equal(positions, expected)
+
+    def test_duplicates(self, segy1):
+        with pytest.raises(ValueError):
+            segy2netcdf._infer_dims(segy1, None, ["FieldRecord"])
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_segy2netcdf(self, tmpdir, segy_unsorted, workers):
+        path, grid = segy_unsorted
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(
+            path, netcdf_path, infer_dims=["INLINE_3D", "CROSSLINE_3D"],
+            max_memory=5 * 4 * 3, workers=workers, compact_headers=True
+        )
+        rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
+        assert rootgrp["INLINE_3D"][:].tolist() == [10, 20, 30]
+        assert rootgrp["CROSSLINE_3D"][:].tolist() == [1, 2, 3, 4]
+        samples = rootgrp["Samples"][:]
+        cdp = rootgrp["CDP"][:]
+        assert samples.shape == (3, 4, 5)
+        assert np.ma.count_masked(cdp) == 2
+        for i, il in enumerate([10, 20, 30]):
+            for j, xl in enumerate([1, 2, 3, 4]):
+                if (il, xl) in grid:
+                    assert np.all(samples[i, j] == il * 100 + xl)
+                    assert cdp[i, j] == il * 100 + xl
+                else:
+                    assert np.all(samples.mask[i, j])
+                    assert cdp.mask[i, j]
+        rootgrp.close()
+
+    def test_d_and_infer_dims(self, tmpdir, segy_unsorted):
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf(
+                segy_unsorted[0], str(tmpdir.join("tmp.nc")),
+                d=(("INLINE_3D", 3),), infer_dims=["INLINE_3D"]
+            )
+
+
+class Test_read_trace_samples:
+    def test_unordered(self, segy1):
+        trace_ids = [5, 6, 7, 2, 3, 29]
+        samples = segy2netcdf._read_trace_samples(segy1, trace_ids)
+        for i, trace_id in enumerate(trace_ids):
+            assert np.array_equal(samples[i], segy1.trace[trace_id])
+
+
+class Test_engine_mmap:
+    def test_sample_dtype(self, segy1):
+        assert segy2netcdf._sample_dtype(segy1) == np.dtype(">u4")
+
+    def test_read_block(self, segy1):
+        records = segy2netcdf._trace_records("tests/testsegy1.segy", segy1)
+        samples, _ = segy2netcdf._read_block(segy1, records, 3, 17, [],
+                                             engine="mmap")
+        assert samples.dtype == np.float32
+        assert np.array_equal(samples, segy1.trace.raw[3:17])
+        samples, _ = segy2netcdf._read_block(segy1, records, 0, 0, [],
+                                             np.array([9, 2, 3]), "mmap")
+        assert np.array_equal(samples, segy1.trace.raw[:][[9, 2, 3]])
+
+    def test_read_block_headers_only(self, segy1):
+        records = segy2netcdf._trace_records("tests/testsegy1.segy", segy1)
+        samples, headers = segy2netcdf._read_block(
+            segy1, records, 3, 17, ["CDP"], engine="mmap",
+            read_samples=False)
+        assert samples is None
+        assert np.array_equal(headers["CDP"],
+                              segy1.attributes(segyio.TraceField.CDP)[3:17])
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_segy2netcdf(self, tmpdir, dim_names1, dim_lens1, workers):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(
+            "tests/testsegy1.segy", netcdf_path, "Time", d,
+            max_memory=20 * 4 * 4, workers=workers, engine="mmap"
+        )
+        rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
+        check_data1(rootgrp.variables, "Time")
+        rootgrp.close()
+
+    def test_unsorted(self, tmpdir, segy_unsorted):
+        path, grid = segy_unsorted
+        paths = [str(tmpdir.join(name)) for name in ["a.nc", "b.nc"]]
+        for netcdf_path, engine in zip(paths, ["segyio", "mmap"]):
+            segy2netcdf.segy2netcdf(
+                path, netcdf_path, infer_dims=["INLINE_3D", "CROSSLINE_3D"],
+                max_memory=5 * 4 * 3, engine=engine
+            )
+        a = Dataset(paths[0], "r")
+        b = Dataset(paths[1], "r")
+        for name in a.variables:
+            assert np.ma.allequal(a[name][:], b[name][:])
+        a.close()
+        b.close()
+
+    def test_fallback(self, tmpdir, monkeypatch, dim_names1, dim_lens1):
+        monkeypatch.setattr(segy2netcdf, "_trace_records",
+                            lambda segy_path, segy: None)
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d, engine="mmap")
+        rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
+        check_data1(rootgrp.variables, "Time")
+        rootgrp.close()
+
+    def test_invalid(self, tmpdir):
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy",
+                                    str(tmpdir.join("tmp.nc")),
+                                    engine="fast")
+
+
+class Test_segy2netcdf_profile:
+    def test_profile(self, tmpdir, dim_names1, dim_lens1):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        profile = str(tmpdir.join("profile.json"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d, max_memory=20 * 4 * 4, profile=profile,
+                                progress=True)
+        rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
+        check_data1(rootgrp.variables, "Time")
+        rootgrp.close()
+        with open(profile) as f:
+            report = json.load(f)
+        stages = dict((s["name"], s) for s in report["stages"])
+        for name in ["open", "dimensions", "variables", "attributes",
+                     "read traces", "copy Samples", "copy FieldRecord",
+                     "copy GroupX", "close"]:
+            assert name in stages
+        assert stages["copy Samples"]["bytes_written"] == 3 * 10 * 20 * 4
+        assert stages["read traces"]["bytes_read"] == 30 * (240 + 20 * 4)
+        assert report["output_bytes"] > 0
+
+
+class Test_segy2netcdf_append:
+    def test_append(self, tmpdir, dim_names1, dim_lens1):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        for _ in range(3):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                    "Time", d, max_memory=20 * 4 * 4,
+                                    append=True)
+        rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
+        assert rootgrp.dimensions["FieldRecord"].isunlimited()
+        assert rootgrp["Samples"].shape == (9, 10, 20)
+        with segyio.open("tests/testsegy1.segy",
+                         ignore_geometry=True) as segy:
+            samples = segy.trace.raw[:].reshape(3, 10, 20)
+            fieldrecord = segy.attributes(segyio.TraceField.FieldRecord)[::10]
+            groupx = segy.attributes(segyio.TraceField.GroupX)[:]
+        for i in range(3):
+            assert np.array_equal(rootgrp["Samples"][3 * i:3 * (i + 1)],
+                                  samples)
+            assert np.array_equal(rootgrp["FieldRecord"][3 * i:3 * (i + 1)],
+                                  fieldrecord)
+            assert np.array_equal(rootgrp["GroupX"][3 * i:3 * (i + 1)],
+                                  groupx.reshape(3, 10))
+        check_time1(rootgrp["Time"][:])
+        rootgrp.close()
+
+    def test_traces_dim(self, tmpdir):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                append=True, chunking="trace")
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                append=True)
+        rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
+        assert rootgrp["Samples"].dimensions == ("Traces", "SampleNumber")
+        assert rootgrp["Samples"].shape == (60, 20)
+        assert np.array_equal(rootgrp["Samples"][:30],
+                              rootgrp["Samples"][30:])
+        rootgrp.close()
+
+    def test_mismatch(self, tmpdir):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                d=(("FieldRecord", 3),), append=True)
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                    d=(("FieldRecord", 6),), append=True)
+        rootgrp = Dataset(netcdf_path, "r", format="NETCDF4")
+        assert rootgrp["Samples"].shape == (10, 3, 20)
+        rootgrp.close()
+
+    def test_not_unlimited(self, tmpdir):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path)
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                    append=True)
+
+    def test_compact_headers(self, tmpdir):
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy",
+                                    str(tmpdir.join("tmp.nc")),
+                                    compact_headers=True, append=True)
+
+
+class Test_segy2netcdf_resume:
+    def interrupt(self, monkeypatch, netcdf_path, d, stop_trace):
+        """Make a checkpointed conversion fail when it reaches stop_trace."""
+        read_block = segy2netcdf._read_block
+
+        def failing_read_block(segy, records, start, *args, **kwargs):
+            if start >= stop_trace:
+                raise RuntimeError("interrupted")
+            return read_block(segy, records, start, *args, **kwargs)
+
+        monkeypatch.setattr(segy2netcdf, "_read_block", failing_read_block)
+        with pytest.raises(RuntimeError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                    "Time", d, max_memory=10 * 20 * 4,
+                                    checkpoint=True)
+        monkeypatch.setattr(segy2netcdf, "_read_block", read_block)
+
+    def test_resume(self, tmpdir, monkeypatch, dim_names1, dim_lens1):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        self.interrupt(monkeypatch, netcdf_path, d, 20)
+        rootgrp = Dataset(netcdf_path, "r")
+        assert rootgrp.getncattr(segy2netcdf.CHECKPOINT_ATTRIBUTE) == 20
+        rootgrp.close()
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d, max_memory=10 * 20 * 4, resume=True)
+        rootgrp = Dataset(netcdf_path, "r")
+        assert segy2netcdf.CHECKPOINT_ATTRIBUTE not in rootgrp.ncattrs()
+        check_data1(rootgrp.variables, "Time")
+        rootgrp.close()
+
+    def test_headers_changed(self, tmpdir, monkeypatch, dim_names1,
+                             dim_lens1):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        self.interrupt(monkeypatch, netcdf_path, d, 20)
+        rootgrp = Dataset(netcdf_path, "a")
+        rootgrp["GroupX"][0, 0] = -1
+        rootgrp.close()
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                    "Time", d, max_memory=10 * 20 * 4,
+                                    resume=True)
+
+    def test_complete(self, tmpdir, dim_names1, dim_lens1):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d, checkpoint=True)
+        rootgrp = Dataset(netcdf_path, "a")
+        rootgrp["Samples"][0, 0, 0] = -1
+        rootgrp.close()
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d, resume=True)
+        rootgrp = Dataset(netcdf_path, "r")
+        assert rootgrp["Samples"][0, 0, 0] == -1
+        rootgrp.close()
+
+    def test_append(self, tmpdir):
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy",
+                                    str(tmpdir.join("tmp.nc")),
+                                    append=True, resume=True)
+
+
+@pytest.fixture
+def segy_int16(tmpdir):
+    """A SEG-Y file with 2 byte integer samples (format 3)."""
+    path = str(tmpdir.join("int16.segy"))
+    spec = segyio.spec()
+    spec.format = 3
+    spec.samples = range(7)
+    spec.tracecount = 4
+    data = np.arange(-14, 14, dtype=np.int16).reshape(4, 7) * 1000
+    with segyio.create(path, spec) as segy:
+        for i in range(4):
+            segy.header[i] = {segyio.TraceField.FieldRecord: i}
+            segy.trace[i] = data[i]
+    return path, data
+
+
+class Test_segy2netcdf_sample_dtype:
+    def test_native(self, tmpdir, segy_int16):
+        path, data = segy_int16
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(path, netcdf_path)
+        rootgrp = Dataset(netcdf_path, "r")
+        assert rootgrp["Samples"].dtype == np.int16
+        assert np.array_equal(rootgrp["Samples"][:], data)
+        rootgrp.close()
+
+    def test_f4(self, tmpdir, segy_int16):
+        path, data = segy_int16
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(path, netcdf_path, sample_dtype="f4")
+        rootgrp = Dataset(netcdf_path, "r")
+        assert rootgrp["Samples"].dtype == np.float32
+        assert np.array_equal(rootgrp["Samples"][:], data)
+        rootgrp.close()
+
+    @pytest.mark.parametrize("engine", segy2netcdf.ENGINES)
+    def test_i2(self, tmpdir, dim_names1, dim_lens1, engine):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d, sample_dtype="i2", engine=engine)
+        rootgrp = Dataset(netcdf_path, "r")
+        samples = rootgrp["Samples"]
+        assert samples.dtype == np.int16
+        scale_factor = samples.getncattr("scale_factor")
+        assert samples.getncattr("add_offset").dtype == np.float32
+        expected = rootgrp["Samples"][:]
+        samples.set_auto_scale(False)
+        packed = samples[:]
+        rootgrp.close()
+        assert packed.count() == packed.size
+        assert packed.min() == -32766
+        assert packed.max() == 32766
+        segy = segyio.open("tests/testsegy1.segy", ignore_geometry=True)
+        original = segy.trace.raw[:].reshape(expected.shape)
+        segy.close()
+        assert np.abs(expected - original).max() <= scale_factor
+
+    def test_i2_fill(self, tmpdir, segy_unsorted):
+        path, grid = segy_unsorted
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(path, netcdf_path,
+                                infer_dims=["INLINE_3D", "CROSSLINE_3D"],
+                                sample_dtype="i2", max_memory=5 * 4 * 3)
+        rootgrp = Dataset(netcdf_path, "r")
+        samples = rootgrp["Samples"][:]
+        rootgrp.close()
+        assert samples.mask.sum() == 2 * 5
+        for il, xl in grid:
+            values = samples[(10, 20, 30).index(il), xl - 1]
+            assert np.allclose(values, il * 100 + xl, atol=0.1)
+
+    def test_unsupported(self, tmpdir):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                    sample_dtype="f2")
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                    sample_dtype="i2",
+                                    least_significant_digit=2)
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                    sample_dtype="f8")
+
+    def test_quantize_default(self, tmpdir, segy_int16):
+        path, data = segy_int16
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(path, netcdf_path, significant_digits=3)
+        rootgrp = Dataset(netcdf_path, "r")
+        assert rootgrp["Samples"].dtype == np.float32
+        rootgrp.close()
+
+
+class Test_packing:
+    def test_packing_attributes(self):
+        packing = segy2netcdf._packing_attributes(-2.0, 6.0)
+        packed = segy2netcdf._pack_samples(np.array([-2.0, 2.0, 6.0]),
+                                           dtype="i2", **packing)
+        assert packed.tolist() == [-32766, 0, 32766]
+        unpacked = packed * packing["scale_factor"] + packing["add_offset"]
+        assert np.allclose(unpacked, [-2.0, 2.0, 6.0], atol=1e-3)
+
+    def test_constant(self):
+        packing = segy2netcdf._packing_attributes(3.0, 3.0)
+        assert packing["scale_factor"] == 1
+        packed = segy2netcdf._pack_samples(np.full(2, 3.0), dtype="i2",
+                                           **packing)
+        assert np.array_equal(packed * packing["scale_factor"]
+                              + packing["add_offset"], [3.0, 3.0])
+
+    def test_masked(self):
+        packing = segy2netcdf._packing_attributes(0.0, 1.0)
+        samples = np.ma.masked_array([0.0, np.nan, 1.0],
+                                     [False, False, True])
+        packed = segy2netcdf._pack_samples(samples, dtype="i2", **packing)
+        assert packed.mask.tolist() == [False, True, True]
+
+    def test_out_of_range(self):
+        packing = segy2netcdf._packing_attributes(0.0, 1.0)
+        with pytest.raises(ValueError):
+            segy2netcdf._pack_samples(np.array([2.0]), dtype="i2", **packing)
+
+    def test_sample_range(self, segy1):
+        records = segy2netcdf._trace_records("tests/testsegy1.segy", segy1)
+        vmin, vmax = segy2netcdf._sample_range(segy1, records,
+                                               max_memory=20 * 4 * 7)
+        data = segy1.trace.raw[:]
+        assert (vmin, vmax) == (data.min(), data.max())
+
+
+class Test_segy2netcdf_contiguous:
+    def test_contiguous(self, tmpdir, dim_names1, dim_lens1):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d, max_memory=7 * 20 * 4, contiguous=True)
+        rootgrp = Dataset(netcdf_path, "r")
+        assert rootgrp["Samples"].chunking() == "contiguous"
+        assert rootgrp["GroupX"].chunking() == "contiguous"
+        check_data1(rootgrp.variables, "Time")
+        rootgrp.close()
+
+    def test_fill_missing(self, tmpdir, segy_unsorted):
+        path, grid = segy_unsorted
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(path, netcdf_path,
+                                infer_dims=["INLINE_3D", "CROSSLINE_3D"],
+                                contiguous=True)
+        rootgrp = Dataset(netcdf_path, "r")
+        samples = rootgrp["Samples"][:]
+        cdp = rootgrp["CDP"][:]
+        rootgrp.close()
+        assert samples.mask.sum() == 2 * 5
+        assert cdp.mask.sum() == 2
+        for il, xl in grid:
+            i = (10, 20, 30).index(il)
+            assert np.all(samples[i, xl - 1] == il * 100 + xl)
+
+    @pytest.mark.parametrize("kwargs", [
+        {"compress": True},
+        {"least_significant_digit": 2},
+        {"chunking": "trace"},
+        {"append": True},
+        {"output_format": "zarr"},
+    ])
+    def test_rejected(self, tmpdir, kwargs):
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy",
+                                    str(tmpdir.join("tmp.nc")),
+                                    contiguous=True, **kwargs)
+
+
+class Test_set_chunk_cache:
+    def test_set_chunk_cache(self, rootgrp_dims, dim_names1):
+        variables = segy2netcdf._create_variables(rootgrp_dims, dim_names1,
+                                                  False, "trace")
+        segy2netcdf._set_chunk_cache(variables, 4 * 1024 ** 2)
+        size, _, preemption = rootgrp_dims["Samples"].get_var_chunk_cache()
+        assert size == 4 * 1024 ** 2
+        assert preemption == 1.0
+
+    def test_segy2netcdf(self, tmpdir, dim_names1, dim_lens1):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d, chunking="trace", chunk_cache=1024 ** 2)
+        rootgrp = Dataset(netcdf_path, "r")
+        check_data1(rootgrp.variables, "Time")
+        rootgrp.close()
+
+
+class Test_pipeline:
+    @pytest.mark.parametrize("queue_depth", [0, 1, 3])
+    def test_order(self, queue_depth):
+        results = segy2netcdf._pipeline(range(20), lambda x: x * 2,
+                                        queue_depth)
+        assert list(results) == list(range(0, 40, 2))
+
+    def test_chained(self):
+        results = segy2netcdf._pipeline(range(10), lambda x: x + 1, 2)
+        results = segy2netcdf._pipeline(results, lambda x: x * 10, 2)
+        assert list(results) == list(range(10, 110, 10))
+
+    @pytest.mark.parametrize("queue_depth", [0, 2])
+    def test_exception(self, queue_depth):
+        def func(x):
+            if x == 5:
+                raise RuntimeError("failed")
+            return x
+
+        results = segy2netcdf._pipeline(range(10), func, queue_depth)
+        assert [next(results) for _ in range(5)] == list(range(5))
+        with pytest.raises(RuntimeError):
+            next(results)
+
+    def test_close(self):
+        done = []
+
+        def items():
+            try:
+                for x in range(100):
+                    yield x
+            finally:
+                done.append(True)
+
+        results = segy2netcdf._pipeline(items(), lambda x: x, 1)
+        assert next(results) == 0
+        results.close()
+        assert done == [True]
+
+
+class Test_segy2netcdf_queue_depth:
+    @pytest.mark.parametrize("queue_depth", [0, 1, 4])
+    @pytest.mark.parametrize("engine", segy2netcdf.ENGINES)
+    def test_queue_depth(self, tmpdir, dim_names1, dim_lens1, queue_depth,
+                         engine):
+        d = tuple([(x, y) for x, y in zip(dim_names1[:-1], dim_lens1[:-1])])
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d, max_memory=10 * 20 * 4 * 7,
+                                queue_depth=queue_depth, engine=engine)
+        rootgrp = Dataset(netcdf_path, "r")
+        check_data1(rootgrp.variables, "Time")
+        rootgrp.close()
+
+    def test_infer_dims(self, tmpdir, segy_unsorted):
+        path, grid = segy_unsorted
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(path, netcdf_path,
+                                infer_dims=["INLINE_3D", "CROSSLINE_3D"],
+                                max_memory=5 * 4 * 3, queue_depth=2)
+        rootgrp = Dataset(netcdf_path, "r")
+        samples = rootgrp["Samples"][:]
+        rootgrp.close()
+        assert samples.mask.sum() == 2 * 5
+        for il, xl in grid:
+            assert np.all(samples[(10, 20, 30).index(il), xl - 1]
+                          == il * 100 + xl)
+
+
+class Test_select_traces:
+    def test_traces(self, segy1):
+        trace_ids = segy2netcdf._select_traces(segy1, None, (5, 20, 3))
+        assert trace_ids.tolist() == [5, 8, 11, 14, 17]
+
+    def test_reversed(self, segy1):
+        trace_ids = segy2netcdf._select_traces(segy1, None, (25, None, -10))
+        assert trace_ids.tolist() == [5, 15, 25]
+
+    @pytest.mark.parametrize("mmap", [False, True])
+    def test_select(self, segy1, mmap):
+        records = None
+        if mmap:
+            records = segy2netcdf._trace_records("tests/testsegy1.segy",
+                                                 segy1)
+        select = [("FieldRecord", 778, None, None),
+                  ("GroupX", 457789, 462789, 2000)]
+        trace_ids = segy2netcdf._select_traces(segy1, records, None, select,
+                                               240 * 3)
+        assert trace_ids.tolist() == [11, 13, 15, 21, 23, 25]
+
+    def test_none_selected(self, segy1):
+        with pytest.raises(ValueError):
+            segy2netcdf._select_traces(
+                segy1, None, select=[("FieldRecord", 1, 2, None)])
+
+
+class Test_sample_window:
+    def test_all(self, segy1):
+        assert segy2netcdf._sample_window(segy1) is None
+
+    def test_window(self, segy1):
+        window = segy2netcdf._sample_window(segy1, 1234.0, 6000.0, 2)
+        assert window == slice(1, 5, 2)
+        indexes = segy2netcdf._sample_indexes(segy1, window)
+        assert indexes.tolist() == [1234.0, 3702.0]
+
+    def test_empty(self, segy1):
+        with pytest.raises(ValueError):
+            segy2netcdf._sample_window(segy1, 100.0, 200.0)
+
+
+class Test_parse_range:
+    def test_parse(self):
+        assert segy2netcdf._parse_range("1:10") == (1, 10, None)
+        assert segy2netcdf._parse_range("::2") == (None, None, 2)
+
+    def test_bad(self):
+        with pytest.raises(click.BadParameter):
+            segy2netcdf._parse_range("1")
+
+
+class Test_segy2netcdf_subset:
+    @pytest.mark.parametrize("engine", segy2netcdf.ENGINES)
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_traces_and_samples(self, tmpdir, engine, workers):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                (("FieldRecord", 3), ("GroupX", 5)),
+                                max_memory=5 * 20 * 4, workers=workers,
+                                traces=(None, None, 2), tmin=1234.0,
+                                tmax=20000.0, sample_step=3, engine=engine)
+        rootgrp = Dataset(netcdf_path, "r")
+        samples = rootgrp["Samples"][:]
+        assert rootgrp["Time"][:].tolist() == [1234.0 * i
+                                               for i in range(1, 17, 3)]
+        assert rootgrp["FieldRecord"][:].tolist() == [777, 778, 779]
+        assert rootgrp["GroupX"][:].tolist() == [456789 + 2000 * i
+                                                 for i in range(5)]
+        rootgrp.close()
+        trace_ids = np.arange(0, 30, 2).reshape(3, 5, 1)
+        expected = trace_ids * 20 + np.arange(1, 17, 3) + 123.456
+        assert np.allclose(samples, expected, atol=1e-4)
+
+    def test_select(self, tmpdir):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(
+            "tests/testsegy1.segy", netcdf_path,
+            d=(("FieldRecord", 2), ("GroupX", 4)),
+            select=[("FieldRecord", 778, None, None),
+                    ("GroupX", 457789, 460789, None)], compact_headers=True
+        )
+        rootgrp = Dataset(netcdf_path, "r")
+        assert rootgrp["FieldRecord"][:].tolist() == [778, 779]
+        assert rootgrp["GroupX"][:].tolist() == [457789, 458789, 459789,
+                                                 460789]
+        assert rootgrp["Samples"].shape == (2, 4, 20)
+        samples = rootgrp["Samples"][:, :, 0]
+        rootgrp.close()
+        expected = [[11, 12, 13, 14], [21, 22, 23, 24]]
+        assert np.allclose(samples, np.array(expected) * 20 + 123.456)
+
+    @pytest.mark.parametrize("engine", segy2netcdf.ENGINES)
+    def test_infer_dims(self, tmpdir, segy_unsorted, engine):
+        path, grid = segy_unsorted
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(path, netcdf_path,
+                                infer_dims=["INLINE_3D", "CROSSLINE_3D"],
+                                select=[("INLINE_3D", 20, None, None),
+                                        ("CROSSLINE_3D", 1, 3, 2)],
+                                max_memory=5 * 4 * 2, engine=engine)
+        rootgrp = Dataset(netcdf_path, "r")
+        assert rootgrp["INLINE_3D"][:].tolist() == [20, 30]
+        assert rootgrp["CROSSLINE_3D"][:].tolist() == [1, 3]
+        samples = rootgrp["Samples"][:]
+        rootgrp.close()
+        for i, il in enumerate([20, 30]):
+            for j, xl in enumerate([1, 3]):
+                if (il, xl) in grid:
+                    assert np.all(samples[i, j] == il * 100 + xl)
+                else:
+                    assert np.all(samples.mask[i, j])
+
+    def test_cli(self, tmpdir):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        result = CliRunner().invoke(segy2netcdf.cli, [
+            "tests/testsegy1.segy", netcdf_path, "--traces", "10:",
+            "--select", "GroupX", ":459789", "--sample-step", "10"])
+        assert result.exit_code == 0, result.output
+        rootgrp = Dataset(netcdf_path, "r")
+        assert rootgrp["Samples"].shape == (8, 2)
+        assert rootgrp["TRACE_SEQUENCE_FILE"][:].tolist() == [
+            11, 12, 13, 14, 21, 22, 23, 24]
+        rootgrp.close()
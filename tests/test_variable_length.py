@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Tests for variable_length.
+"""
+
+from netCDF4 import Dataset, default_fillvals
+import numpy as np
+import pytest
+import segyio
+from netcdf_segy import segy2netcdf, variable_length
+
+
+def _lengths():
+    return [20 - (i % 5) * 3 for i in range(30)]
+
+
+@pytest.fixture
+def segy_variable(tmpdir):
+    """testsegy1.segy with trace i shortened to _lengths()[i] samples. The
+       TRACE_SAMPLE_COUNT header of the first trace is 0, so the binary
+       header's number of samples (20) is used for it."""
+    path = str(tmpdir.join("variable.segy"))
+    with open("tests/testsegy1.segy", "rb") as f:
+        data = f.read()
+    data_offset = 3600
+    trace_nbytes = 240 + 20 * 4
+    with open(path, "wb") as f:
+        f.write(data[:data_offset])
+        for i, length in enumerate(_lengths()):
+            trace = bytearray(data[data_offset + i * trace_nbytes:
+                                   data_offset + (i + 1) * trace_nbytes])
+            trace[114:116] = (0 if i == 0 else length).to_bytes(2, "big")
+            f.write(trace[:240 + length * 4])
+    return path
+
+
+@pytest.fixture
+def raw1():
+    with segyio.open("tests/testsegy1.segy", ignore_geometry=True) as segy:
+        return segy.trace.raw[:]
+
+
+class Test_read_file_headers:
+    def test_binary_header(self, tmpdir):
+        """Every field is read with the position and type segyio uses."""
+        path = str(tmpdir.join("bin.segy"))
+        with open("tests/testsegy1.segy", "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data)
+        keep = ["Samples", "Format", "ExtendedHeaders"]
+        values = {}
+        for name, pos in segyio.binfield.keys.items():
+            nbytes = np.dtype(variable_length.BINARY_HEADER_FORMATS.get(
+                name, "i2")).itemsize
+            if name.startswith("Unassigned") or name in keep:
+                continue
+            values[getattr(segyio.BinField, name)] = {
+                1: 200, 2: -(pos - 3200), 4: -(pos - 3200) * 100000}[nbytes]
+        values[segyio.BinField.SamplesOriginal] = 40000
+        with segyio.open(path, "r+", ignore_geometry=True) as segy:
+            segy.bin.update(values)
+        with open(path, "rb") as f:
+            file_headers = variable_length._read_file_headers(f)
+        with segyio.open(path, ignore_geometry=True) as segy:
+            assert file_headers["attributes"]["bin"] == str(segy.bin)
+            assert file_headers["samples"] == 20
+            assert file_headers["interval"] == segy.bin[
+                segyio.BinField.Interval]
+
+
+class Test_decode_text:
+    def test_segyio(self, tmpdir):
+        """Every byte is converted as segyio converts text headers."""
+        path = str(tmpdir.join("text.segy"))
+        with open("tests/testsegy1.segy", "rb") as f:
+            data = bytearray(f.read())
+        data[:256] = bytes(range(256))
+        with open(path, "wb") as f:
+            f.write(data)
+        with segyio.open(path, ignore_geometry=True) as segy:
+            expected = bytes(segy.text[0]).decode("latin-1")
+        assert variable_length._decode_text(bytes(data[:3200])) == expected
+
+
+class Test_convert:
+    def test_defaults(self, tmpdir, segy_variable):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        variable_length.convert(segy_variable, netcdf_path)
+        rootgrp = Dataset(netcdf_path, "r")
+        assert rootgrp["Samples"].shape == (30, 20)
+        assert rootgrp["Samples"].filters()["zlib"] is False
+        assert rootgrp[variable_length.TRACE_LENGTH_VARIABLE][:].tolist() \
+            == _lengths()
+        rootgrp.close()
+
+
+class Test_scan_traces:
+    def test_scan(self, segy_variable):
+        with open(segy_variable, "rb") as f:
+            file_headers = variable_length._read_file_headers(f)
+            offsets, lengths = variable_length._scan_traces(f, file_headers)
+        assert lengths.tolist() == _lengths()
+        assert offsets[0] == 3600
+        assert np.array_equal(np.diff(offsets),
+                              240 + np.array(_lengths()[:-1]) * 4)
+
+    def test_truncated(self, tmpdir, segy_variable):
+        path = str(tmpdir.join("truncated.segy"))
+        with open(segy_variable, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:-10])
+        with open(path, "rb") as f:
+            file_headers = variable_length._read_file_headers(f)
+            with pytest.raises(ValueError):
+                variable_length._scan_traces(f, file_headers)
+
+
+class Test_segy2netcdf_variable_length:
+    @pytest.mark.parametrize("max_memory", [None, 7 * 20 * 4])
+    def test_convert(self, tmpdir, segy_variable, raw1, max_memory):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf(segy_variable, netcdf_path, "Time",
+                                (("FieldRecord", 3), ("GroupX", 10)),
+                                max_memory=max_memory, variable_length=True,
+                                compress=True)
+        rootgrp = Dataset(netcdf_path, "r")
+        samples = rootgrp["Samples"][:].reshape(30, 20)
+        lengths = rootgrp[variable_length.TRACE_LENGTH_VARIABLE][:]
+        assert lengths.ravel().tolist() == _lengths()
+        assert rootgrp["FieldRecord"][:].tolist() == [777, 778, 779]
+        assert rootgrp["GroupX"][:].tolist() == [456789 + 1000 * i
+                                                 for i in range(10)]
+        assert rootgrp["Time"][:].tolist() == [1234.0 * i
+                                               for i in range(20)]
+        sequence = rootgrp["TRACE_SEQUENCE_FILE"][:]
+        fixed_path = str(tmpdir.join("fixed.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", fixed_path)
+        fixed = Dataset(fixed_path, "r")
+        for name in ["bin", "text"]:
+            assert rootgrp.getncattr(name) == fixed.getncattr(name)
+        fixed.close()
+        rootgrp.close()
+        assert sequence.ravel().tolist() == list(range(1, 31))
+        for i, length in enumerate(_lengths()):
+            assert np.array_equal(samples[i, :length], raw1[i, :length])
+            assert np.all(samples.mask[i, length:])
+            assert not np.any(samples.mask[i, :length])
+
+    def test_zarr(self, tmpdir, segy_variable, raw1):
+        pytest.importorskip("zarr")
+        netcdf_path = str(tmpdir.join("tmp.zarr"))
+        segy2netcdf.segy2netcdf(segy_variable, netcdf_path,
+                                variable_length=True, output_format="zarr")
+        from netcdf_segy.zarr_output import ZarrDataset
+        store = ZarrDataset(netcdf_path)
+        samples = store["Samples"][:]
+        assert store[variable_length.TRACE_LENGTH_VARIABLE][:].tolist() == \
+            _lengths()
+        assert np.array_equal(samples[6, :17], raw1[6, :17])
+        assert np.all(samples[6, 17:] == np.float32(default_fillvals["f4"]))
+
+    def test_unsupported(self, tmpdir, segy_variable):
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf(segy_variable,
+                                    str(tmpdir.join("tmp.nc")),
+                                    variable_length=True, workers=2)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""Tests for verify.
+"""
+
+import shutil
+from netCDF4 import Dataset
+import numpy as np
+import pytest
+import segyio
+from netcdf_segy import segy2netcdf, verify
+
+
+@pytest.fixture
+def d1():
+    return (("FieldRecord", 3), ("GroupX", 10))
+
+
+class Test_verify_netcdf:
+    @pytest.mark.parametrize("workers", [1, 2])
+    @pytest.mark.parametrize("engine", segy2netcdf.ENGINES)
+    def test_matches(self, tmpdir, d1, workers, engine):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d1, compact_headers=True, engine=engine)
+        result = verify.verify_netcdf("tests/testsegy1.segy", netcdf_path,
+                                      "Time", max_memory=7 * 20 * 4,
+                                      workers=workers)
+        assert result["mismatches"] == []
+        # Each of the workers holds a quarter of max_memory
+        assert result["blocks"] == (6 if workers == 1 else 30)
+        assert len(result["digest"]) == 64
+
+    def test_digest(self, tmpdir, d1):
+        digests = []
+        for max_memory, workers in [(10 * 20 * 4, 1), (None, 1), (None, 2)]:
+            netcdf_path = str(tmpdir.join("tmp{}.nc".format(len(digests))))
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                    d=d1)
+            result = verify.verify_netcdf("tests/testsegy1.segy",
+                                          netcdf_path,
+                                          max_memory=max_memory,
+                                          workers=workers,
+                                          write_digest=True)
+            digests.append(result["digest"])
+            rootgrp = Dataset(netcdf_path, "r")
+            assert rootgrp.getncattr(verify.DIGEST_ATTRIBUTE) == digests[-1]
+            rootgrp.close()
+        # The digest does not depend on how the traces were split
+        assert digests[0] == digests[1] == digests[2]
+
+    def test_digest_order(self, tmpdir, d1):
+        """Swapping two traces changes the digest."""
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, d=d1)
+        digest = verify.verify_netcdf("tests/testsegy1.segy",
+                                      netcdf_path)["digest"]
+        rootgrp = Dataset(netcdf_path, "a")
+        for v in rootgrp.variables.values():
+            if v.dimensions[:2] == ("FieldRecord", "GroupX"):
+                v[0, 1], v[0, 2] = v[0, 2], v[0, 1]
+        rootgrp.close()
+        result = verify.verify_netcdf("tests/testsegy1.segy", netcdf_path)
+        assert result["mismatches"]
+        assert result["digest"] != digest
+
+    def test_mismatch(self, tmpdir, d1):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, d=d1)
+        rootgrp = Dataset(netcdf_path, "a")
+        rootgrp["Samples"][1, 2, 3] = 0.0
+        rootgrp["CDP"][2, 4] = 5
+        rootgrp.close()
+        result = verify.verify_netcdf("tests/testsegy1.segy", netcdf_path,
+                                      max_memory=10 * 20 * 4,
+                                      write_digest=True)
+        assert result["mismatches"] == [
+            "Samples differs in 1 values in traces 10 to 19",
+            "CDP differs in 1 values in traces 20 to 29"]
+        rootgrp = Dataset(netcdf_path, "r")
+        assert verify.DIGEST_ATTRIBUTE not in rootgrp.ncattrs()
+        rootgrp.close()
+
+    def test_narrowed_header(self, tmpdir, d1, monkeypatch):
+        """Header values that wrapped around when stored do not match."""
+        compact_header_dtypes = segy2netcdf._compact_header_dtypes
+
+        def narrow(stats, fill_missing=False):
+            header_dtypes, header_constants = compact_header_dtypes(
+                stats, fill_missing)
+            header_dtypes["GroupX"] = "i2"
+            return header_dtypes, header_constants
+
+        monkeypatch.setattr(segy2netcdf, "_compact_header_dtypes", narrow)
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                d=(("Traces", 30),), compact_headers=True)
+        result = verify.verify_netcdf("tests/testsegy1.segy", netcdf_path)
+        assert result["mismatches"] == [
+            "GroupX differs in 30 values in traces 0 to 29"]
+
+    def test_changed_sample(self, tmpdir, d1):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, d=d1)
+        rootgrp = Dataset(netcdf_path, "a")
+        rootgrp["Samples"][1, 2, 3] = np.nextafter(
+            rootgrp["Samples"][1, 2, 3], np.float32(np.inf))
+        rootgrp.close()
+        result = verify.verify_netcdf("tests/testsegy1.segy", netcdf_path)
+        assert result["mismatches"] == [
+            "Samples differs in 1 values in traces 0 to 29"]
+
+    @pytest.mark.filterwarnings("ignore:overflow encountered")
+    def test_f2_overflow(self, tmpdir, d1):
+        """f2 trace data only matches within the rounding of f2."""
+        pytest.importorskip("zarr")
+        segy_path = str(tmpdir.join("large.segy"))
+        shutil.copy("tests/testsegy1.segy", segy_path)
+        with segyio.open(segy_path, "r+", ignore_geometry=True) as segy:
+            trace = segy.trace[4]
+            trace[7] = 1e6
+            segy.trace[4] = trace
+        netcdf_path = str(tmpdir.join("tmp.zarr"))
+        segy2netcdf.segy2netcdf(segy_path, netcdf_path, d=d1,
+                                output_format="zarr", sample_dtype="f2")
+        result = verify.verify_netcdf(segy_path, netcdf_path)
+        assert result["mismatches"] == [
+            "Samples differs in 1 values in traces 0 to 29"]
+
+    def test_wrong_layout(self, tmpdir):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path,
+                                traces=(0, 20, None))
+        result = verify.verify_netcdf("tests/testsegy1.segy", netcdf_path)
+        assert result["mismatches"] == ["there are 20 traces, not 30"]
+        result = verify.verify_netcdf("tests/testsegy1.segy", netcdf_path,
+                                      traces=(0, 20, None))
+        assert result["mismatches"] == []
+
+    def test_subset(self, tmpdir, segy_unsorted):
+        path, grid = segy_unsorted
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        options = dict(infer_dims=["INLINE_3D", "CROSSLINE_3D"],
+                       select=[("CROSSLINE_3D", 2, None, None)], tmin=1.0,
+                       sample_step=2)
+        segy2netcdf.segy2netcdf(path, netcdf_path, sample_dtype="i2",
+                                **options)
+        result = verify.verify_netcdf(path, netcdf_path,
+                                      max_memory=3 * 4 * 2, **options)
+        assert result["mismatches"] == []
+
+    def test_quantized(self, tmpdir, d1):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, d=d1,
+                                least_significant_digit=1)
+        result = verify.verify_netcdf("tests/testsegy1.segy", netcdf_path)
+        assert result["mismatches"] == []
+
+    def test_zarr(self, tmpdir, d1):
+        pytest.importorskip("zarr")
+        netcdf_path = str(tmpdir.join("tmp.zarr"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, d=d1,
+                                output_format="zarr", sample_dtype="f2")
+        result = verify.verify_netcdf("tests/testsegy1.segy", netcdf_path,
+                                      write_digest=True)
+        assert result["mismatches"] == []
+
+
+class Test_segy2netcdf_verify:
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_verify(self, tmpdir, d1, workers):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, d=d1,
+                                workers=workers, verify=True)
+        rootgrp = Dataset(netcdf_path, "r")
+        digest = rootgrp.getncattr(verify.DIGEST_ATTRIBUTE)
+        rootgrp.close()
+        result = verify.verify_netcdf("tests/testsegy1.segy", netcdf_path)
+        assert result["digest"] == digest
+
+    @pytest.mark.parametrize("engine", segy2netcdf.ENGINES)
+    def test_read_error(self, tmpdir, d1, engine, monkeypatch):
+        """A mistake in reading the traces for the conversion is found."""
+        read_block = segy2netcdf._read_block
+
+        def negate(*args, **kwargs):
+            samples, headers = read_block(*args, **kwargs)
+            if samples is not None:
+                samples = -samples
+            return samples, headers
+
+        monkeypatch.setattr(segy2netcdf, "_read_block", negate)
+        with pytest.raises(ValueError, match="Samples differs"):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy",
+                                    str(tmpdir.join("tmp.nc")), d=d1,
+                                    engine=engine, verify=True)
+
+    def test_append(self, tmpdir):
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy",
+                                    str(tmpdir.join("tmp.nc")), append=True,
+                                    verify=True)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Tests for zarr_output.
+"""
+
+from netCDF4 import Dataset
+import numpy as np
+import pytest
+from netcdf_segy import segy2netcdf, zarr_output
+
+pytest.importorskip("zarr")
+
+
+@pytest.fixture
+def d1():
+    return (("FieldRecord", 3), ("GroupX", 10))
+
+
+def check_same(netcdf_path, zarr_path):
+    """Check that a Zarr store has the variables and attributes of a NetCDF
+       file.
+    """
+    rootgrp = Dataset(netcdf_path, "r")
+    store = zarr_output.ZarrDataset(zarr_path)
+    assert set(store.variables) == set(rootgrp.variables)
+    for name in rootgrp.variables:
+        assert store[name].dimensions == rootgrp[name].dimensions
+        assert np.array_equal(store[name][:],
+                              np.ma.filled(rootgrp[name][:],
+                                           store[name]._array.fill_value))
+    assert set(store.ncattrs()) == set(rootgrp.ncattrs())
+    for name in rootgrp.ncattrs():
+        assert store.getncattr(name) == rootgrp.getncattr(name)
+    rootgrp.close()
+
+
+class Test_segy2netcdf_zarr:
+    @pytest.mark.parametrize("workers", [1, 2])
+    @pytest.mark.parametrize("compress", [False, True])
+    def test_same_as_netcdf(self, tmpdir, d1, workers, compress):
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        zarr_path = str(tmpdir.join("tmp.zarr"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d1, compress)
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", zarr_path, "Time",
+                                d1, compress, max_memory=10 * 20 * 4,
+                                workers=workers, chunking=(1, 5, 20),
+                                output_format="zarr")
+        check_same(netcdf_path, zarr_path)
+        store = zarr_output.ZarrDataset(zarr_path)
+        assert store["Samples"].chunks == (1, 5, 20)
+
+    def test_infer_dims(self, tmpdir, segy_unsorted):
+        path, _ = segy_unsorted
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        zarr_path = str(tmpdir.join("tmp.zarr"))
+        infer_dims = ["INLINE_3D", "CROSSLINE_3D"]
+        segy2netcdf.segy2netcdf(path, netcdf_path, infer_dims=infer_dims)
+        segy2netcdf.segy2netcdf(path, zarr_path, infer_dims=infer_dims,
+                                max_memory=5 * 4 * 3, workers=2,
+                                output_format="zarr")
+        check_same(netcdf_path, zarr_path)
+
+    def test_xarray(self, tmpdir, d1):
+        xr = pytest.importorskip("xarray")
+        zarr_path = str(tmpdir.join("tmp.zarr"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", zarr_path, "Time",
+                                d1, output_format="zarr")
+        ds = xr.open_zarr(zarr_path)
+        assert ds["Samples"].dims == ("FieldRecord", "GroupX", "Time")
+        assert "bin" in ds.attrs
+        ds.close()
+
+    def test_unsupported(self, tmpdir):
+        zarr_path = str(tmpdir.join("tmp.zarr"))
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy", zarr_path,
+                                    append=True, output_format="zarr")
+        with pytest.raises(ValueError):
+            segy2netcdf.segy2netcdf("tests/testsegy1.segy", zarr_path,
+                                    compression="bzip2",
+                                    output_format="zarr")
+
+
+class Test_blocks_aligned:
+    def test_aligned(self):
+        blocks = list(segy2netcdf._trace_blocks([6, 10], 80, 80 * 25,
+                                                (2, 10)))
+        assert [b[3] for b in blocks] == [(2, 10)] * 3
+        assert segy2netcdf._blocks_aligned(blocks, (2, 10), [6, 10])
+
+    def test_not_aligned(self):
+        blocks = list(segy2netcdf._trace_blocks([6, 10], 80, 80 * 35))
+        assert not segy2netcdf._blocks_aligned(blocks, (2, 10), [6, 10])
+        blocks = list(segy2netcdf._trace_blocks([6, 10], 80, 80 * 5))
+        assert not segy2netcdf._blocks_aligned(blocks, (2, 10), [6, 10])
+        assert segy2netcdf._blocks_aligned(blocks, (1, 5), [6, 10])
+
+
+class Test_segy2netcdf_zarr_sample_dtype:
+    @pytest.mark.parametrize("workers", [1, 2])
+    @pytest.mark.parametrize("sample_dtype", ["f2", "i2"])
+    def test_sample_dtype(self, tmpdir, d1, workers, sample_dtype):
+        xr = pytest.importorskip("xarray")
+        netcdf_path = str(tmpdir.join("tmp.nc"))
+        zarr_path = str(tmpdir.join("tmp.zarr"))
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", netcdf_path, "Time",
+                                d1)
+        segy2netcdf.segy2netcdf("tests/testsegy1.segy", zarr_path, "Time",
+                                d1, max_memory=10 * 20 * 4, workers=workers,
+                                sample_dtype=sample_dtype,
+                                output_format="zarr")
+        store = zarr_output.ZarrDataset(zarr_path)
+        assert store["Samples"].dtype == np.dtype(sample_dtype)
+        rootgrp = Dataset(netcdf_path, "r")
+        expected = rootgrp["Samples"][:]
+        rootgrp.close()
+        ds = xr.open_zarr(zarr_path)
+        assert np.allclose(ds["Samples"].values, expected, rtol=1e-3,
+                           atol=np.abs(expected).max() * 1e-4)
+        ds.close()